@@ -1,5 +1,5 @@
-from fastapi import APIRouter, responses
-from typing import Union
+from fastapi import APIRouter, Response, Query, responses
+from typing import Union, Optional
 
 from ..crud import crud_assembly as crud 
 from ..schemas import schemas_assembly as schemas
@@ -7,15 +7,37 @@ from ..schemas import schemas_assembly as schemas
 router = APIRouter(default_response_class=responses.ORJSONResponse)
 
 @router.post("/building_block/has_synthon", response_model=list[schemas.HasSynthonResponse])
-async def compute_synthons_api(eval_request: schemas.HasSynthonRequest):
-    results = await crud.has_synthon(eval_request)
+async def compute_synthons_api(eval_request: schemas.HasSynthonRequest, response: Response):
+    results, n_unique = await crud.has_synthon(eval_request)
+    response.headers['X-Unique-Inputs'] = str(n_unique)
     return results 
 
 @router.post("/building_block/compute_synthons", response_model=list[schemas.ComputeSynthonResponse])
-async def compute_synthons_api(eval_request: schemas.ComputeSynthonRequest):
-    results = await crud.compute_synthons(eval_request)
+async def compute_synthons_api(eval_request: schemas.ComputeSynthonRequest, response: Response):
+    results, n_unique = await crud.compute_synthons(eval_request)
+    response.headers['X-Unique-Inputs'] = str(n_unique)
     return results 
 
+@router.post('/building_block/libraries', response_model=schemas.LibraryInfo)
+async def register_library_api(library_request: schemas.CreateLibraryRequest):
+    return await crud.register_library(library_request)
+
+@router.post('/building_block/libraries/load', response_model=schemas.LibraryInfo)
+async def load_library_api(load_request: schemas.LoadLibraryRequest):
+    return await crud.load_library(load_request)
+
+@router.get('/building_block/libraries', response_model=list[schemas.LibraryInfo])
+def scroll_libraries_api(skip: int=0, limit: int=100):
+    return crud.scroll_libraries(skip, limit)
+
+@router.get('/building_block/libraries/{library_id}', response_model=schemas.LibraryInfo)
+def get_library_api(library_id: str):
+    return crud.get_library(library_id)
+
+@router.delete('/building_block/libraries/{library_id}')
+def delete_library_api(library_id: str):
+    return crud.delete_library(library_id)
+
 @router.get('/building_block/description')
 def bb_description_api():
     return crud.bb_description()
@@ -25,26 +47,87 @@ def get_rxn_mechanisms_api():
     return crud.get_rxn_mechanisms()
 
 @router.post('/building_block/2bb_assembly', response_model=list[dict])
-async def assemble_2bbs_api(assembly_inputs: schemas.TwoBBAseemblyRequest):
-    results = await crud.assemble_2bbs(assembly_inputs)
+async def assemble_2bbs_api(assembly_inputs: schemas.TwoBBAseemblyRequest, response: Response,
+                            batch_size: Optional[int]=Query(None, ge=1), 
+                            max_combinations: Optional[int]=Query(None, ge=1), 
+                            max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                            sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    '''
+    Assembly routes enumerate combinations in batches of `batch_size` and stop after the batch
+    that reaches `max_combinations` attempted combinations or `max_products` products. If 
+    enumeration stopped early, the `X-Assembly-Cursor` header holds a cursor that continues 
+    the same request from where it stopped when passed as `cursor`. `sort=false` returns
+    products in enumeration order instead of sorting them. `sample` draws reaction compatible
+    combinations of the final node in a random order set by `seed` and returns up to `sample`
+    products, with the number of combinations sampled from (`X-Combination-Space`) and the
+    fraction of draws that gave products (`X-Product-Yield`)
+    '''
+    results, headers = await crud.assemble_2bbs(assembly_inputs,
+                                                batch_size=batch_size, max_combinations=max_combinations,
+                                                max_products=max_products, cursor=cursor, sort=sort,
+                                                sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
 @router.post('/building_block/3bb_assembly', response_model=list[dict])
-async def assemble_2bbs_api(assembly_inputs: schemas.ThreeBBAseemblyRequest):
-    results = await crud.assemble_3bbs(assembly_inputs)
+async def assemble_2bbs_api(assembly_inputs: schemas.ThreeBBAseemblyRequest, response: Response,
+                            batch_size: Optional[int]=Query(None, ge=1), 
+                            max_combinations: Optional[int]=Query(None, ge=1), 
+                            max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                            sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.assemble_3bbs(assembly_inputs,
+                                                batch_size=batch_size, max_combinations=max_combinations,
+                                                max_products=max_products, cursor=cursor, sort=sort,
+                                                sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
 @router.post('/building_block/custom_assembly', response_model=list[dict])
-async def assemble_bb_custom_api(assembly_inputs: schemas.CustomAssemblySchema):
-    results = await crud.assemble_custom(assembly_inputs, 'synthon')
+async def assemble_bb_custom_api(assembly_inputs: schemas.CustomAssemblySchema, response: Response,
+                                 batch_size: Optional[int]=Query(None, ge=1), 
+                                 max_combinations: Optional[int]=Query(None, ge=1), 
+                                 max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                                 sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.assemble_custom(assembly_inputs, 'synthon',
+                                                  batch_size=batch_size, max_combinations=max_combinations,
+                                                  max_products=max_products, cursor=cursor, sort=sort,
+                                                  sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
+@router.post('/building_block/2bb_assembly_stream')
+async def assemble_2bbs_stream_api(assembly_inputs: schemas.TwoBBAseemblyRequest, batch_size: Optional[int]=Query(None, ge=1)):
+    '''
+    Newline-delimited JSON version of `/building_block/2bb_assembly`. Products are sent as each
+    batch of `batch_size` combinations is enumerated, deduplicated but not sorted
+    '''
+    return crud.assemble_2bbs_stream(assembly_inputs, batch_size)
+
+@router.post('/building_block/3bb_assembly_stream')
+async def assemble_3bbs_stream_api(assembly_inputs: schemas.ThreeBBAseemblyRequest, batch_size: Optional[int]=Query(None, ge=1)):
+    return crud.assemble_3bbs_stream(assembly_inputs, batch_size)
+
+@router.post('/building_block/custom_assembly_stream')
+async def assemble_bb_custom_stream_api(assembly_inputs: schemas.CustomAssemblySchema, batch_size: Optional[int]=Query(None, ge=1)):
+    return crud.assemble_custom_stream(assembly_inputs, 'synthon', batch_size)
+
 @router.get('/fragment/description')
 def frag_description_api():
     return crud.frag_description()
 
 @router.post('/fragment/custom_assembly', response_model=list[dict])
-async def assemble_frag_custom_api(assembly_inputs: schemas.CustomAssemblySchema):
-    results = await crud.assemble_custom(assembly_inputs, 'fragment')
+async def assemble_frag_custom_api(assembly_inputs: schemas.CustomAssemblySchema, response: Response,
+                                   batch_size: Optional[int]=Query(None, ge=1), 
+                                   max_combinations: Optional[int]=Query(None, ge=1), 
+                                   max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                                   sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.assemble_custom(assembly_inputs, 'fragment',
+                                                  batch_size=batch_size, max_combinations=max_combinations,
+                                                  max_products=max_products, cursor=cursor, sort=sort,
+                                                  sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
+@router.post('/fragment/custom_assembly_stream')
+async def assemble_frag_custom_stream_api(assembly_inputs: schemas.CustomAssemblySchema, batch_size: Optional[int]=Query(None, ge=1)):
+    return crud.assemble_custom_stream(assembly_inputs, 'fragment', batch_size)
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, responses
+
+from ..crud import crud_diagnostics as crud 
+
+router = APIRouter(default_response_class=responses.ORJSONResponse)
+
+@router.get("/diagnostics/template_cache")
+def get_template_cache_stats_api():
+    return crud.get_template_cache_stats()
+
+@router.get("/diagnostics/filter_stats")
+def get_filter_stats_api():
+    return crud.get_filter_stats()
+
+@router.get("/diagnostics/result_cache")
+def get_result_cache_stats_api():
+    return crud.get_result_cache_stats()
+
+@router.get("/diagnostics/synthon_cache")
+def get_synthon_cache_stats_api():
+    return crud.get_synthon_cache_stats()
+
+@router.get("/diagnostics/assembly_cache")
+def get_assembly_cache_stats_api():
+    return crud.get_assembly_cache_stats()
+
+@router.get("/diagnostics/startup")
+def get_startup_stats_api():
+    return crud.get_startup_stats()
+
+@router.get("/diagnostics/executor")
+def get_executor_stats_api():
+    return crud.get_executor_stats()
+
+@router.get("/diagnostics/profiles")
+def get_profiles_api():
+    return crud.get_profiles()
+
+@router.get("/diagnostics/profiles/{profile_id}")
+def get_profile_api(profile_id: str, limit: int=30):
+    return crud.get_profile(profile_id, limit)
+
+@router.get("/metrics", response_class=responses.PlainTextResponse)
+def get_metrics_api():
+    # Prometheus text exposition format
+    return responses.PlainTextResponse(crud.get_metrics(), media_type='text/plain; version=0.0.4')
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, responses
+from fastapi import APIRouter, Request, Response, Query, responses
+from typing import Optional
 
 from ..crud import crud_functional as crud 
 from ..schemas import schemas_functional as schemas
@@ -18,7 +19,36 @@ def strip_template_api(template_config: schemas.TemplateConfig):
     return crud.strip_template_crud(template_config)
 
 @router.post("/eval_template_functional", response_model=list[schemas.TemplateEvalResponse])
-async def eval_template_functional_api(eval_request: schemas.TemplateEvalRequestFunctional, return_data: bool=True):
-    results = await crud.eval_template_functional(eval_request, return_data)
+async def eval_template_functional_api(eval_request: schemas.TemplateEvalRequestFunctional, response: Response, 
+                                       return_data: bool=True, format: schemas.ResultFormat=schemas.ResultFormat.rows,
+                                       limit: Optional[int]=Query(None, ge=1), 
+                                       sample_size: Optional[int]=Query(None, ge=1), seed: int=0):
+    '''
+    `format=rows` returns one record per input. `indices`, `bitset` and `columnar` return a 
+    single compact object and skip response validation.
+
+    `limit` returns only the first `limit` passing inputs and stops evaluating once they are 
+    found. `sample_size` evaluates a `seed`ed random sample of the inputs and returns the 
+    pass rate in the `X-Pass-Rate` header
+    '''
+    results, headers = await crud.eval_template_functional(eval_request, return_data, format, 
+                                                           limit, sample_size, seed)
+    if format != schemas.ResultFormat.rows:
+        return responses.ORJSONResponse(results, headers=headers)
+
+    response.headers.update(headers)
     return results
 
+@router.post("/eval_template_functional_stream")
+async def eval_template_functional_stream_api(request: Request, return_data: bool=True):
+    '''
+    Newline-delimited JSON version of `/eval_template_functional`. The first line of the 
+    request body is `{"template_config": {...}}`, each following line is one input SMILES. 
+    Results are streamed back one JSON record per line as each chunk of inputs is evaluated
+    '''
+    return await crud.eval_template_functional_stream(request, return_data)
+
+@router.post("/eval_templates_functional", response_model=list[schemas.MultiTemplateEvalResponse])
+async def eval_templates_functional_api(eval_request: schemas.MultiTemplateEvalRequestFunctional, return_data: bool=True):
+    results = await crud.eval_templates_functional(eval_request, return_data)
+    return results
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Query, Response, responses
+
+from ..crud import crud_jobs as crud 
+from ..schemas import schemas_jobs as schemas
+
+router = APIRouter(default_response_class=responses.ORJSONResponse)
+
+@router.post("/jobs/eval_template", response_model=schemas.JobStatus)
+def submit_eval_job_api(eval_request: schemas.EvalJobRequest):
+    return crud.submit_eval_job(eval_request)
+
+@router.post("/jobs/building_block/2bb_assembly", response_model=schemas.JobStatus)
+def submit_2bb_job_api(assembly_inputs: schemas.TwoBBAseemblyRequest):
+    return crud.submit_assembly_job(assembly_inputs, '2bb_assembly')
+
+@router.post("/jobs/building_block/3bb_assembly", response_model=schemas.JobStatus)
+def submit_3bb_job_api(assembly_inputs: schemas.ThreeBBAseemblyRequest):
+    return crud.submit_assembly_job(assembly_inputs, '3bb_assembly')
+
+@router.post("/jobs/building_block/custom_assembly", response_model=schemas.JobStatus)
+def submit_bb_custom_job_api(assembly_inputs: schemas.CustomAssemblySchema):
+    return crud.submit_assembly_job(assembly_inputs, 'synthon_custom_assembly')
+
+@router.post("/jobs/fragment/custom_assembly", response_model=schemas.JobStatus)
+def submit_frag_custom_job_api(assembly_inputs: schemas.CustomAssemblySchema):
+    return crud.submit_assembly_job(assembly_inputs, 'fragment_custom_assembly')
+
+@router.get("/jobs", response_model=list[schemas.JobStatus])
+def scroll_jobs_api(skip: int=0, limit: int=100):
+    return crud.scroll_jobs(skip, limit)
+
+@router.get("/jobs/{job_id}", response_model=schemas.JobStatus)
+def get_job_api(job_id: str):
+    return crud.get_job(job_id)
+
+@router.get("/jobs/{job_id}/results")
+def get_job_results_api(job_id: str, skip: int=Query(0, ge=0), limit: int=Query(1000, ge=1, le=100000)):
+    '''
+    a page of results of a finished job, `{"job_id", "n_results", "skip", "limit", "results"}`. 
+    Eval jobs return `/eval_template_functional` records and assembly jobs return assembly products
+    '''
+    return Response(crud.get_job_results(job_id, skip, limit), media_type='application/json')
+
+@router.post("/jobs/{job_id}/cancel", response_model=schemas.JobStatus)
+def cancel_job_api(job_id: str):
+    return crud.cancel_job(job_id)
+
+@router.delete("/jobs/{job_id}")
+def delete_job_api(job_id: str):
+    return crud.delete_job(job_id)
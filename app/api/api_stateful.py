@@ -1,4 +1,5 @@
-from fastapi import APIRouter, responses
+from fastapi import APIRouter, Response, Query, responses
+from typing import Optional
 
 from ..crud import crud_stateful as crud 
 from ..schemas import schemas_stateful as schemas
@@ -37,8 +38,21 @@ async def delete_template_api(template_id: str):
     return result
 
 @router.post("/eval_template_stateful/{template_id}", response_model=list[schemas.TemplateEvalResponse])
-async def eval_template_stateful_api(template_id: str, eval_request: schemas.EvalRequestStateful, return_data: bool=True):
-    results = await crud.eval_template_stateful(template_id, eval_request, return_data)
+async def eval_template_stateful_api(template_id: str, eval_request: schemas.EvalRequestStateful, response: Response, 
+                                     return_data: bool=True, format: schemas.ResultFormat=schemas.ResultFormat.rows,
+                                     limit: Optional[int]=Query(None, ge=1), 
+                                     sample_size: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.eval_template_stateful(template_id, eval_request, return_data, format, 
+                                                         limit, sample_size, seed)
+    if format != schemas.ResultFormat.rows:
+        return responses.ORJSONResponse(results, headers=headers)
+
+    response.headers.update(headers)
+    return results
+
+@router.post("/eval_templates_stateful", response_model=list[schemas.MultiTemplateEvalResponse])
+async def eval_templates_stateful_api(eval_request: schemas.MultiTemplateEvalRequestStateful, return_data: bool=True):
+    results = await crud.eval_templates_stateful(eval_request, return_data)
     return results
 
 
@@ -70,23 +84,55 @@ async def delete_assembly_schema_api(assembly_schema_id: str):
     return result
 
 @router.post("/building_block/2bb_assembly_stateful", response_model=list[dict])
-async def assemble_2bbs_stateful_api(assembly_inputs: schemas.TwoBBAseemblyRequestStateful):
-    results = await crud.assemble_2bbs_stateful(assembly_inputs)
+async def assemble_2bbs_stateful_api(assembly_inputs: schemas.TwoBBAseemblyRequestStateful, response: Response,
+                                     batch_size: Optional[int]=Query(None, ge=1), 
+                                     max_combinations: Optional[int]=Query(None, ge=1), 
+                                     max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                                     sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.assemble_2bbs_stateful(assembly_inputs,
+                                                         batch_size=batch_size, max_combinations=max_combinations,
+                                                         max_products=max_products, cursor=cursor, sort=sort,
+                                                         sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
 @router.post("/building_block/3bb_assembly_stateful", response_model=list[dict])
-async def assemble_3bbs_stateful_api(assembly_inputs: schemas.ThreeBBAseemblyRequestStateful):
-    results = await crud.assemble_3bbs_stateful(assembly_inputs)
+async def assemble_3bbs_stateful_api(assembly_inputs: schemas.ThreeBBAseemblyRequestStateful, response: Response,
+                                     batch_size: Optional[int]=Query(None, ge=1), 
+                                     max_combinations: Optional[int]=Query(None, ge=1), 
+                                     max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                                     sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.assemble_3bbs_stateful(assembly_inputs,
+                                                         batch_size=batch_size, max_combinations=max_combinations,
+                                                         max_products=max_products, cursor=cursor, sort=sort,
+                                                         sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
 @router.post('/building_block/custom_assembly_stateful', response_model=list[dict])
-async def assemble_bb_custom_stateful_api(assembly_inputs: schemas.CustomAssemblySchemaStateful):
-    results = await crud.assemble_custom_stateful(assembly_inputs, 'synthon')
+async def assemble_bb_custom_stateful_api(assembly_inputs: schemas.CustomAssemblySchemaStateful, response: Response,
+                                          batch_size: Optional[int]=Query(None, ge=1), 
+                                          max_combinations: Optional[int]=Query(None, ge=1), 
+                                          max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                                          sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.assemble_custom_stateful(assembly_inputs, 'synthon',
+                                                           batch_size=batch_size, max_combinations=max_combinations,
+                                                           max_products=max_products, cursor=cursor, sort=sort,
+                                                           sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
 @router.post('/fragment/custom_assembly_stateful', response_model=list[dict])
-async def assemble_frag_custom_stateful_api(assembly_inputs: schemas.CustomAssemblySchemaStateful):
-    results = await crud.assemble_custom_stateful(assembly_inputs, 'fragment')
+async def assemble_frag_custom_stateful_api(assembly_inputs: schemas.CustomAssemblySchemaStateful, response: Response,
+                                            batch_size: Optional[int]=Query(None, ge=1), 
+                                            max_combinations: Optional[int]=Query(None, ge=1), 
+                                            max_products: Optional[int]=Query(None, ge=1), cursor: Optional[str]=None,
+                                            sort: bool=True, sample: Optional[int]=Query(None, ge=1), seed: int=0):
+    results, headers = await crud.assemble_custom_stateful(assembly_inputs, 'fragment',
+                                                           batch_size=batch_size, max_combinations=max_combinations,
+                                                           max_products=max_products, cursor=cursor, sort=sort,
+                                                           sample=sample, seed=seed)
+    response.headers.update(headers)
     return results
 
 
@@ -0,0 +1,105 @@
+import random
+from rdkit import Chem, RDLogger
+
+# synthetic corpora are built from ring scaffolds, substituents and reactive groups. The
+# scaffold has one `{R}` substituent branch and one `{G}` reactive group position
+SCAFFOLDS = [
+    'c1ccc{R}cc1{G}',
+    'c1cc{R}ncc1{G}',
+    'c1cc{R}sc1{G}',
+    'c1cnn{R}c1{G}',
+    'C1CC{R}CCC1{G}',
+    'C1CN{R}CC1{G}',
+    'C1CC2CC{R}C2C1{G}',
+    'c1ccc2cc{R}ccc2c1{G}',
+]
+
+SUBSTITUENTS = ['', 'C', 'CC', 'OC', 'F', 'Cl', 'Br', 'C(F)(F)F', 'N(C)C', 'C#N',
+                'C(=O)OC', 'S(C)(=O)=O', 'OC(F)(F)F', 'C1CC1', 'c1ccccc1']
+
+# reactive groups by building block class
+REACTIVE_GROUPS = {
+    'amine' : ['N', 'CN', 'CCN', 'NC'],
+    'acid' : ['C(=O)O', 'CC(=O)O'],
+    'isocyanate' : ['N=C=O'],
+    'aldehyde' : ['C=O', 'CC=O'],
+    'sulfonyl_chloride' : ['S(=O)(=O)Cl'],
+    'alcohol' : ['O', 'CO'],
+    'amino_ester' : ['C(N)C(=O)OC', 'CC(N)C(=O)OCC', 'C(CN)C(=O)O'],
+}
+
+# fragment corpora for fragment assembly. `{R}` is a substituent, `[*:n]` an attachment point
+FRAGMENT_R_GROUPS = ['c1ccc{R}cc1C[*]', 'c1cc{R}ncc1[*]', 'C1CC{R}CCC1[*]', 'c1cc{R}sc1C[*]']
+FRAGMENT_LINKERS = ['O=C(NC[*])[*]', '[*]CC[*]', '[*]OCC[*]', 'O=C([*])N[*]', '[*]C(=O)N1CCN([*])CC1']
+FRAGMENT_SCAFFOLDS = ['CC(=O)c1ccc(NC(=O)C[*])cc1', 'c1ccc2c(c1)ncn2[*]', 'O=C1CCC(=O)N1[*]', 'Cc1nc([*])sc1C']
+
+def valid_unique(smiles):
+    RDLogger.DisableLog('rdApp.*')
+    outputs = []
+    seen = set()
+    for smile in smiles:
+        mol = Chem.MolFromSmiles(smile)
+        if mol is None:
+            continue
+        canonical = Chem.MolToSmiles(mol)
+        if canonical not in seen:
+            seen.add(canonical)
+            outputs.append(smile)
+    return outputs
+
+def fill(template, rng):
+    substituent = rng.choice(SUBSTITUENTS)
+    return template.replace('{R}', f'({substituent})' if substituent else '')
+
+SPACERS = ['', 'C', 'CC', 'C(C)', 'CCC', 'OCC', 'C(F)']
+
+LINKERS = ['C(=O)N', 'NC(=O)', 'CN', 'O', 'S(=O)(=O)N', 'NC(=O)N', 'C', 'CC(=O)N']
+
+def sample(make_smile, n, seed, max_tries=20):
+    '''
+    draws up to `n` valid, unique SMILES from `make_smile(rng)` with a fixed `seed`. 
+    Stops early if the space runs out
+    '''
+    rng = random.Random(seed)
+    smiles = {}
+    for _ in range(n * max_tries):
+        smile = make_smile(rng)
+        smiles[smile] = None
+        if len(smiles) >= n * 2:
+            break
+    return valid_unique(list(smiles.keys()))[:n]
+
+def building_blocks(n, seed=0, classes=None):
+    '''
+    returns up to `n` valid, unique building block SMILES. `classes` restricts the 
+    reactive groups used (keys of `REACTIVE_GROUPS`)
+    '''
+    classes = classes or list(REACTIVE_GROUPS.keys())
+    groups = [g for c in classes for g in REACTIVE_GROUPS[c]]
+
+    def make_smile(rng):
+        group = rng.choice(SPACERS) + rng.choice(groups)
+        return fill(rng.choice(SCAFFOLDS), rng).replace('{G}', group)
+
+    return sample(make_smile, n, seed)
+
+def screening_library(n, seed=0, duplicate_fraction=0.0):
+    '''
+    returns `n` drug-like SMILES (two substituted rings joined by a linker) for template 
+    screening. Roughly `duplicate_fraction` of the outputs repeat earlier entries, as 
+    vendor exports do
+    '''
+    def make_smile(rng):
+        left = fill(rng.choice(SCAFFOLDS), rng).replace('{G}', rng.choice(LINKERS))
+        right = fill(rng.choice(SCAFFOLDS), rng).replace('{G}', rng.choice(SUBSTITUENTS))
+        return left + right
+
+    rng = random.Random(seed)
+    unique = sample(make_smile, max(1, int(n * (1 - duplicate_fraction))), seed)
+    return [unique[i] if i < len(unique) else rng.choice(unique) for i in range(n)]
+
+def fragments(templates, n, seed=0):
+    return sample(lambda rng: fill(rng.choice(templates), rng), n, seed)
+
+def to_inputs(smiles, source):
+    return [{'input' : smile, 'data' : {'source' : source, 'idx' : i}} for i, smile in enumerate(smiles)]
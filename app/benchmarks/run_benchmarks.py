@@ -0,0 +1,267 @@
+'''
+Benchmarks for the template, synthon and assembly hot paths. Runs offline against the
+chem modules (no server or MongoDB needed) on synthetic corpora and writes the results
+as JSON so runs can be compared across commits
+
+    python -m app.benchmarks.run_benchmarks --size 2000 --output bench.json
+    python -m app.benchmarks.run_benchmarks --size 2000 --compare bench.json
+'''
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+import numpy as np
+
+from ..chem import chem_templates, chem_assembly
+from ..chem.chem_assembly import REACTION_MECHANISM_DICT
+from ..chem.chem_cache import SynthonCache
+from . import corpus
+
+SCREENING_TEMPLATE = {
+    'template_name' : 'benchmark_screen',
+    'property_filters' : {
+        'Molecular Weight' : {'min_val' : 150, 'max_val' : 500},
+        'LogP' : {'min_val' : None, 'max_val' : 5},
+        'Hydrogen Bond Donors' : {'min_val' : None, 'max_val' : 5},
+        'Hydrogen Bond Acceptors' : {'min_val' : None, 'max_val' : 10},
+        'Rotatable Bonds' : {'min_val' : None, 'max_val' : 8},
+        'QED' : {'min_val' : 0.3, 'max_val' : None},
+        'SA Score' : {'min_val' : None, 'max_val' : 5},
+    },
+    'catalog_filters' : {'PAINS' : {'include' : True}, 'BRENK' : {'include' : True}},
+    'smarts_filters' : {'[#6]S(=O)(=O)Cl' : {'min_val' : None, 'max_val' : 0}}
+}
+
+BB_TEMPLATE = {
+    'template_name' : 'benchmark_bb',
+    'property_filters' : {'Molecular Weight' : {'min_val' : None, 'max_val' : 300}},
+    'catalog_filters' : {},
+    'smarts_filters' : {}
+}
+
+PRODUCT_TEMPLATE = {
+    'template_name' : 'benchmark_product',
+    'property_filters' : {
+        'Molecular Weight' : {'min_val' : None, 'max_val' : 550},
+        'LogP' : {'min_val' : None, 'max_val' : 5}
+    },
+    'catalog_filters' : {},
+    'smarts_filters' : {}
+}
+
+# three building block products are larger, so their filter is looser
+PRODUCT_3BB_TEMPLATE = {
+    'template_name' : 'benchmark_product_3bb',
+    'property_filters' : {
+        'Molecular Weight' : {'min_val' : None, 'max_val' : 700},
+        'LogP' : {'min_val' : None, 'max_val' : 7}
+    },
+    'catalog_filters' : {},
+    'smarts_filters' : {}
+}
+
+def summarize(latencies, n_inputs, n_outputs=None):
+    latencies = np.array(latencies)
+    total = float(latencies.sum())
+    summary = {
+        'n_calls' : len(latencies),
+        'n_inputs' : n_inputs,
+        'total_s' : total,
+        'throughput_per_s' : (n_inputs / total) if total else None,
+        'mean_ms' : float(latencies.mean() * 1000),
+        'p50_ms' : float(np.percentile(latencies, 50) * 1000),
+        'p95_ms' : float(np.percentile(latencies, 95) * 1000),
+        'p99_ms' : float(np.percentile(latencies, 99) * 1000),
+    }
+    if n_outputs is not None:
+        summary['n_outputs'] = n_outputs
+    return summary
+
+def time_calls(func, call_inputs, warmup_inputs=()):
+    '''
+    times `func(i)` for each item of `call_inputs` after untimed calls on `warmup_inputs`.
+    Returns `(latencies, outputs)`
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in warmup_inputs:
+            func(i)
+
+        latencies = []
+        outputs = []
+        for i in call_inputs:
+            start = time.perf_counter()
+            outputs.append(func(i))
+            latencies.append(time.perf_counter() - start)
+
+    return latencies, outputs
+
+def batches(inputs, batch_size):
+    return [inputs[i:i+batch_size] for i in range(0, len(inputs), batch_size)]
+
+def bench_eval_template(args, return_data):
+    inputs = corpus.screening_library(args.size, seed=args.seed, duplicate_fraction=args.duplicate_fraction)
+    func = lambda batch: chem_templates.run_request(batch, SCREENING_TEMPLATE, return_data=return_data,
+                                                     n_workers=args.workers, chunksize=args.chunksize)
+    call_inputs = batches(inputs, args.batch_size)
+    latencies, outputs = time_calls(func, call_inputs, call_inputs[:1])
+    return summarize(latencies, len(inputs), sum(r['result'] for results, _ in outputs for r in results))
+
+def bench_synthons(args, func):
+    inputs = corpus.building_blocks(args.synthon_size, seed=args.seed)
+    call_inputs = batches(inputs, args.batch_size)
+    latencies, _ = time_calls(func, call_inputs, call_inputs[:1])
+    return summarize(latencies, len(inputs))
+
+def assembly_inputs_2bb(args):
+    acids = corpus.building_blocks(args.bb_size, seed=args.seed, classes=['acid'])
+    amines = corpus.building_blocks(args.bb_size, seed=args.seed + 1, classes=['amine'])
+    return {
+        'building_block_1' : {'inputs' : corpus.to_inputs(acids, 'acid'), 'template_config' : BB_TEMPLATE},
+        'building_block_2' : {'inputs' : corpus.to_inputs(amines, 'amine'), 'template_config' : BB_TEMPLATE},
+        'product' : {'reaction_mechanisms' : REACTION_MECHANISM_DICT, 'template_config' : PRODUCT_TEMPLATE},
+        'unmapped_inputs' : None
+    }
+
+def assembly_inputs_3bb(args):
+    n = max(2, args.bb_size // 2)
+    mechanisms = {'N-acylation' : True, 'Amine_alkylation_arylation' : True}
+    # amino esters react with each other and leave an amine for the isocyanate
+    amino_esters_1 = corpus.building_blocks(n, seed=args.seed, classes=['amino_ester'])
+    amino_esters_2 = corpus.building_blocks(n, seed=args.seed + 1, classes=['amino_ester'])
+    isocyanates = corpus.building_blocks(n, seed=args.seed + 2, classes=['isocyanate'])
+    return {
+        'building_block_1' : {'inputs' : corpus.to_inputs(amino_esters_1, 'amino_ester'), 'template_config' : None},
+        'building_block_2' : {'inputs' : corpus.to_inputs(amino_esters_2, 'amino_ester'), 'template_config' : None},
+        'intermediate_product_1' : {'reaction_mechanisms' : mechanisms, 'template_config' : None},
+        'building_block_3' : {'inputs' : corpus.to_inputs(isocyanates, 'isocyanate'), 'template_config' : None},
+        'product' : {'reaction_mechanisms' : mechanisms, 'template_config' : PRODUCT_3BB_TEMPLATE},
+        'unmapped_inputs' : None
+    }
+
+def assembly_inputs_fragment(args):
+    n = max(2, args.bb_size // 2)
+    schema = {
+        'name' : 'full_molecule', 'node_type' : 'fragment_node', 'template_config' : PRODUCT_TEMPLATE,
+        'children' : [
+            {'name' : 'R1', 'node_type' : 'fragment_leaf_node', 'mapping_idxs' : [1], 'template_config' : None},
+            {'name' : 'Linker', 'node_type' : 'fragment_leaf_node', 'mapping_idxs' : [1, 2], 'template_config' : None},
+            {'name' : 'Scaffold', 'node_type' : 'fragment_leaf_node', 'mapping_idxs' : [2], 'template_config' : None}
+        ]
+    }
+    r_groups = corpus.fragments(corpus.FRAGMENT_R_GROUPS, n, seed=args.seed)
+    unmapped = corpus.FRAGMENT_LINKERS + corpus.FRAGMENT_SCAFFOLDS
+    return {
+        'assembly_schema' : schema,
+        'mapped_inputs' : {'R1' : corpus.to_inputs(r_groups, 'r_group')},
+        'unmapped_inputs' : corpus.to_inputs(unmapped, 'fragment')
+    }
+
+def count_assembly_inputs(assembly_inputs):
+    nodes = assembly_inputs.get('mapped_inputs') or assembly_inputs
+    n_inputs = 0
+    for value in nodes.values():
+        if isinstance(value, dict):
+            value = value.get('inputs')
+        n_inputs += len(value) if isinstance(value, list) else 0
+    return n_inputs + len(assembly_inputs.get('unmapped_inputs') or [])
+
+def bench_assembly(args, func, make_inputs):
+    # assembly functions consume their inputs, so each call gets a fresh copy
+    call_inputs = [make_inputs(args) for _ in range(args.repeats + 1)]
+    n_inputs = count_assembly_inputs(call_inputs[0])
+    latencies, outputs = time_calls(func, call_inputs[1:], call_inputs[:1])
+    return summarize(latencies, n_inputs, len(outputs[-1]))
+
+BENCHMARKS = {
+    'eval_template' : lambda args: bench_eval_template(args, False),
+    'eval_template_data' : lambda args: bench_eval_template(args, True),
+    'compute_synthons' : lambda args: bench_synthons(args, chem_assembly.compute_synthons),
+    'has_synthon' : lambda args: bench_synthons(args, chem_assembly.has_synthon),
+    'assemble_2bbs' : lambda args: bench_assembly(args, lambda i: chem_assembly.assemble_2bbs(i, n_workers=args.workers),
+                                                  assembly_inputs_2bb),
+    'assemble_3bbs' : lambda args: bench_assembly(args, lambda i: chem_assembly.assemble_3bbs(i, n_workers=args.workers),
+                                                  assembly_inputs_3bb),
+    'assemble_fragments' : lambda args: bench_assembly(args, lambda i: chem_assembly.assemble_inputs(i, 'fragment',
+                                                                                                     n_workers=args.workers),
+                                                       assembly_inputs_fragment),
+}
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(args):
+    from rdkit import __version__ as rdkit_version
+
+    # stored results and cached synthons would turn repeat runs into lookups
+    chem_templates.RESULT_STORE = None
+    chem_assembly.SYNTHON_CACHE = SynthonCache(0)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS.keys())
+    results = {}
+    for name in names:
+        print(f'running {name}', file=sys.stderr)
+        results[name] = BENCHMARKS[name](args)
+
+    return {
+        'meta' : {
+            'commit' : git_commit(),
+            'timestamp' : time.time(),
+            'python' : platform.python_version(),
+            'rdkit' : rdkit_version,
+            'platform' : platform.platform(),
+            'args' : vars(args)
+        },
+        'results' : results
+    }
+
+def compare(report, baseline):
+    'per benchmark ratios of `report` to `baseline`. Ratios above 1 are slower latency or higher throughput'
+    comparison = {}
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        comparison[name] = {k : (result[k] / base[k]) if base.get(k) else None
+                            for k in ['throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms']}
+    return comparison
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark template, synthon and assembly hot paths')
+    parser.add_argument('--size', type=int, default=2000, help='number of SMILES in the screening corpus')
+    parser.add_argument('--synthon-size', type=int, default=200, help='number of building blocks for synthon benchmarks')
+    parser.add_argument('--bb-size', type=int, default=40, help='building blocks per assembly node')
+    parser.add_argument('--batch-size', type=int, default=100, help='inputs per timed call')
+    parser.add_argument('--repeats', type=int, default=5, help='timed calls per assembly benchmark')
+    parser.add_argument('--duplicate-fraction', type=float, default=0.0, help='fraction of repeated screening inputs')
+    parser.add_argument('--workers', type=int, default=1, help='evaluation worker processes')
+    parser.add_argument('--chunksize', type=int, default=1000, help='inputs per evaluation worker chunk')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', default=None, help=f'comma separated subset of {",".join(BENCHMARKS.keys())}')
+    parser.add_argument('--output', default=None, help='path to write the JSON report')
+    parser.add_argument('--compare', default=None, help='path of a previous JSON report to compare against')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(args)
+
+    if args.compare:
+        with open(args.compare) as f:
+            report['comparison'] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,19 @@
 from .chem_imports import *
-from .chem_templates import strip_template, build_filters
+from .chem_templates import strip_template, compile_template
+from .chem_pool import map_chunks, use_worker_pool
+from .chem_cache import SynthonCache, LRUCache, canonical_hash
+from .chem_library import LibraryRegistry, build_library_columns
+from .chem_index import build_indexed_assembly, EnumerationBudget, BudgetedAssemblyInputs
+from ..config import CONFIG
+from ..metrics import REGISTRY, SYNTHON_SECONDS, ASSEMBLY_POOL_SIZE, ASSEMBLY_SECONDS
 from chem_templates.building_blocks import (
                                             smile_to_synthon,
                                             REACTION_GROUP_NAMES,
                                             BBClassifier
                                             )
 from collections import defaultdict 
+import time
+import math
 
 ASSEMBLY_TYPE_CONFIG = {
     'synthon' : {
@@ -28,70 +36,256 @@ SCHEMA_REMAPPING_FUNCTIONS = {
     'children' : lambda k,v: (k, [convert_assembly_schema(i) for i in v])
 }
 
-def has_synthon(inputs):
-    results = []
+def group_inputs(inputs):
+    '''
+    groups `inputs` by canonical SMILES. Returns `(groups, canonical, n_unique)` where `groups` 
+    maps the first input of each structure to the indices of every equivalent input and 
+    `canonical` maps it to its canonical SMILES. Inputs that can not be canonicalized are 
+    grouped by their own string and have no canonical SMILES
+    '''
+    first_inputs = {}
+    groups = defaultdict(list)
+    canonical = {}
     for i, item in enumerate(inputs):
-        result = {
-            'input' : item,
-            'index' : i,
-            'valid_input' : None,
-            'result' : False 
-        }
-        mol = to_mol(item)
-        if mol is None:
-            result['valid_input'] = False
-            result['result'] = False
-        else:
-            classes = BBClassifier(mol=mol)
-            result['valid_input'] = True
-            result['result'] = bool(classes)
-
-        results.append(result)
-
+        key = canon_smile(item) if isinstance(item, str) else ''
+        key = key or ('invalid', item)
+        if key not in first_inputs:
+            first_inputs[key] = item
+            canonical[item] = None if isinstance(key, tuple) else key
+        groups[first_inputs[key]].append(i)
+    n_unique = sum(i is not None for i in canonical.values())
+    return groups, canonical, n_unique
+
+def fan_out(inputs, groups, group_results):
+    '''
+    expands `group_results` (one result per group) to one result per input, with 
+    each result's `input` and `index` set to the original input
+    '''
+    results = [None] * len(inputs)
+    for item, indices in groups.items():
+        for i in indices:
+            results[i] = dict(group_results[item], input=inputs[i], index=i)
     return results 
 
-def compute_synthons(inputs):
-    results = []
-
-    for i, item in enumerate(inputs):
-        result = {
-            'input' : item,
-            'index' : i,
-            'valid_input' : None,
-            'synthons' : []
-        }
-
-        try:
-            synthons, reaction_tags = smile_to_synthon(item)
-            result['valid_input'] = True 
-            result['synthons'] = [{'synthon' : synthons[j], 'reaction_tags' : reaction_tags[j]}
-                                   for j in range(len(synthons))]
-
-        except:
-            result['valid_input'] = False 
+def timed_map(func, items, operation):
+    'returns `{item : func(item)}`, recording the time of each call in `SYNTHON_SECONDS`'
+    outputs = {}
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        outputs[item] = func(item)
+        timings.append((time.perf_counter() - start, (operation,)))
+    SYNTHON_SECONDS.observe_many(timings)
+    return outputs 
 
-        results.append(result)
+SYNTHON_CACHE = SynthonCache(CONFIG.SYNTHON_CACHE_SIZE, CONFIG.SYNTHON_CACHE_PATH)
+
+def synthons_from_smile(smile):
+    '''
+    returns `[synthons, reaction_tags]` for a canonical `smile`, or `False` if synthons can not 
+    be computed (`None` is a cache miss, so failures are cached as `False`)
+    '''
+    try:
+        synthons, reaction_tags = smile_to_synthon(smile)
+        return [synthons, reaction_tags]
+    except:
+        return False 
+
+def classify_smile(smile):
+    return bool(BBClassifier(mol=to_mol(smile)))
+
+SYNTHON_FUNCTIONS = {
+    'compute_synthons' : synthons_from_smile,
+    'has_synthon' : classify_smile
+}
 
-    return results
+def synthon_chunk(start_index, smiles, kind):
+    # runs in evaluation worker processes, metrics are returned to be merged into the parent
+    metrics_before = REGISTRY.snapshot()
+    values = timed_map(SYNTHON_FUNCTIONS[kind], smiles, kind)
+    return [values[i] for i in smiles], REGISTRY.delta(metrics_before)
+
+def get_synthon_values(kind, smiles, n_workers=1, chunksize=None):
+    '''
+    returns `{smiles : value}` of `SYNTHON_FUNCTIONS[kind]` for unique canonical `smiles`. 
+    Values are read from `SYNTHON_CACHE`, misses are computed on the worker pool and cached
+    '''
+    values = SYNTHON_CACHE.get_many(kind, smiles)
+    missing = [i for i in smiles if i not in values]
+    if missing:
+        chunksize = chunksize or CONFIG.SYNTHON_CHUNKSIZE
+        outputs, pooled = map_chunks(synthon_chunk, missing, (kind,), n_workers, chunksize)
+        new_values = []
+        for chunk_values, metrics_delta in outputs:
+            new_values += chunk_values
+            if pooled:
+                REGISTRY.merge(metrics_delta)
+
+        new_values = dict(zip(missing, new_values))
+        SYNTHON_CACHE.put_many(kind, new_values)
+        values.update(new_values)
+    return values 
+
+def has_synthon_single(item):
+    result = {
+        'input' : item,
+        'index' : None,
+        'valid_input' : None,
+        'result' : False 
+    }
+    mol = to_mol(item)
+    if mol is None:
+        result['valid_input'] = False
+        result['result'] = False
+    else:
+        classes = BBClassifier(mol=mol)
+        result['valid_input'] = True
+        result['result'] = bool(classes)
+    return result 
+
+def has_synthon(inputs, n_workers=1, chunksize=None):
+    '''
+    returns `(results, n_unique)`. Each unique structure in `inputs` is classified once, 
+    using `SYNTHON_CACHE` and the worker pool
+    '''
+    groups, canonical, n_unique = group_inputs(inputs)
+    values = get_synthon_values('has_synthon', [i for i in canonical.values() if i is not None], 
+                                n_workers=n_workers, chunksize=chunksize)
+
+    group_results = {}
+    for item, smile in canonical.items():
+        if smile is None:
+            group_results[item] = has_synthon_single(item)
+        else:
+            group_results[item] = {'input' : item, 'index' : None, 'valid_input' : True, 'result' : values[smile]}
+    return fan_out(inputs, groups, group_results), n_unique
+
+def compute_synthons_single(item):
+    result = {
+        'input' : item,
+        'index' : None,
+        'valid_input' : None,
+        'synthons' : []
+    }
+
+    try:
+        synthons, reaction_tags = smile_to_synthon(item)
+        result['valid_input'] = True 
+        result['synthons'] = [{'synthon' : synthons[j], 'reaction_tags' : reaction_tags[j]}
+                               for j in range(len(synthons))]
+
+    except:
+        result['valid_input'] = False 
+
+    return result
+
+def synthon_result(item, value):
+    result = {
+        'input' : item,
+        'index' : None,
+        'valid_input' : value is not False,
+        'synthons' : []
+    }
+    if value is not False:
+        synthons, reaction_tags = value
+        result['synthons'] = [{'synthon' : synthons[j], 'reaction_tags' : reaction_tags[j]}
+                              for j in range(len(synthons))]
+    return result 
+
+def compute_synthons(inputs, n_workers=1, chunksize=None):
+    '''
+    returns `(results, n_unique)`. Synthons are computed once for each unique structure in 
+    `inputs`, using `SYNTHON_CACHE` and the worker pool
+    '''
+    groups, canonical, n_unique = group_inputs(inputs)
+    values = get_synthon_values('compute_synthons', [i for i in canonical.values() if i is not None], 
+                                n_workers=n_workers, chunksize=chunksize)
+
+    group_results = {}
+    for item, smile in canonical.items():
+        if smile is None:
+            group_results[item] = compute_synthons_single(item)
+        else:
+            group_results[item] = synthon_result(item, values[smile])
+    return fan_out(inputs, groups, group_results), n_unique
+
+LIBRARIES = LibraryRegistry(CONFIG.LIBRARY_STORE_PATH, CONFIG.LIBRARY_CACHE_SIZE)
+
+def register_library(name, inputs, n_workers=1):
+    '''
+    registers `inputs` (`[{'input' : smiles, 'data' : data}]`) as a building block library. 
+    Molecules are canonicalized and deduplicated (keeping the first input's data) and their 
+    synthons are computed once, so assemblies referencing the library skip input processing
+    '''
+    molecules = {}
+    for item in inputs:
+        molecule = Molecule(item['input'], data=item['data'])
+        if molecule.valid and (molecule.smile not in molecules):
+            molecules[molecule.smile] = molecule
+
+    values = get_synthon_values('compute_synthons', list(molecules.keys()), n_workers=n_workers)
+    columns = build_library_columns(list(molecules.values()), values)
+    return LIBRARIES.add(name, len(inputs), columns)
+
+def library_pools(libraries):
+    'returns `{node_name : synthons}` selected from registered libraries by `libraries` references'
+    pools = {}
+    for node_name, reference in libraries.items():
+        library = LIBRARIES.get(reference['library_id'])
+        if library is None:
+            raise ValueError(f"library {reference['library_id']} not found")
+        pools[node_name] = library.select(reaction_tags=reference.get('reaction_tags'), 
+                                          n_func=reference.get('n_func'), 
+                                          data=reference.get('data'))
+    return pools 
 
 def config_to_template(template_config):
     if template_config:
-        filters = build_filters(template_config)
-        template = Template(filters)
+        template = compile_template(template_config).to_template()
     else:
         template = None 
     return template 
 
+# reaction universes and assembled schemas hold no request state, so they are shared between requests
+RXN_UNIVERSE_CACHE = LRUCache(CONFIG.ASSEMBLY_SCHEMA_CACHE_SIZE)
+ASSEMBLY_SCHEMA_CACHE = LRUCache(CONFIG.ASSEMBLY_SCHEMA_CACHE_SIZE)
+
 def config_to_rxn_universe(rxn_mechanism_dict):
-    reaction_mechanisms = [REACTION_GROUP_DICT[k] for k,v in rxn_mechanism_dict.items() if v]
-    rxn_universe = ReactionUniverse('reactions', reaction_mechanisms)
-    return rxn_universe 
+    '''
+    the `ReactionUniverse` of the enabled mechanisms, cached by the set of mechanisms. Reaction 
+    groups are added in `REACTION_GROUP_DICT` order, so the order of the dict does not matter
+    '''
+    key = frozenset(k for k,v in rxn_mechanism_dict.items() if v)
+    def build_rxn_universe():
+        reaction_mechanisms = [v for k,v in REACTION_GROUP_DICT.items() if k in key]
+        return ReactionUniverse('reactions', reaction_mechanisms)
+    return RXN_UNIVERSE_CACHE.get_or_compute(key, build_rxn_universe)
+
+def molecules_to_synthons(molecules, n_workers=1):
+    '''
+    `molecule_to_synthon` for each of `molecules`, with synthons read from `SYNTHON_CACHE`. 
+    Molecules whose synthons can not be computed have none
+    '''
+    smiles = list(dict.fromkeys(i.smile for i in molecules if i.valid))
+    values = get_synthon_values('compute_synthons', smiles, n_workers=n_workers)
+
+    outputs = []
+    for molecule in molecules:
+        if not molecule.valid:
+            outputs += molecule_to_synthon(molecule)
+            continue
+
+        value = values[molecule.smile]
+        if value is not False:
+            synthons, reaction_tags = value
+            outputs += [Synthon(synthons[j], reaction_tags[j], [molecule]) for j in range(len(synthons))]
+    return outputs 
 
-def process_inputs(inputs, assembly_type):
+def process_inputs(inputs, assembly_type, n_workers=1):
     inputs = [Molecule(i['input'], data=i['data']) for i in inputs]
 
     if assembly_type == 'synthon':
-        inputs = flatten_list([molecule_to_synthon(i) for i in inputs])
+        inputs = molecules_to_synthons(inputs, n_workers=n_workers)
 
     inputs = deduplicate_list(inputs, key_func=lambda x: x.smile)
     inputs = ASSEMBLY_TYPE_CONFIG[assembly_type]['assembly_pool'](inputs)
@@ -106,15 +300,36 @@ def convert_assembly_schema(node_dict):
         new_node_dict[new_k] = new_v 
     return new_node_dict 
 
-def build_assembly_inputs(assembly_schema, mapped_inputs, unmapped_inputs, assembly_type):
+def compile_assembly_schema(assembly_schema):
+    'the assembled node tree of an assembly schema dict, cached by its canonical hash'
+    key = canonical_hash(assembly_schema)
+    return ASSEMBLY_SCHEMA_CACHE.get_or_compute(key, 
+                                                lambda: build_indexed_assembly(convert_assembly_schema(assembly_schema)))
+
+def assembly_budget(batch_size=None, max_combinations=None, max_products=None, start=0, sample_size=None, seed=0):
+    'an `EnumerationBudget` with the configured defaults for unset limits'
+    return EnumerationBudget(batch_size or CONFIG.ASSEMBLY_BATCH_SIZE, max_combinations,
+                             max_products or CONFIG.ASSEMBLY_MAX_PRODUCTS, start, sample_size, seed)
+
+def build_assembly_inputs(assembly_schema, mapped_inputs, unmapped_inputs, assembly_type, n_workers=1, 
+                          libraries=None, budget=None):
     input_dict1 = {}
     input_dict2 = {}
     if mapped_inputs:
         for k,v in mapped_inputs.items():
-            input_dict1[k] = process_inputs(v, assembly_type)
+            input_dict1[k] = process_inputs(v, assembly_type, n_workers=n_workers)
+
+    if libraries:
+        if assembly_type != 'synthon':
+            raise ValueError('building block libraries can only be used for synthon assembly')
+
+        # library synthons are precomputed, they are only combined with any inputs sent for the node
+        for k,v in library_pools(libraries).items():
+            items = (input_dict1[k].items if k in input_dict1 else []) + v
+            input_dict1[k] = SynthonPool(deduplicate_list(items, key_func=lambda x: x.smile))
 
     if unmapped_inputs:
-        unmapped_inputs = process_inputs(unmapped_inputs, assembly_type)
+        unmapped_inputs = process_inputs(unmapped_inputs, assembly_type, n_workers=n_workers)
         input_dict2 = assembly_schema.build_assembly_pools(unmapped_inputs)
 
     merge_dict = defaultdict(list)
@@ -123,29 +338,145 @@ def build_assembly_inputs(assembly_schema, mapped_inputs, unmapped_inputs, assem
             merge_dict[k] += v.items
 
     input_dict = {k : ASSEMBLY_TYPE_CONFIG[assembly_type]['assembly_pool'](v) for k,v in merge_dict.items()}
+    ASSEMBLY_POOL_SIZE.observe_many([(len(v.items), (assembly_type,)) for v in input_dict.values()])
 
-    assembly_inputs = AssemblyInputs(input_dict, 1000, 1e6, log=False)
+    assembly_inputs = BudgetedAssemblyInputs(input_dict, CONFIG.ASSEMBLY_MAX_PRODUCTS, budget or assembly_budget())
 
     return assembly_inputs 
 
-def assemble_inputs(assembly_input_dict, assembly_type):
+def build_assembly(assembly_input_dict, assembly_type, n_workers, budget):
+    'builds the assembly nodes and input pools, returns `(assembly_schema, assembly_inputs)`'
     assembly_schema = assembly_input_dict['assembly_schema']
     mapped_inputs = assembly_input_dict['mapped_inputs']
     unmapped_inputs = assembly_input_dict['unmapped_inputs']
+    libraries = assembly_input_dict.get('libraries')
 
-    assembly_schema_dict = convert_assembly_schema(assembly_schema)
+    assembly_schema = compile_assembly_schema(assembly_schema)
+    budget.root = assembly_schema
 
-    assembly_schema = build_assembly_from_dict(assembly_schema_dict)
+    assembly_inputs = build_assembly_inputs(assembly_schema, mapped_inputs, unmapped_inputs, assembly_type, 
+                                           n_workers=n_workers, libraries=libraries, budget=budget)
+    return assembly_schema, assembly_inputs
+
+def iter_assembly(assembly_input_dict, assembly_type, n_workers=1, budget=None):
+    '''
+    yields the output records of each batch of the final node as it is enumerated. Records
+    are not deduplicated or sorted
+    '''
+    budget = budget or assembly_budget()
+    assembly_schema, assembly_inputs = build_assembly(assembly_input_dict, assembly_type, n_workers, budget)
+
+    if hasattr(assembly_schema, 'assemble_batches'):
+        batches = assembly_schema.assemble_batches(assembly_inputs)
+    else:
+        batches = [assembly_schema.assemble(assembly_inputs).items]
 
-    assembly_inputs = build_assembly_inputs(assembly_schema, mapped_inputs, unmapped_inputs, assembly_type)
+    for batch in batches:
+        yield [ASSEMBLY_TYPE_CONFIG[assembly_type]['assembly_schema_function'](i) for i in batch]
 
-    assembled = assembly_schema.assemble(assembly_inputs)
+def leaf_names(assembly_schema):
+    if 'leaf' in assembly_schema['node_type']:
+        return [assembly_schema['name']]
+    children = assembly_schema.get('children') or [assembly_schema['incoming_node'], assembly_schema['next_node']]
+    return flatten_list([leaf_names(i) for i in children])
+
+def assembly_shard_chunk(start_index, shard, shard_name, pool_dict, assembly_schema, assembly_type, batch_size):
+    # runs in evaluation worker processes, metrics are returned to be merged into the parent
+    metrics_before = REGISTRY.snapshot()
+    budget = assembly_budget(batch_size)
+    assembly_schema = compile_assembly_schema(assembly_schema)
+    budget.root = assembly_schema
+
+    pool_dict = dict(pool_dict)
+    pool_dict[shard_name] = ASSEMBLY_TYPE_CONFIG[assembly_type]['assembly_pool'](shard)
+    assembled = assembly_schema.assemble(BudgetedAssemblyInputs(pool_dict, CONFIG.ASSEMBLY_MAX_PRODUCTS, budget))
 
     outputs = [ASSEMBLY_TYPE_CONFIG[assembly_type]['assembly_schema_function'](i) for i in assembled]
+    return outputs, budget.summary(), REGISTRY.delta(metrics_before)
+
+def shard_assembly(assembly_schema, assembly_inputs, n_workers):
+    '''
+    returns `(shard_name, chunksize)` to split the largest leaf pool into shards of at least
+    `ASSEMBLY_MIN_SHARD_SIZE` items on `n_workers` workers, or `None` if the assembly should
+    run in the current process. Runs with a cursor, combination limit or sample are not sharded, 
+    as their enumeration position is only defined for a single process
+    '''
+    budget = assembly_inputs.budget
+    if (budget.start > 0) or (budget.sample_size is not None) or (budget.max_combinations is not None) or (budget.max_products < CONFIG.ASSEMBLY_MAX_PRODUCTS):
+        return None
+
+    pool_dict = assembly_inputs.pool_dict
+    names = [i for i in leaf_names(assembly_schema) if i in pool_dict]
+    if not names:
+        return None
+
+    shard_name = max(names, key=lambda x: len(pool_dict[x].items))
+    n_items = len(pool_dict[shard_name].items)
+    chunksize = max(CONFIG.ASSEMBLY_MIN_SHARD_SIZE, math.ceil(n_items / (4 * max(n_workers, 1))))
+    if not use_worker_pool(n_items, n_workers, chunksize):
+        return None
+    return shard_name, chunksize
+
+def assemble_shards(assembly_schema, assembly_inputs, assembly_type, shard_name, chunksize, n_workers):
+    '''
+    assembles shards of the `shard_name` leaf pool on the worker pool. Each worker builds the
+    assembly from `assembly_schema` and enumerates its shard against the full other pools. Every
+    product comes from one item of each leaf pool, so the shards split the products between them.
+    Node product caps apply to each shard
+    '''
+    budget = assembly_inputs.budget
+    pool_dict = {k:v for k,v in assembly_inputs.pool_dict.items() if k != shard_name}
+    args = (shard_name, pool_dict, assembly_schema, assembly_type, budget.batch_size)
+    shard_outputs, pooled = map_chunks(assembly_shard_chunk, assembly_inputs.pool_dict[shard_name].items, args,
+                                       n_workers, chunksize)
+
+    outputs = []
+    for chunk_outputs, summary, metrics_delta in shard_outputs:
+        outputs += chunk_outputs
+        budget.n_combinations += summary['n_combinations']
+        budget.n_products += summary['n_products']
+        if pooled:
+            REGISTRY.merge(metrics_delta)
+    return outputs
+
+def assemble_inputs(assembly_input_dict, assembly_type, n_workers=1, budget=None, sort=True, stream=False):
+    '''
+    assembles the products of `assembly_input_dict`. The root node enumerates combinations
+    within `budget` (an `EnumerationBudget`), which is updated with the number of combinations
+    attempted and the position to resume from. Sampled runs return at most `budget.sample_size`
+    products, in the order they were drawn if `sort` is False. `stream` returns the 
+    `iter_assembly` generator instead of the deduplicated products. Large assemblies are split 
+    across `n_workers` evaluation workers with `assemble_shards`
+    '''
+    if stream:
+        return iter_assembly(assembly_input_dict, assembly_type, n_workers=n_workers, budget=budget)
+
+    budget = budget or assembly_budget()
+    start = time.perf_counter()
+    assembly_schema, assembly_inputs = build_assembly(assembly_input_dict, assembly_type, n_workers, budget)
+    built = time.perf_counter()
+
+    shards = shard_assembly(assembly_input_dict['assembly_schema'], assembly_inputs, n_workers)
+    if shards:
+        outputs = assemble_shards(assembly_input_dict['assembly_schema'], assembly_inputs, assembly_type, 
+                                  *shards, n_workers)
+        enumerated = time.perf_counter()
+    else:
+        assembled = assembly_schema.assemble(assembly_inputs)
+        enumerated = time.perf_counter()
+        outputs = [ASSEMBLY_TYPE_CONFIG[assembly_type]['assembly_schema_function'](i) for i in assembled]
 
     if outputs:
         outputs = deduplicate_list(outputs, key_func=lambda x: x['result'])
-        outputs = sorted(outputs, key=lambda x: x['result'])
+        if budget.sample_size is not None:
+            # the last batch can overshoot the sample size. Its products are in random order, so it is truncated
+            outputs = outputs[:budget.sample_size]
+        if sort:
+            outputs = sorted(outputs, key=lambda x: x['result'])
+
+    ASSEMBLY_SECONDS.observe_many([(built - start, (assembly_type, 'build_inputs')),
+                                   (enumerated - built, (assembly_type, 'enumerate')),
+                                   (time.perf_counter() - enumerated, (assembly_type, 'build_outputs'))])
 
     return outputs 
 
@@ -176,15 +507,24 @@ def get_mapped_inputs(assembly_inputs):
             mapped_inputs[k] = inputs 
     return mapped_inputs
 
+def get_libraries(assembly_inputs):
+    libraries = {}
+    for k,v in assembly_inputs.items():
+        library = v.get('library', None)
+        if library:
+            libraries[k] = library 
+    return libraries
+
 def build_assembly_input_dict(assembly_inputs, assembly_schema):
     unmapped_inputs = assembly_inputs.pop('unmapped_inputs')
     mapped_inputs = get_mapped_inputs(assembly_inputs)
     assembly_input_dict = {'assembly_schema' : assembly_schema, 
                             'mapped_inputs' : mapped_inputs,
-                            'unmapped_inputs' : unmapped_inputs}
+                            'unmapped_inputs' : unmapped_inputs,
+                            'libraries' : get_libraries(assembly_inputs)}
     return assembly_input_dict
 
-def assemble_2bbs(assembly_inputs):
+def assemble_2bbs(assembly_inputs, n_workers=1, budget=None, sort=True, stream=False):
 
     block1 = get_bb_leaf_node_schema(assembly_inputs, 'building_block_1', [1])
     block2 = get_bb_leaf_node_schema(assembly_inputs, 'building_block_2', [1])
@@ -192,9 +532,10 @@ def assemble_2bbs(assembly_inputs):
 
     assembly_input_dict = build_assembly_input_dict(assembly_inputs, product)
 
-    return assemble_inputs(assembly_input_dict, 'synthon')
+    return assemble_inputs(assembly_input_dict, 'synthon', n_workers=n_workers, budget=budget, 
+                           sort=sort, stream=stream)
 
-def assemble_3bbs(assembly_inputs):
+def assemble_3bbs(assembly_inputs, n_workers=1, budget=None, sort=True, stream=False):
 
     block1 = get_bb_leaf_node_schema(assembly_inputs, 'building_block_1', [1])
     block2 = get_bb_leaf_node_schema(assembly_inputs, 'building_block_2', [2])
@@ -204,4 +545,14 @@ def assemble_3bbs(assembly_inputs):
 
     assembly_input_dict = build_assembly_input_dict(assembly_inputs, product)
 
-    return assemble_inputs(assembly_input_dict, 'synthon')
+    return assemble_inputs(assembly_input_dict, 'synthon', n_workers=n_workers, budget=budget, 
+                           sort=sort, stream=stream)
+
+def assemble_page(assemble_func, *args, n_workers=1, sort=True, **budget_kwargs):
+    '''
+    runs `assemble_func(*args)` within the `assembly_budget` built from `budget_kwargs`.
+    Returns `(outputs, budget_summary)`, so the enumeration state is returned from process executors
+    '''
+    budget = assembly_budget(**budget_kwargs)
+    outputs = assemble_func(*args, n_workers=n_workers, budget=budget, sort=sort)
+    return outputs, budget.summary()
@@ -0,0 +1,296 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, deque
+
+def canonical_hash(item):
+    'sha1 hash of the sorted-key JSON form of `item`'
+    item_str = json.dumps(item, sort_keys=True, default=str)
+    return hashlib.sha1(item_str.encode()).hexdigest()
+
+class BoundedHashSet():
+    '''
+    set of 8 byte hashes of strings, holding at most `maxsize` hashes. The oldest hashes are 
+    dropped first, so a string can be added again once `maxsize` newer strings were added
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hashes = set()
+        self.order = deque()
+
+    def add(self, item):
+        'adds `item`, returns False if it is already in the set'
+        item_hash = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=8).digest(), 'little')
+        if item_hash in self.hashes:
+            return False
+
+        self.hashes.add(item_hash)
+        self.order.append(item_hash)
+        if len(self.order) > self.maxsize:
+            self.hashes.discard(self.order.popleft())
+        return True
+
+    def __len__(self):
+        return len(self.hashes)
+
+class LRUCache():
+    'thread safe least-recently-used cache with hit/miss counters'
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def get_or_compute(self, key, func):
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def values(self):
+        with self.lock:
+            return list(self.items.values())
+
+    def __len__(self):
+        return len(self.items)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size' : len(self.items),
+            'maxsize' : self.maxsize,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'hit_rate' : (self.hits / total) if total else 0.0
+        }
+
+class ResultStore():
+    '''
+    SQLite store of evaluation results keyed by `(canonical SMILES, template hash)`, 
+    shared by every process that opens the same `path`. Rows hold the pass/fail result 
+    and, when the result was computed with `return_data=True`, the template data without 
+    the template name. Once the store holds more than `max_rows` rows, the least recently 
+    used rows are evicted down to 90% of `max_rows`
+    '''
+    def __init__(self, path, max_rows):
+        self.path = path
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def connect(self):
+        # sqlite connections can not be shared between threads, so each thread opens its own
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS results (
+                                smiles TEXT NOT NULL, 
+                                template_hash TEXT NOT NULL, 
+                                result INTEGER NOT NULL, 
+                                template_data TEXT, 
+                                last_used REAL NOT NULL, 
+                                PRIMARY KEY (smiles, template_hash))''')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+            conn.commit()
+            self.local.conn = conn
+        return conn
+
+    def get_many(self, template_hash, smiles, return_data=False):
+        '''
+        returns `{smiles : (result, template_data)}` for the stored rows of `smiles`. If 
+        `return_data`, rows stored without template data are treated as misses
+        '''
+        smiles = list(set(smiles))
+        conn = self.connect()
+        rows = {}
+        for i in range(0, len(smiles), 500):
+            batch = smiles[i:i+500]
+            query = (f'SELECT smiles, result, template_data FROM results '
+                     f'WHERE template_hash = ? AND smiles IN ({",".join("?" * len(batch))})')
+            for smile, result, template_data in conn.execute(query, [template_hash] + batch):
+                if return_data and (template_data is None):
+                    continue
+                rows[smile] = (bool(result), template_data)
+
+        self.record(len(rows), len(smiles) - len(rows))
+        return rows
+
+    def put_many(self, template_hash, rows, used_smiles=()):
+        '''
+        stores `rows` of `(smiles, result, template_data)` and marks `used_smiles` 
+        (rows read by `get_many`) as recently used
+        '''
+        now = time.time()
+        conn = self.connect()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', 
+                             [(smile, template_hash, int(result), 
+                               None if template_data is None else json.dumps(template_data), now) 
+                              for smile, result, template_data in rows])
+            conn.executemany('UPDATE results SET last_used = ? WHERE smiles = ? AND template_hash = ?', 
+                             [(now, smile, template_hash) for smile in used_smiles])
+        if rows:
+            self.evict()
+
+    def evict(self):
+        conn = self.connect()
+        n_rows = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if n_rows > self.max_rows:
+            with conn:
+                conn.execute('DELETE FROM results WHERE rowid IN '
+                             '(SELECT rowid FROM results ORDER BY last_used LIMIT ?)', 
+                             (n_rows - int(self.max_rows * 0.9),))
+
+    def record(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def size(self):
+        return self.connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        conn = self.connect()
+        with conn:
+            conn.execute('DELETE FROM results')
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'path' : self.path,
+            'size' : self.size(),
+            'max_rows' : self.max_rows,
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'hit_rate' : (self.hits / total) if total else 0.0
+        }
+
+class SynthonCache():
+    '''
+    LRU cache of synthon results keyed by `(kind, canonical SMILES)`. If `path` is set, results 
+    are also written to a SQLite file, so they persist across restarts and are shared by every 
+    process using the file. Memory misses are read from the file before being counted as misses. 
+    The file is not size limited
+    '''
+    def __init__(self, maxsize, path=None):
+        self.memory = LRUCache(maxsize)
+        self.path = path
+        self.store_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def connect(self):
+        # sqlite connections can not be shared between threads, so each thread opens its own
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS synthons (
+                                kind TEXT NOT NULL, 
+                                smiles TEXT NOT NULL, 
+                                value TEXT NOT NULL, 
+                                PRIMARY KEY (kind, smiles)) WITHOUT ROWID''')
+            conn.commit()
+            self.local.conn = conn
+        return conn
+
+    def get_many(self, kind, smiles):
+        'returns `{smiles : value}` for the cached entries of `smiles`'
+        values = {}
+        missing = []
+        for smile in smiles:
+            value = self.memory.get((kind, smile))
+            if value is None:
+                missing.append(smile)
+            else:
+                values[smile] = value 
+
+        stored = {}
+        if self.path and missing:
+            conn = self.connect()
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i+500]
+                query = f'SELECT smiles, value FROM synthons WHERE kind = ? AND smiles IN ({",".join("?" * len(batch))})'
+                for smile, value in conn.execute(query, [kind] + batch):
+                    stored[smile] = json.loads(value)
+
+            for smile, value in stored.items():
+                self.memory.put((kind, smile), value)
+            values.update(stored)
+
+        with self.lock:
+            self.store_hits += len(stored)
+            self.misses += len(missing) - len(stored)
+        return values 
+
+    def put_many(self, kind, values):
+        for smile, value in values.items():
+            self.memory.put((kind, smile), value)
+
+        if self.path and values:
+            conn = self.connect()
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO synthons VALUES (?, ?, ?)', 
+                                 [(kind, smile, json.dumps(value)) for smile, value in values.items()])
+
+    def clear(self):
+        self.memory.clear()
+        if self.path:
+            conn = self.connect()
+            with conn:
+                conn.execute('DELETE FROM synthons')
+        with self.lock:
+            self.store_hits = 0
+            self.misses = 0
+
+    def stats(self):
+        memory_hits = self.memory.hits
+        total = memory_hits + self.store_hits + self.misses
+        return {
+            'path' : self.path,
+            'size' : len(self.memory),
+            'maxsize' : self.memory.maxsize,
+            'stored' : self.connect().execute('SELECT COUNT(*) FROM synthons').fetchone()[0] if self.path else None,
+            'memory_hits' : memory_hits,
+            'store_hits' : self.store_hits,
+            'misses' : self.misses,
+            'hit_rate' : ((memory_hits + self.store_hits) / total) if total else 0.0
+        }
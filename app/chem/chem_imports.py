@@ -1,15 +1,17 @@
 import json 
+import time
+import threading
+from collections.abc import Mapping
+_IMPORT_START = time.perf_counter()
 
 from rdkit import Chem
 from rdkit.Chem import rdMolDescriptors
 from rdkit.Chem import Descriptors
-from rdkit.Chem import QED
-from rdkit.Contrib.SA_Score import sascorer
 from rdkit.Chem.FilterCatalog import FilterCatalog, FilterCatalogParams
 from rdkit.Chem.Lipinski import RotatableBondSmarts
 
 from chem_templates.filter import Filter, RangeFunctionFilter, CatalogFilter, FilterResult, Template, SimpleSmartsFilter
-from chem_templates.chem import Molecule, Catalog
+from chem_templates.chem import Molecule, Catalog, canon_smile
 from chem_templates.utils import flatten_list, deduplicate_list
 from chem_templates.building_blocks import (
                                             REACTION_GROUP_DICT, 
@@ -44,13 +46,119 @@ def smart_to_mol(smarts):
         
     return mol
 
+# seconds taken to load each lazily loaded component, reported at `/diagnostics/startup`
+LOAD_TIMES = {}
+
+class LazyDict(Mapping):
+    '''
+    read-only mapping whose keys are known up front and whose values are built by 
+    `loaders[key]()` on first access. Load times are recorded in `LOAD_TIMES` under 
+    `{prefix}:{key}`
+    '''
+    def __init__(self, prefix, loaders):
+        self.prefix = prefix
+        self.loaders = loaders
+        self.values_dict = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        value = self.values_dict.get(key)
+        if value is None:
+            loader = self.loaders[key]
+            with self.lock:
+                value = self.values_dict.get(key)
+                if value is None:
+                    start = time.perf_counter()
+                    value = loader()
+                    LOAD_TIMES[f'{self.prefix}:{key}'] = time.perf_counter() - start
+                    self.values_dict[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self.loaders)
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def is_loaded(self, key):
+        return key in self.values_dict
+
+def load_sascorer():
+    from rdkit.Contrib.SA_Score import sascorer
+    if sascorer._fscores is None:
+        sascorer.readFragmentScores()
+    return sascorer
+
+def load_qed():
+    from rdkit.Chem import QED
+    return QED
+
+DESCRIPTOR_MODULES = LazyDict('module', {'sascorer' : load_sascorer, 'QED' : load_qed})
+
+def sa_score(mol):
+    'synthetic accessibility score'
+    return DESCRIPTOR_MODULES['sascorer'].calculateScore(mol)
+
+def qed(mol):
+    'quantitative estimate of drug-likeness'
+    return DESCRIPTOR_MODULES['QED'].qed(mol)
+
+class MolContext():
+    '''
+    holds values computed from `mol` that several filters need (canonical SMILES, 
+    ring atoms, rotatable bond matches, synthon classes, computed properties). 
+    Each value is computed on first use and reused for the rest of the evaluation
+    '''
+    def __init__(self, mol):
+        self.mol = mol
+        self.values = {}
+
+    def get(self, key, func):
+        'returns the value stored at `key`, computing it with `func(self)` if missing'
+        if key not in self.values:
+            self.values[key] = func(self)
+        return self.values[key]
+
+    @property
+    def smiles(self):
+        return self.get('smiles', lambda c: Chem.MolToSmiles(c.mol))
+
+    @property
+    def atom_rings(self):
+        return self.get('atom_rings', lambda c: c.mol.GetRingInfo().AtomRings())
+
+    @property
+    def rot_bond_matches(self):
+        return self.get('rot_bond_matches', lambda c: c.mol.GetSubstructMatches(RotatableBondSmarts))
+
+    @property
+    def synthon_classes(self):
+        return self.get('synthon_classes', lambda c: BBClassifier(mol=c.mol))
+
+def as_context(mol):
+    return mol if isinstance(mol, MolContext) else MolContext(mol)
+
+def get_mol_context(molecule):
+    'returns the `MolContext` attached to `molecule`, creating it on first use'
+    context = getattr(molecule, 'mol_context', None)
+    if (context is None) or (context.mol is not molecule.mol):
+        context = MolContext(molecule.mol)
+        molecule.mol_context = context
+    return context
+
+def clear_mol_context(molecule):
+    'drops the `MolContext` attached to `molecule` so its memoized values can be freed'
+    molecule.mol_context = None
+
 def find_bond_groups(mol):
     """
     Find groups of contiguous rotatable bonds and return them sorted by decreasing size
 
     https://www.rdkit.org/docs/Cookbook.html
     """
-    rot_atom_pairs = mol.GetSubstructMatches(RotatableBondSmarts)
+    context = as_context(mol)
+    mol = context.mol
+    rot_atom_pairs = context.rot_bond_matches
     rot_bond_set = set([mol.GetBondBetweenAtoms(*ap).GetIdx() for ap in rot_atom_pairs])
     rot_bond_groups = []
     while (rot_bond_set):
@@ -72,13 +180,11 @@ def find_bond_groups(mol):
 
 def max_ring_size(mol):
     'size of largest ring'
-    ring_info = mol.GetRingInfo()
-    return max((len(r) for r in ring_info.AtomRings()), default=0)
+    return max((len(r) for r in as_context(mol).atom_rings), default=0)
 
 def min_ring_size(mol):
     'size of smallest ring'
-    ring_info = mol.GetRingInfo()
-    return min((len(r) for r in ring_info.AtomRings()), default=0)
+    return min((len(r) for r in as_context(mol).atom_rings), default=0)
 
 def loose_rotbond(mol):
     'number of rotatable bonds, includes things like amides and esters'
@@ -92,18 +198,22 @@ def rot_chain_length(mol):
 
 def num_compounds(mol):
     'number of molecules in mol'
-    smile = Chem.MolToSmiles(mol)
+    smile = as_context(mol).smiles
     return smile.count('.')+1
 
 def num_synthon_classes(mol):
-    classes = BBClassifier(mol=mol)
+    classes = as_context(mol).synthon_classes
     return len(classes)
 
 def num_dummies(mol):
-    smile = Chem.MolToSmiles(mol)
+    smile = as_context(mol).smiles
     n_attachments = smile.count('*')
     return n_attachments
 
+# property functions that accept a `MolContext` as well as a mol
+CONTEXT_PROP_FUNCS = {num_compounds, num_dummies, max_ring_size, min_ring_size, 
+                      rot_chain_length, num_synthon_classes}
+
 PROP_FUNCS = {
     'Number of Compounds' : num_compounds,
     'Number of Dummy Atoms' : num_dummies,
@@ -146,8 +256,8 @@ PROP_FUNCS = {
     
     'Amide Bond Count' : rdMolDescriptors.CalcNumAmideBonds,
     'Fraction SP3' : rdMolDescriptors.CalcFractionCSP3,
-    'QED' : QED.qed,
-    'SA Score' : sascorer.calculateScore,
+    'QED' : qed,
+    'SA Score' : sa_score,
     'Molar Refractivity' : Descriptors.MolMR,
     'Radical Count' : Descriptors.NumRadicalElectrons,
 
@@ -156,16 +266,27 @@ PROP_FUNCS = {
 
 PROPERTY_NAMES = list(PROP_FUNCS.keys())
 
-FILTER_CATALOGUES = {
-    'PAINS' : FilterCatalog(FilterCatalogParams.FilterCatalogs.PAINS),
-    'PAINS_A' : FilterCatalog(FilterCatalogParams.FilterCatalogs.PAINS_A),
-    'PAINS_B' : FilterCatalog(FilterCatalogParams.FilterCatalogs.PAINS_B),
-    'PAINS_C' : FilterCatalog(FilterCatalogParams.FilterCatalogs.PAINS_C),
-    'BRENK' : FilterCatalog(FilterCatalogParams.FilterCatalogs.BRENK),
-    'NIH' : FilterCatalog(FilterCatalogParams.FilterCatalogs.NIH),
-    'ZINC' : FilterCatalog(FilterCatalogParams.FilterCatalogs.ZINC),
+CATALOG_PARAMS = {
+    'PAINS' : FilterCatalogParams.FilterCatalogs.PAINS,
+    'PAINS_A' : FilterCatalogParams.FilterCatalogs.PAINS_A,
+    'PAINS_B' : FilterCatalogParams.FilterCatalogs.PAINS_B,
+    'PAINS_C' : FilterCatalogParams.FilterCatalogs.PAINS_C,
+    'BRENK' : FilterCatalogParams.FilterCatalogs.BRENK,
+    'NIH' : FilterCatalogParams.FilterCatalogs.NIH,
+    'ZINC' : FilterCatalogParams.FilterCatalogs.ZINC,
 }
 
+FILTER_CATALOGUES = LazyDict('catalog', {k : (lambda v=v: FilterCatalog(v)) for k,v in CATALOG_PARAMS.items()})
+
+def catalog_filter_sets(filter_catalog):
+    'names of the filter sets (`FilterSet` entry property) in `filter_catalog`'
+    return {filter_catalog.GetEntry(i).GetProp('FilterSet') for i in range(filter_catalog.GetNumEntries())}
+
+# catalogs can overlap (`PAINS` holds the `PAINS_A`, `PAINS_B` and `PAINS_C` sets), 
+# so catalog matches are attributed through the filter set of each matched entry
+CATALOG_FILTER_SETS = LazyDict('filter_sets', {k : (lambda k=k: catalog_filter_sets(FILTER_CATALOGUES[k])) 
+                                                for k in CATALOG_PARAMS.keys()})
+
 CATALOG_NAMES = list(FILTER_CATALOGUES.keys())
 
 property_filter_description = '''property filters compute the `value` of some `property_name`. The `value` is then 
@@ -533,3 +654,20 @@ FRAGMENT_ASSEMBLY_DESCRIPTION = {
     'node_schema' : FRAGMENT_NODE_SCHEMA
 }
 
+def warm_up(components):
+    '''
+    loads `components` ahead of first use. Components are catalog names (ie `PAINS`), 
+    `sascorer` and `QED`. `all` loads every component
+    '''
+    if 'all' in components:
+        components = list(CATALOG_PARAMS.keys()) + list(DESCRIPTOR_MODULES.keys())
+
+    start = time.perf_counter()
+    for component in components:
+        if component in CATALOG_PARAMS:
+            CATALOG_FILTER_SETS[component]
+        elif component in DESCRIPTOR_MODULES:
+            DESCRIPTOR_MODULES[component]
+    LOAD_TIMES['warm_up'] = time.perf_counter() - start
+
+LOAD_TIMES['import:chem_imports'] = time.perf_counter() - _IMPORT_START
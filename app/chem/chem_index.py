@@ -0,0 +1,356 @@
+import math
+import random
+from bisect import bisect_right
+from itertools import islice, product
+from collections import defaultdict
+
+from .chem_imports import *
+from chem_templates.assembly import SynthonNode, FragmentNode
+
+def reactant_sides(synthon, reactions):
+    '''
+    `(reaction_idx, side)` pairs for each reactant template of `reactions` that `synthon`
+    matches. Synthons that fail to match are treated as non-reactants, as `FusionReaction.is_reactant` does
+    '''
+    sides = set()
+    for i, reaction in enumerate(reactions):
+        reactants = reaction.rxn.GetReactants()
+        if len(reactants) < 2:
+            continue
+        for side in (0, 1):
+            try:
+                if synthon.recon_mol.HasSubstructMatch(reactants[side]):
+                    sides.add((i, side))
+            except:
+                pass
+    return sides
+
+class ReactionIndex():
+    '''
+    index of a `SynthonPool` by reaction mark and reactant side of each reaction in a
+    `ReactionUniverse`. Each synthon is matched against the reactant templates once, so
+    pairs with no reaction in common are skipped without being tested
+    '''
+    def __init__(self, pool, reactions):
+        self.pool = pool
+        self.sides = [reactant_sides(i, reactions) for i in pool.items]
+        self.positions = defaultdict(list)
+        for position, synthon in enumerate(pool.items):
+            for mark in synthon.marks:
+                for reaction_idx, side in self.sides[position]:
+                    self.positions[(mark, reaction_idx, side)].append(position)
+
+    def get_matching(self, sides, compatible_marks):
+        '''
+        positions of synthons with a compatible mark that fill the other reactant side of any
+        of `sides`. Marks are visited in sorted order (`SynthonPool.get_matching` visits them in
+        set order, which changes between processes), so pairs are enumerated in the same order
+        by every server process and enumeration cursors stay valid
+        '''
+        partner_sides = {(reaction_idx, 1 - side) for reaction_idx, side in sides}
+        seen = set()
+        outputs = []
+        for mark in sorted(compatible_marks):
+            positions = set()
+            for reaction_idx, side in partner_sides:
+                positions.update(self.positions.get((mark, reaction_idx, side), ()))
+            for position in sorted(positions):
+                synthon_id = id(self.pool.items[position])
+                if synthon_id not in seen:
+                    seen.add(synthon_id)
+                    outputs.append(position)
+        return outputs
+
+def universe_reactions(rxn_universe):
+    return [reaction for group in rxn_universe.reaction_groups for reaction in group.reactions]
+
+class PairSpace():
+    '''
+    synthon pairs of `pool1` and `pool2` that fit a reaction of `rxn_universe`, addressed by 
+    position in enumeration order. Partners are looked up once per distinct reactant sides and
+    compatible marks, so pairs can be counted and drawn without building every pair
+    '''
+    def __init__(self, pool1, pool2, rxn_universe):
+        self.pool1 = pool1
+        self.pool2 = pool2
+        self.reactions = universe_reactions(rxn_universe)
+        self.index1 = ReactionIndex(pool1, self.reactions)
+        self.index2 = ReactionIndex(pool2, self.reactions)
+        self.matching = {}
+        self.offsets = [0]
+        for position1 in range(len(pool1.items)):
+            self.offsets.append(self.offsets[-1] + len(self.partners(position1)))
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def partners(self, position1):
+        sides1 = self.index1.sides[position1]
+        if not sides1:
+            return []
+        compatible_marks = self.pool1.items[position1].compatible_marks
+        key = (frozenset(sides1), frozenset(compatible_marks))
+        if key not in self.matching:
+            self.matching[key] = self.index2.get_matching(sides1, compatible_marks)
+        return self.matching[key]
+
+    def pair(self, position1, position2):
+        sides1 = self.index1.sides[position1]
+        sides2 = self.index2.sides[position2]
+        matching = [self.reactions[i] for i in range(len(self.reactions))
+                    if (((i, 0) in sides1) and ((i, 1) in sides2)) or (((i, 0) in sides2) and ((i, 1) in sides1))]
+        return (self.pool1.items[position1], self.pool2.items[position2], matching)
+
+    def __getitem__(self, position):
+        position1 = bisect_right(self.offsets, position) - 1
+        return self.pair(position1, self.partners(position1)[position - self.offsets[position1]])
+
+    def iter_from(self, start=0):
+        position1 = max(bisect_right(self.offsets, start) - 1, 0)
+        offset = start - self.offsets[position1]
+        for position1 in range(position1, len(self.pool1.items)):
+            for position2 in self.partners(position1)[offset:]:
+                yield self.pair(position1, position2)
+            offset = 0
+
+class ProductSpace():
+    'combinations of one item from each pool, addressed by position in `itertools.product` order'
+    def __init__(self, pools):
+        self.pools = pools
+
+    def __len__(self):
+        return math.prod(len(i.items) for i in self.pools)
+
+    def __getitem__(self, position):
+        items = []
+        for pool in reversed(self.pools):
+            position, idx = divmod(position, len(pool.items))
+            items.append(pool.items[idx])
+        return tuple(reversed(items))
+
+# spaces up to this size are shuffled, larger spaces are sampled with rejection of repeated positions
+SHUFFLE_LIMIT = 1_000_000
+
+def random_positions(n_positions, seed):
+    '''
+    yields every position in `range(n_positions)` once, in a random order set by `seed`. Only 
+    the positions drawn so far are stored for spaces larger than `SHUFFLE_LIMIT`
+    '''
+    rng = random.Random(seed)
+    if n_positions <= SHUFFLE_LIMIT:
+        positions = list(range(n_positions))
+        rng.shuffle(positions)
+        yield from positions
+        return
+
+    drawn = set()
+    while len(drawn) < n_positions:
+        position = rng.randrange(n_positions)
+        if position not in drawn:
+            drawn.add(position)
+            yield position
+
+def sampled_combinations(space, seed, start=0):
+    'the combinations of `space` in random order, skipping the first `start`'
+    return islice((space[i] for i in random_positions(len(space), seed)), start, None)
+
+def indexed_pairs(pool1, pool2, rxn_universe, start=0):
+    '''
+    yields `(synthon1, synthon2, reactions)` for every synthon pair that fits a reaction of
+    `rxn_universe`, using `ReactionIndex` instead of testing every mark compatible pair against
+    every reaction. The first `start` pairs are skipped without being built
+    '''
+    yield from PairSpace(pool1, pool2, rxn_universe).iter_from(start)
+
+def indexed_assemblies(pool1, pool2, rxn_universe, chunksize):
+    'chunks of `indexed_pairs`, as `make_assemblies` yields them'
+    output_assemblies = []
+    for assembly in indexed_pairs(pool1, pool2, rxn_universe):
+        output_assemblies.append(assembly)
+        if len(output_assemblies) >= chunksize:
+            yield output_assemblies
+            output_assemblies = []
+
+    yield output_assemblies
+
+class EnumerationBudget():
+    '''
+    batch size and limits for one assembly call. The root node stops after the batch that
+    reaches `max_products` products, never attempts more than `max_combinations`
+    combinations and starts from combination `start`. `next_position` is where a
+    following call should start, or `None` once every combination has been attempted. 
+
+    With `sample_size`, the root node draws its combinations in a random order set by `seed`
+    and stops after the batch that reaches `sample_size` products. `n_space` is the number
+    of combinations the sample is drawn from
+    '''
+    def __init__(self, batch_size=1000, max_combinations=None, max_products=1_000_000, start=0,
+                 sample_size=None, seed=0):
+        self.batch_size = batch_size
+        self.max_combinations = max_combinations
+        self.max_products = max_products
+        self.start = start
+        self.sample_size = sample_size
+        self.seed = seed
+        self.root = None
+        self.n_combinations = 0
+        self.n_products = 0
+        self.n_space = None
+        self.next_position = None
+
+    def next_batch_size(self):
+        batch_size = self.batch_size
+        if self.sample_size is not None:
+            # samples draw about as many combinations as the products still needed, so the last batch overshoots little
+            batch_size = min(batch_size, max(self.sample_size - self.n_products, 1))
+        if self.max_combinations is None:
+            return batch_size
+        return min(batch_size, self.max_combinations - self.n_combinations)
+
+    def exhausted(self):
+        if (self.max_products is not None) and (self.n_products >= self.max_products):
+            return True
+        if (self.sample_size is not None) and (self.n_products >= self.sample_size):
+            return True
+        return (self.max_combinations is not None) and (self.n_combinations >= self.max_combinations)
+
+    def summary(self):
+        return {
+            'n_combinations' : self.n_combinations,
+            'n_products' : self.n_products,
+            'n_space' : self.n_space,
+            'next_position' : self.next_position
+        }
+
+class BudgetedAssemblyInputs(AssemblyInputs):
+    def __init__(self, pool_dict, max_assemblies_per_node, budget):
+        super().__init__(pool_dict, budget.batch_size, max_assemblies_per_node, log=False)
+        self.budget = budget
+
+def enumerate_batches(node, combinations, assembly_inputs):
+    '''
+    fuses `combinations` in batches and yields the products of each batch that pass the node 
+    template. The root node follows the assembly budget, other nodes stop after 
+    `max_assemblies_per_node` products as in `chem_templates`
+    '''
+    budget = getattr(assembly_inputs, 'budget', None)
+    if (budget is None) or (budget.root is not node):
+        budget = None
+
+    n_outputs = 0
+    while True:
+        batch_size = assembly_inputs.assembly_chunksize if budget is None else budget.next_batch_size()
+        batch = list(islice(combinations, batch_size)) if batch_size > 0 else []
+        if not batch:
+            break
+
+        fused_pool = node.fuse(batch, assembly_inputs.worker_pool)
+        fused_pool = fused_pool.filter(node.template_screen, worker_pool=assembly_inputs.worker_pool)
+        n_outputs += len(fused_pool.items)
+        if budget is not None:
+            budget.n_combinations += len(batch)
+            budget.n_products = n_outputs
+        yield fused_pool.items
+
+        if budget is not None:
+            if budget.exhausted():
+                if next(combinations, None) is not None:
+                    budget.next_position = budget.start + budget.n_combinations
+                break
+
+        elif n_outputs > assembly_inputs.max_assemblies_per_node:
+            break
+
+def root_budget(node, assembly_inputs):
+    'the assembly budget if `node` is its root node, else `None`'
+    budget = getattr(assembly_inputs, 'budget', None)
+    return budget if (budget is not None) and (budget.root is node) else None
+
+def root_start(node, assembly_inputs):
+    'enumeration start position of `node`, set by the assembly budget for the root node'
+    budget = root_budget(node, assembly_inputs)
+    return budget.start if budget is not None else 0
+
+def sampled_root(node, space, assembly_inputs):
+    '''
+    the combinations of `space` in random order if the assembly budget of the root `node` 
+    samples, else `None`
+    '''
+    budget = root_budget(node, assembly_inputs)
+    if (budget is None) or (budget.sample_size is None):
+        return None
+    budget.n_space = len(space)
+    return sampled_combinations(space, budget.seed, budget.start)
+
+# assembled nodes are cached and shared between requests, so `assemble` must not modify them
+
+class IndexedSynthonNode(SynthonNode):
+    'a `SynthonNode` that enumerates synthon pairs with `indexed_pairs`'
+    def input_pools(self, assembly_inputs, verbose=False):
+        incoming_pool = self.incoming_node.assemble(assembly_inputs, verbose=verbose)
+        incoming_pool = incoming_pool.filter(self.reaction_screen, assembly_inputs.worker_pool)
+
+        next_pool = self.next_node.assemble(assembly_inputs, verbose=verbose)
+        next_pool = next_pool.filter(self.reaction_screen, assembly_inputs.worker_pool)
+        return [incoming_pool, next_pool]
+
+    def product_batches(self, input_pools, assembly_inputs):
+        space = PairSpace(*input_pools, self.rxn_universe)
+        combinations = sampled_root(self, space, assembly_inputs)
+        if combinations is None:
+            combinations = space.iter_from(root_start(self, assembly_inputs))
+        return enumerate_batches(self, combinations, assembly_inputs)
+
+    def assemble_batches(self, assembly_inputs, verbose=False):
+        'yields the products of each batch of synthon pairs'
+        yield from self.product_batches(self.input_pools(assembly_inputs, verbose=verbose), assembly_inputs)
+
+    def assemble(self, assembly_inputs, verbose=False):
+        input_pools = self.input_pools(assembly_inputs, verbose=verbose)
+        fused_pool = SynthonPool(flatten_list(self.product_batches(input_pools, assembly_inputs)))
+
+        if assembly_inputs.log:
+            assembly_inputs.assembly_log[self.name] = {'inputs' : input_pools, 'outputs' : fused_pool}
+        return fused_pool
+
+class BudgetedFragmentNode(FragmentNode):
+    'a `FragmentNode` that enumerates child combinations within the assembly budget'
+    def input_pools(self, assembly_inputs, verbose=False):
+        return [child.assemble(assembly_inputs, verbose=verbose) for child in self.children]
+
+    def product_batches(self, input_pools, assembly_inputs):
+        combinations = sampled_root(self, ProductSpace(input_pools), assembly_inputs)
+        if combinations is None:
+            combinations = islice(product(*[i.items for i in input_pools]), root_start(self, assembly_inputs), None)
+        return enumerate_batches(self, combinations, assembly_inputs)
+
+    def assemble_batches(self, assembly_inputs, verbose=False):
+        'yields the products of each batch of child combinations'
+        yield from self.product_batches(self.input_pools(assembly_inputs, verbose=verbose), assembly_inputs)
+
+    def assemble(self, assembly_inputs, verbose=False):
+        input_pools = self.input_pools(assembly_inputs, verbose=verbose)
+        fused_pool = AssemblyPool(flatten_list(self.product_batches(input_pools, assembly_inputs)))
+
+        if assembly_inputs.log:
+            assembly_inputs.assembly_log[self.name] = {'inputs' : input_pools, 'outputs' : fused_pool}
+        return fused_pool
+
+def build_indexed_assembly(assembly_schema):
+    '''
+    builds an assembly like `build_assembly_from_dict`, with `IndexedSynthonNode` reaction
+    nodes and `BudgetedFragmentNode` fragment nodes
+    '''
+    if assembly_schema['node_type'] == 'synthon_node':
+        return IndexedSynthonNode(assembly_schema['name'],
+                                  build_indexed_assembly(assembly_schema['incoming_node']),
+                                  build_indexed_assembly(assembly_schema['next_node']),
+                                  assembly_schema['rxn_universe'],
+                                  assembly_schema['n_func'],
+                                  assembly_schema['template'])
+
+    if assembly_schema['node_type'] == 'fragment_node':
+        return BudgetedFragmentNode(assembly_schema['name'],
+                                    [build_indexed_assembly(i) for i in assembly_schema['children']],
+                                    assembly_schema['template'])
+    return build_assembly_from_dict(assembly_schema)
@@ -0,0 +1,163 @@
+import csv
+import time
+import uuid
+import zlib
+import orjson
+import sqlite3
+import threading
+
+from .chem_imports import *
+from .chem_cache import LRUCache
+
+def read_library_file(path):
+    '''
+    reads building blocks from a local file as `[{'input' : smiles, 'data' : data}]`. `.csv`
+    files need a `smiles` column, other columns are kept as data. Other files are read as
+    SMILES files, with an optional name after the SMILES kept as `data['id']`
+    '''
+    inputs = []
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                smile = row.pop('smiles')
+                inputs.append({'input' : smile, 'data' : row})
+        else:
+            for line in f:
+                parts = line.split(maxsplit=1)
+                if parts:
+                    data = {'id' : parts[1].strip()} if len(parts) > 1 else {}
+                    inputs.append({'input' : parts[0], 'data' : data})
+    return inputs
+
+def build_library_columns(molecules, synthon_values):
+    '''
+    builds the stored form of a library from valid, deduplicated `molecules` and their
+    `[synthons, reaction_tags]` values (by canonical SMILES). Synthons are stored as columns
+    with the index of their parent molecule, deduplicated as `process_inputs` does
+    '''
+    synthons = []
+    for i, molecule in enumerate(molecules):
+        value = synthon_values[molecule.smile]
+        if value is not False:
+            synthon_smiles, reaction_tags = value
+            synthons += [(synthon_smiles[j], reaction_tags[j], i) for j in range(len(synthon_smiles))]
+    synthons = deduplicate_list(synthons, key_func=lambda x: x[0])
+
+    return {
+        'smiles' : [i.smile for i in molecules],
+        'data' : [i.data for i in molecules],
+        'synthons' : [i[0] for i in synthons],
+        'reaction_tags' : [i[1] for i in synthons],
+        'parents' : [i[2] for i in synthons]
+    }
+
+class BuildingBlockLibrary():
+    '''
+    a registered building block library. Molecules and synthons are built once from the
+    stored columns and shared by every assembly that references the library, so they must
+    not be modified
+    '''
+    def __init__(self, info, columns):
+        self.info = info
+        molecules = [Molecule(smile, data=data) for smile, data in zip(columns['smiles'], columns['data'])]
+        self.synthons = [Synthon(smile, tags, [molecules[parent]]) for smile, tags, parent
+                         in zip(columns['synthons'], columns['reaction_tags'], columns['parents'])]
+        self.n_func = [i.recon_smile.count(':') for i in self.synthons]
+        self.tag_sets = [set(i) for i in columns['reaction_tags']]
+
+    def select(self, reaction_tags=None, n_func=None, data=None):
+        '''
+        synthons matching every given filter: any of `reaction_tags`, a functionality count
+        in `n_func` and parent molecule data containing the items of `data`
+        '''
+        reaction_tags = set(reaction_tags) if reaction_tags else None
+        n_func = set(n_func) if n_func else None
+        outputs = []
+        for i, synthon in enumerate(self.synthons):
+            if reaction_tags and not (self.tag_sets[i] & reaction_tags):
+                continue
+            if n_func and (self.n_func[i] not in n_func):
+                continue
+            if data:
+                parent_data = synthon.data['parents'][0].data
+                if any(parent_data.get(k) != v for k,v in data.items()):
+                    continue
+            outputs.append(synthon)
+        return outputs
+
+class LibraryRegistry():
+    '''
+    SQLite store of building block libraries, shared by every process that opens the same
+    `path`. Each library is stored as one compressed row of columns. Up to `cache_size`
+    libraries are kept loaded in memory
+    '''
+    def __init__(self, path, cache_size):
+        self.path = path
+        self.loaded = LRUCache(cache_size)
+        self.local = threading.local()
+
+    def connect(self):
+        # sqlite connections can not be shared between threads, so each thread opens its own
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS libraries (
+                                library_id TEXT PRIMARY KEY,
+                                name TEXT NOT NULL,
+                                created REAL NOT NULL,
+                                n_inputs INTEGER NOT NULL,
+                                n_molecules INTEGER NOT NULL,
+                                n_synthons INTEGER NOT NULL,
+                                columns BLOB NOT NULL)''')
+            conn.commit()
+            self.local.conn = conn
+        return conn
+
+    def add(self, name, n_inputs, columns):
+        info = {
+            'library_id' : uuid.uuid4().hex,
+            'name' : name,
+            'created' : time.time(),
+            'n_inputs' : n_inputs,
+            'n_molecules' : len(columns['smiles']),
+            'n_synthons' : len(columns['synthons'])
+        }
+        conn = self.connect()
+        with conn:
+            conn.execute('INSERT INTO libraries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         tuple(info.values()) + (zlib.compress(orjson.dumps(columns)),))
+        self.loaded.put(info['library_id'], BuildingBlockLibrary(info, columns))
+        return info
+
+    def info(self, library_id):
+        row = self.connect().execute('SELECT library_id, name, created, n_inputs, n_molecules, n_synthons '
+                                     'FROM libraries WHERE library_id = ?', (library_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['library_id', 'name', 'created', 'n_inputs', 'n_molecules', 'n_synthons'], row))
+
+    def get(self, library_id):
+        'returns the loaded `BuildingBlockLibrary`, or `None` if it is not registered'
+        library = self.loaded.get(library_id)
+        if library is None:
+            row = self.connect().execute('SELECT columns FROM libraries WHERE library_id = ?',
+                                         (library_id,)).fetchone()
+            if row is None:
+                return None
+            library = BuildingBlockLibrary(self.info(library_id), orjson.loads(zlib.decompress(row[0])))
+            self.loaded.put(library_id, library)
+        return library
+
+    def list(self, skip=0, limit=100):
+        rows = self.connect().execute('SELECT library_id FROM libraries ORDER BY created DESC LIMIT ? OFFSET ?',
+                                      (limit, skip)).fetchall()
+        return [self.info(library_id) for library_id, in rows]
+
+    def delete(self, library_id):
+        conn = self.connect()
+        with conn:
+            conn.execute('DELETE FROM libraries WHERE library_id = ?', (library_id,))
+        with self.loaded.lock:
+            self.loaded.items.pop(library_id, None)
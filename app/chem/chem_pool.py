@@ -0,0 +1,115 @@
+import atexit
+import threading
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# worker processes are started with `spawn` so they never inherit the server's
+# event loop or thread state. Workers are long lived and shared between requests
+_WORKER_POOL = None
+_WORKER_POOL_SIZE = 0
+_WORKER_POOL_LOCK = threading.Lock()
+
+def get_worker_pool(n_workers):
+    global _WORKER_POOL, _WORKER_POOL_SIZE
+
+    with _WORKER_POOL_LOCK:
+        if (_WORKER_POOL is None) or (_WORKER_POOL_SIZE != n_workers):
+            if _WORKER_POOL is not None:
+                # other requests may still be using the old pool. Their submitted 
+                # chunks finish before its workers exit
+                _WORKER_POOL.shutdown(wait=False)
+
+            _WORKER_POOL = ProcessPoolExecutor(max_workers=n_workers,
+                                               mp_context=multiprocessing.get_context('spawn'))
+            _WORKER_POOL_SIZE = n_workers
+
+        return _WORKER_POOL
+
+def shutdown_worker_pool(pool=None):
+    '''
+    shuts down the worker pool and cancels its pending chunks. If `pool` is given, 
+    only shuts down if it is still the current pool
+    '''
+    global _WORKER_POOL, _WORKER_POOL_SIZE
+
+    with _WORKER_POOL_LOCK:
+        if (pool is not None) and (pool is not _WORKER_POOL):
+            return
+
+        if _WORKER_POOL is not None:
+            _WORKER_POOL.shutdown(wait=False, cancel_futures=True)
+
+        _WORKER_POOL = None
+        _WORKER_POOL_SIZE = 0
+
+def chunk_list(inputs, chunksize):
+    return [(i, inputs[i:i+chunksize]) for i in range(0, len(inputs), chunksize)]
+
+def use_worker_pool(n_inputs, n_workers, chunksize):
+    return (n_workers is not None) and (n_workers > 1) and (n_inputs > chunksize)
+
+def submit_chunks(chunk_func, inputs, args, n_workers, chunksize):
+    pool = get_worker_pool(n_workers)
+    try:
+        futures = [pool.submit(chunk_func, start_index, chunk, *args)
+                   for start_index, chunk in chunk_list(inputs, chunksize)]
+        return [f.result() for f in futures]
+    except BrokenProcessPool:
+        # a worker died (killed or crashed). Drop the pool so the next call starts a new one
+        shutdown_worker_pool(pool)
+        raise
+
+def map_chunks(chunk_func, inputs, args, n_workers, chunksize):
+    '''
+    runs `chunk_func(start_index, chunk, *args)` over `chunksize` chunks of `inputs` on the 
+    worker pool, or over all inputs in the current process if the pool is not needed. 
+    Returns `(outputs, pooled)` with outputs in input order
+    '''
+    if use_worker_pool(len(inputs), n_workers, chunksize):
+        try:
+            outputs = submit_chunks(chunk_func, inputs, args, n_workers, chunksize)
+        except BrokenProcessPool:
+            # retry once on a new pool. Inputs that crash a worker again raise
+            outputs = submit_chunks(chunk_func, inputs, args, n_workers, chunksize)
+        return outputs, True
+
+    return [chunk_func(0, inputs, *args)], False
+
+def iter_chunks(chunk_func, inputs, args, n_workers, chunksize, max_pending=None):
+    '''
+    generator version of `map_chunks` that yields `(output, pooled)` for each chunk in input 
+    order. At most `max_pending` chunks (default `2 * n_workers`) are queued on the worker pool 
+    at once, and queued chunks are cancelled when the generator is closed, so callers can stop 
+    early without evaluating the remaining inputs
+    '''
+    chunks = chunk_list(inputs, chunksize)
+
+    if not use_worker_pool(len(inputs), n_workers, chunksize):
+        for start_index, chunk in chunks:
+            yield chunk_func(start_index, chunk, *args), False
+        return
+
+    max_pending = max_pending or 2 * n_workers
+    pool = get_worker_pool(n_workers)
+    pending = deque()
+    next_chunk = 0
+    try:
+        while pending or (next_chunk < len(chunks)):
+            while (next_chunk < len(chunks)) and (len(pending) < max_pending):
+                start_index, chunk = chunks[next_chunk]
+                pending.append(pool.submit(chunk_func, start_index, chunk, *args))
+                next_chunk += 1
+
+            yield pending.popleft().result(), True
+
+    except BrokenProcessPool:
+        shutdown_worker_pool(pool)
+        raise
+
+    finally:
+        for future in pending:
+            future.cancel()
+
+atexit.register(shutdown_worker_pool)
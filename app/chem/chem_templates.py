@@ -1,8 +1,18 @@
+import json
 import time
+import base64
+import random
 import logging
+import threading
+from functools import partial
+import numpy as np
 logger = logging.getLogger(__name__)
 
 from .chem_imports import *
+from .chem_pool import map_chunks, iter_chunks
+from .chem_cache import LRUCache, ResultStore, canonical_hash
+from ..config import CONFIG
+from ..metrics import REGISTRY, PARSE_SECONDS, FILTER_SECONDS
 
 
 def range_check(range_dict):
@@ -62,28 +72,74 @@ def strip_template(template_config):
 
     return output 
 
+def call_on_mol(func, context):
+    return func(context.mol)
+
 class PropertyFilter(RangeFunctionFilter):
     def __init__(self, prop_func, prop_name, min_val=None, max_val=None):
         super().__init__(prop_func, prop_name, min_val, max_val)
+        if prop_func in CONTEXT_PROP_FUNCS:
+            self.context_func = prop_func
+        else:
+            self.context_func = partial(call_on_mol, prop_func)
         
     def __call__(self, molecule):
-        value = self.func(molecule.mol)
+        value = get_mol_context(molecule).get(('property', self.name), self.context_func)
         result = self.min_val <= value <= self.max_val
         data = {'min_val' : self.min_val, 'max_val' : self.max_val, 'value' : value}
         return FilterResult(result, self.name, data)
 
+class MergedCatalog():
+    '''
+    one `FilterCatalog` holding every catalog in `catalog_names`, so a molecule is 
+    matched against all of them in a single pass. Catalogs whose filter sets are already 
+    covered (ie `PAINS_A` when `PAINS` is included) are only added once
+    '''
+    def __init__(self, catalog_names):
+        self.catalog_names = sorted(catalog_names)
+        self.key = ','.join(self.catalog_names)
+
+        params = FilterCatalogParams()
+        filter_sets = set()
+        for name in sorted(self.catalog_names, key=lambda x: len(CATALOG_FILTER_SETS[x]), reverse=True):
+            if not CATALOG_FILTER_SETS[name].issubset(filter_sets):
+                params.AddCatalog(CATALOG_PARAMS[name])
+                filter_sets.update(CATALOG_FILTER_SETS[name])
+
+        self.filter_catalog = FilterCatalog(params)
+
+    def match(self, context):
+        'returns `{catalog_name : has_match}` for `context.mol`'
+        matched = {i.GetProp('FilterSet') for i in self.filter_catalog.GetMatches(context.mol)}
+        return {name : bool(matched & CATALOG_FILTER_SETS[name]) for name in self.catalog_names}
+
+MERGED_CATALOG_CACHE = LRUCache(2**len(CATALOG_PARAMS))
+
+def get_merged_catalog(catalog_names):
+    key = ','.join(sorted(catalog_names))
+    return MERGED_CATALOG_CACHE.get_or_compute(key, lambda: MergedCatalog(catalog_names))
+
 class RDCatalogFilter(Filter):
-    def __init__(self, filter_catalog, name):
-        self.filter_catalog = filter_catalog
+    def __init__(self, merged_catalog, name):
+        self.merged_catalog = merged_catalog
         self.name = name
         
     def __call__(self, molecule):
-        has_match = self.filter_catalog.HasMatch(molecule.mol)
+        # the first catalog filter to run matches every catalog in the template, 
+        # the rest read their result from the molecule context
+        hits = get_mol_context(molecule).get(('catalog', self.merged_catalog.key), self.merged_catalog.match)
+        has_match = hits[self.name]
         result = not has_match
         data = {'include' : True, 'has_match' : has_match}
         return FilterResult(result, self.name, data)
 
 
+class ContextSmartsFilter(SimpleSmartsFilter):
+    def get_substruct_matches(self, molecule):
+        return get_mol_context(molecule).get(('smarts', self.smarts), 
+                                             lambda context: context.mol.GetSubstructMatches(self.smarts_mol))
+
+
 def build_property_filters(property_filter_dict):
     filters = []
     for prop_name, range_dict in property_filter_dict.items():
@@ -96,12 +152,18 @@ def build_property_filters(property_filter_dict):
     return filters 
 
 def build_catalog_filters(catalog_filter_dict):
+    catalog_names = [catalog_name for catalog_name, include_dict in catalog_filter_dict.items()
+                     if validate_catalog_config(catalog_name, include_dict)]
+    if not catalog_names:
+        return []
+
+    merged_catalog = get_merged_catalog(catalog_names)
+
     filters = []
-    for catalog_name, include_dict in catalog_filter_dict.items():
-        if validate_catalog_config(catalog_name, include_dict):
-            f = RDCatalogFilter(FILTER_CATALOGUES.get(catalog_name), catalog_name)
-            f.filter_type = 'catalog_filters'
-            filters.append(f)
+    for catalog_name in catalog_names:
+        f = RDCatalogFilter(merged_catalog, catalog_name)
+        f.filter_type = 'catalog_filters'
+        filters.append(f)
 
     return filters 
 
@@ -109,8 +171,8 @@ def build_smarts_filters(smarts_filter_dict):
     filters = []
     for smarts_string, range_dict in smarts_filter_dict.items():
         if validate_smarts_config(smarts_string, range_dict):
-            f = SimpleSmartsFilter(smarts_string, smarts_string, 
-                                   min_val=range_dict['min_val'], max_val=range_dict['max_val'])
+            f = ContextSmartsFilter(smarts_string, smarts_string, 
+                                    min_val=range_dict['min_val'], max_val=range_dict['max_val'])
             f.filter_type = 'smarts_filters'
             filters.append(f)
 
@@ -123,15 +185,191 @@ def build_filters(template_config):
     filters += build_smarts_filters(template_config['smarts_filters'])
     return filters 
 
-def eval_query(query, index, filters, template_name, return_data=False):
-
+def filter_key(f):
+    return f'{f.filter_type}:{f.name}'
+
+class FilterStats():
+    def __init__(self, calls=0, rejections=0, total_time=0.0):
+        self.calls = calls
+        self.rejections = rejections
+        self.total_time = total_time
+
+    def record(self, elapsed, filter_result):
+        self.calls += 1
+        self.total_time += elapsed
+        if not filter_result:
+            self.rejections += 1
+
+    def score(self):
+        'rejections per millisecond of filter time. Unseen filters score highest so they get measured'
+        if self.calls == 0:
+            return float('inf')
+        return self.rejections / max(self.total_time * 1000, 1e-9)
+
+    def dump(self):
+        return {'calls' : self.calls, 'rejections' : self.rejections, 'total_time' : self.total_time}
+
+class FilterOrdering():
+    '''
+    tracks the cost and rejection rate of each filter during early-exit evaluation and 
+    periodically reorders filters so the most rejections per millisecond run first. 
+    A molecule passes only if every filter passes, so the order never changes the result.
+
+    Orderings are shared by every thread evaluating the template. Filters run outside 
+    the lock and each call's timings are recorded under it
+    '''
+    def __init__(self, filters, reorder_interval):
+        self.entries = [(f, filter_key(f), FilterStats()) for f in filters]
+        self.reorder_interval = reorder_interval
+        self.n_evals = 0
+        self.lock = threading.RLock()
+
+    @property
+    def filters(self):
+        return [f for f,_,_ in self.entries]
+
+    def evaluate(self, molecule):
+        filter_results = {}
+        timings = []
+        passed = True
+        for f, key, stats in self.entries:
+            start = time.perf_counter()
+            result = f(molecule)
+            timings.append((f, stats, time.perf_counter() - start, result.filter_result))
+            filter_results[key] = result
+
+            if not result.filter_result:
+                passed = False
+                break
+
+        FILTER_SECONDS.observe_many([(elapsed, (f.filter_type, f.name)) for f, _, elapsed, _ in timings])
+
+        with self.lock:
+            for _, stats, elapsed, filter_result in timings:
+                stats.record(elapsed, filter_result)
+
+            self.n_evals += 1
+            if self.reorder_interval and (self.n_evals % self.reorder_interval == 0):
+                self.reorder()
+
+        return passed, filter_results
+
+    def reorder(self):
+        with self.lock:
+            self.entries = sorted(self.entries, key=lambda x: x[2].score(), reverse=True)
+
+    def snapshot(self):
+        with self.lock:
+            return {key : stats.dump() for _, key, stats in self.entries}
+
+    def merge(self, stats_delta):
+        with self.lock:
+            for _, key, stats in self.entries:
+                delta = stats_delta.get(key)
+                if delta:
+                    stats.calls += delta['calls']
+                    stats.rejections += delta['rejections']
+                    stats.total_time += delta['total_time']
+            self.reorder()
+
+    def dump(self):
+        with self.lock:
+            filter_stats = []
+            for f, key, stats in self.entries:
+                calls = stats.calls
+                filter_stats.append({
+                    'filter_type' : f.filter_type,
+                    'name' : f.name,
+                    'calls' : calls,
+                    'rejections' : stats.rejections,
+                    'rejection_rate' : (stats.rejections / calls) if calls else None,
+                    'mean_time_ms' : (stats.total_time * 1000 / calls) if calls else None,
+                    'rejections_per_ms' : stats.score() if calls else None
+                })
+            return {'n_evals' : self.n_evals, 'filters' : filter_stats}
+
+def stats_delta(before, after):
+    delta = {}
+    for key, stats in after.items():
+        prev = before.get(key, {'calls' : 0, 'rejections' : 0, 'total_time' : 0.0})
+        delta[key] = {k : stats[k] - prev[k] for k in stats.keys()}
+    return delta 
+
+class OrderedTemplate(Template):
+    'Template that uses a `FilterOrdering` for early-exit screens'
+    def __init__(self, filters, ordering):
+        super().__init__(filters)
+        self.ordering = ordering
+        self.filter_keys = [filter_key(f) for f in filters]
+
+    def __call__(self, molecule, early_exit=True):
+        # assembly pools hold molecules for the whole request, so the filter context is 
+        # dropped once the template has run
+        try:
+            return self.evaluate(molecule, early_exit)
+        finally:
+            clear_mol_context(molecule)
+
+    def evaluate(self, molecule, early_exit):
+        if not early_exit:
+            return super().__call__(molecule, early_exit=False)
+
+        passed, filter_results = self.ordering.evaluate(molecule)
+        results = self._empty_result()
+        for i, key in enumerate(self.filter_keys):
+            if key in filter_results:
+                results.filter_results[i] = filter_results[key].filter_result
+                results.filter_data[i] = filter_results[key]
+
+        results.result = passed
+        return results 
+
+class CompiledTemplate():
+    def __init__(self, template_hash, filters):
+        self.template_hash = template_hash
+        self.filters = filters
+        self.ordering = FilterOrdering(filters, CONFIG.FILTER_REORDER_INTERVAL)
+
+    def to_template(self):
+        return OrderedTemplate(self.filters, self.ordering)
+
+    def dump_stats(self):
+        output = {'template_hash' : self.template_hash}
+        output.update(self.ordering.dump())
+        return output 
+
+TEMPLATE_CACHE = LRUCache(CONFIG.TEMPLATE_CACHE_SIZE)
+
+if CONFIG.RESULT_CACHE_PATH:
+    RESULT_STORE = ResultStore(CONFIG.RESULT_CACHE_PATH, CONFIG.RESULT_CACHE_MAX_ROWS)
+else:
+    RESULT_STORE = None
+
+def canonical_template(template_config):
+    '''
+    strips unused filters without validating them. The template name does not 
+    change the compiled filters and is left out
+    '''
     output = {
-        'input' : query,
-        'index' : index,
-        'result' : True,
+        'property_filters' : {k:v for k,v in template_config['property_filters'].items() 
+                                if (v.get('min_val') is not None) or (v.get('max_val') is not None)},
+        'catalog_filters' : {k:v for k,v in template_config['catalog_filters'].items() if v.get('include')},
+        'smarts_filters' : {k:v for k,v in template_config['smarts_filters'].items() 
+                                if (v.get('min_val') is not None) or (v.get('max_val') is not None)},
     }
+    return output 
+
+def template_hash(template_config):
+    return canonical_hash(canonical_template(template_config))
+
+def compile_template(template_config):
+    key = template_hash(template_config)
+    return TEMPLATE_CACHE.get_or_compute(key, lambda: CompiledTemplate(key, build_filters(template_config)))
+
+def eval_molecule(molecule, filters, template_name, return_data=False, ordering=None):
+    'evaluates a parsed `molecule` against `filters`, returns `(result, template_data)`'
 
-    molecule = Molecule(query)
+    output = True
 
     if return_data:
         template_data = {
@@ -144,45 +382,380 @@ def eval_query(query, index, filters, template_name, return_data=False):
     else:
         template_data = None 
 
-    if molecule.valid:
+    if molecule.valid and (not return_data) and (ordering is not None):
+        output, _ = ordering.evaluate(molecule)
+
+    elif molecule.valid:
+        timings = []
         for f in filters:
+            start = time.perf_counter()
             result = f(molecule)
-            output['result'] = output['result'] and result.filter_result
+            timings.append((time.perf_counter() - start, (f.filter_type, f.name)))
+            output = output and result.filter_result
 
             if return_data:
                 filter_data = result.filter_data
                 filter_data['result'] = result.filter_result
                 template_data[f.filter_type][f.name] = filter_data
 
-            if (not return_data) and (not output['result']):
+            if (not return_data) and (not output):
                 # if not returning data, early exit on first failed filter
-                output['template_data'] = None
-                return output 
+                break
+
+        FILTER_SECONDS.observe_many(timings)
+
+    else:
+        output = False
+
+    return output, template_data 
+
+def parse_molecules(inputs):
+    molecules = []
+    timings = []
+    for query in inputs:
+        start = time.perf_counter()
+        molecules.append(Molecule(query))
+        timings.append((time.perf_counter() - start, ()))
+    PARSE_SECONDS.observe_many(timings)
+    return molecules 
+
+def query_output(query, index, result, template_data):
+    return {
+        'input' : query,
+        'index' : index,
+        'result' : result,
+        'template_data' : template_data
+    }
 
+def eval_query(query, index, filters, template_name, return_data=False, ordering=None):
+
+    molecule = parse_molecules([query])[0]
+    result, template_data = eval_molecule(molecule, filters, template_name, 
+                                          return_data=return_data, ordering=ordering)
+    clear_mol_context(molecule)
+
+    return query_output(query, index, result, template_data)
+
+def eval_unique_molecules(molecules, compiled, template_name, return_data=False):
+    'evaluates `molecules` with unique canonical SMILES, returns `{smiles : (result, template_data)}`'
+    evaluated = {}
+    for molecule in molecules:
+        evaluated[molecule.smile] = eval_molecule(molecule, compiled.filters, template_name, 
+                                                  return_data=return_data, ordering=compiled.ordering)
+        clear_mol_context(molecule)
+    return evaluated 
+
+def eval_unique_molecules_stored(molecules, compiled, template_name, store, return_data=False):
+    '''
+    `eval_unique_molecules` that reads results for known structures from `store` and 
+    writes back the new ones
+    '''
+    stored = store.get_many(compiled.template_hash, [i.smile for i in molecules], return_data)
+
+    evaluated = {}
+    for smile, (result, template_data) in stored.items():
+        if template_data is not None:
+            template_data = json.loads(template_data)
+            template_data['template_name'] = template_name
+        evaluated[smile] = (result, template_data)
+
+    new_molecules = [i for i in molecules if i.smile not in stored]
+    new_results = eval_unique_molecules(new_molecules, compiled, template_name, return_data=return_data)
+    evaluated.update(new_results)
+
+    new_rows = []
+    for smile, (result, template_data) in new_results.items():
+        if template_data is not None:
+            template_data = {k:v for k,v in template_data.items() if k != 'template_name'}
+        new_rows.append((smile, result, template_data))
+
+    store.put_many(compiled.template_hash, new_rows, list(stored.keys()))
+    return evaluated 
+
+def eval_chunk(start_index, inputs, template_config, return_data=False):
+    '''
+    evaluates `inputs` against `template_config`. Inputs with the same canonical SMILES are 
+    evaluated once and share the result. Returns 
+    `(results, stats_delta, store_counts, n_unique, metrics_delta)`
+    '''
+    # each worker process holds its own `TEMPLATE_CACHE`, so filter stats learned in 
+    # the worker are returned to be merged into the parent process. Result store 
+    # hits and misses and metrics are returned the same way
+    metrics_before = REGISTRY.snapshot()
+    compiled = compile_template(template_config)
+    template_name = template_config['template_name']
+    before = compiled.ordering.snapshot()
+
+    molecules = parse_molecules(inputs)
+    unique_molecules = {}
+    for molecule in molecules:
+        if molecule.valid:
+            unique_molecules.setdefault(molecule.smile, molecule)
+    unique_molecules = list(unique_molecules.values())
+
+    if RESULT_STORE is not None:
+        store_before = (RESULT_STORE.hits, RESULT_STORE.misses)
+        evaluated = eval_unique_molecules_stored(unique_molecules, compiled, template_name, 
+                                                 RESULT_STORE, return_data=return_data)
+        store_counts = (RESULT_STORE.hits - store_before[0], RESULT_STORE.misses - store_before[1])
     else:
-        output['result'] = False
+        evaluated = eval_unique_molecules(unique_molecules, compiled, template_name, return_data=return_data)
+        store_counts = (0, 0)
+
+    results = []
+    for index, (query, molecule) in enumerate(zip(inputs, molecules), start_index):
+        if molecule.valid:
+            result, template_data = evaluated[molecule.smile]
+        else:
+            result, template_data = eval_molecule(molecule, compiled.filters, template_name, 
+                                                  return_data=return_data)
+        results.append(query_output(query, index, result, template_data))
+
+    return (results, stats_delta(before, compiled.ordering.snapshot()), store_counts, 
+            len(unique_molecules), REGISTRY.delta(metrics_before))
+
+# per-molecule values reported for each filter type in the columnar format. The 
+# remaining filter data (ranges, `include`) is the same for every molecule
+FILTER_COLUMNS = {
+    'property_filters' : ['value', 'result'],
+    'catalog_filters' : ['has_match', 'result'],
+    'smarts_filters' : ['num_matches', 'result']
+}
+
+def pack_bits(flags):
+    'base64 encoded bitset of `flags`. Bit `i` is bit `i % 8` (least significant first) of byte `i // 8`'
+    return base64.b64encode(np.packbits(np.array(flags, dtype=bool), bitorder='little').tobytes()).decode()
+
+def filter_columns(results, filter_type, name):
+    columns = {k : [] for k in FILTER_COLUMNS[filter_type]}
+    filter_config = {}
+    for result in results:
+        filter_data = result['template_data'][filter_type].get(name)
+        if filter_data is None:
+            # invalid inputs have no filter data
+            for column in columns.values():
+                column.append(None)
+        else:
+            for k, column in columns.items():
+                column.append(filter_data[k])
+            if not filter_config:
+                filter_config = {k:v for k,v in filter_data.items() if k not in columns}
+
+    return {**filter_config, **columns}
+
+def format_results(results, template_config, result_format, return_data=False, subset=False):
+    '''
+    converts `results` from `run_request` to a compact `result_format`: 
+        `indices` - indices of passing inputs
+        `bitset` - pass/fail of each input as a `pack_bits` bitset
+        `columnar` - one list per field. With `return_data`, one list per filter value and result
+
+    `subset` results hold some of the request inputs (ie from `limit` or `sample_size`). Their 
+    `bitset` and `columnar` outputs include the input `index` of each result
+    '''
+    output = {'format' : result_format, 'n_inputs' : len(results)}
+
+    if subset and (result_format in ('bitset', 'columnar')):
+        output['index'] = [result['index'] for result in results]
+
+    if result_format == 'indices':
+        output['indices'] = [result['index'] for result in results if result['result']]
+
+    elif result_format == 'bitset':
+        output['bitset'] = pack_bits([result['result'] for result in results])
+
+    elif result_format == 'columnar':
+        output['result'] = [result['result'] for result in results]
+        if return_data:
+            output['valid_input'] = [result['template_data']['valid_input'] for result in results]
+            output['filters'] = {k : {} for k in FILTER_COLUMNS.keys()}
+            for f in compile_template(template_config).filters:
+                output['filters'][f.filter_type][f.name] = filter_columns(results, f.filter_type, f.name)
 
-    output['template_data'] = template_data 
+    else:
+        raise ValueError(f'result format {result_format} not supported')
 
     return output 
 
-def run_request(inputs, template_config, return_data=False):
+def run_request(inputs, template_config, return_data=False, n_workers=1, chunksize=1000, result_format='rows'):
+    '''
+    evaluates `inputs` against `template_config`, returns `(results, n_unique)`. Each distinct 
+    input string is sent to one chunk and structures are deduplicated by canonical SMILES 
+    within a chunk. `n_unique` counts the valid structures evaluated. Results are one dict 
+    per input, or a `format_results` dict for other `result_format`s
+    '''
     start = time.time()
     print(f'starting eval of {len(inputs)} inputs')
 
-    filters = build_filters(template_config)
+    compiled = compile_template(template_config)
+    unique_inputs = list(dict.fromkeys(inputs))
+    outputs, pooled = map_chunks(eval_chunk, unique_inputs, (template_config, return_data), n_workers, chunksize)
+
+    input_results = {}
+    n_unique = 0
+    for chunk_results, chunk_stats, store_counts, chunk_unique, metrics_delta in outputs:
+        for result in chunk_results:
+            input_results[result['input']] = result
+        n_unique += chunk_unique
+        if pooled:
+            compiled.ordering.merge(chunk_stats)
+            REGISTRY.merge(metrics_delta)
+            if RESULT_STORE is not None:
+                RESULT_STORE.record(*store_counts)
 
     results = []
+    for index, query in enumerate(inputs):
+        result = input_results[query]
+        results.append(query_output(query, index, result['result'], result['template_data']))
 
-    for index, input in enumerate(inputs):
-        result = eval_query(input, 
-                            index, 
-                            filters, 
-                            template_config['template_name'], 
-                            return_data=return_data)
-        results.append(result)
+    if result_format != 'rows':
+        results = format_results(results, template_config, result_format, return_data=return_data)
 
     elapsed = time.time() - start 
     print(f'finished eval of {len(inputs)} inputs in {elapsed} seconds')
+    return results, n_unique
+
+def run_request_limit(inputs, template_config, limit, return_data=False, n_workers=1, chunksize=1000):
+    '''
+    evaluates `inputs` in chunks, in order, until `limit` inputs pass. Returns 
+    `(results, n_unique, n_screened)` where `results` are the first `limit` passing inputs 
+    and `n_screened` counts the inputs evaluated. Chunks still queued on the worker pool 
+    when the limit is reached are cancelled
+    '''
+    start = time.time()
+    print(f'starting eval of up to {len(inputs)} inputs for {limit} passes')
+
+    compiled = compile_template(template_config)
+    chunks = iter_chunks(eval_chunk, inputs, (template_config, return_data), n_workers, chunksize)
+
+    results = []
+    n_unique = 0
+    n_screened = 0
+    try:
+        for (chunk_results, chunk_stats, store_counts, chunk_unique, metrics_delta), pooled in chunks:
+            if pooled:
+                compiled.ordering.merge(chunk_stats)
+                REGISTRY.merge(metrics_delta)
+                if RESULT_STORE is not None:
+                    RESULT_STORE.record(*store_counts)
+
+            n_unique += chunk_unique
+            n_screened += len(chunk_results)
+            results += [i for i in chunk_results if i['result']]
+            if len(results) >= limit:
+                break
+    finally:
+        chunks.close()
+
+    elapsed = time.time() - start 
+    print(f'finished eval of {n_screened} inputs in {elapsed} seconds')
+    return results[:limit], n_unique, n_screened
+
+def sample_indices(n_inputs, sample_size, seed):
+    'sorted indices of a `seed`ed random sample of `sample_size` inputs'
+    rng = random.Random(seed)
+    return sorted(rng.sample(range(n_inputs), min(sample_size, n_inputs)))
+
+def run_request_sample(inputs, template_config, sample_size, seed=0, return_data=False, n_workers=1, chunksize=1000):
+    '''
+    evaluates a `seed`ed random sample of `sample_size` inputs. Returns `(results, n_unique, pass_rate)` 
+    where `results` hold the index of each sampled input in `inputs`
+    '''
+    indices = sample_indices(len(inputs), sample_size, seed)
+    results, n_unique = run_request([inputs[i] for i in indices], template_config, return_data=return_data, 
+                                    n_workers=n_workers, chunksize=chunksize)
+    for result, index in zip(results, indices):
+        result['index'] = index
+
+    pass_rate = (sum(i['result'] for i in results) / len(results)) if results else None
+    return results, n_unique, pass_rate
+
+def run_screen(inputs, template_config, return_data=False, n_workers=1, chunksize=1000, result_format='rows', 
+               limit=None, sample_size=None, seed=0):
+    '''
+    evaluates `inputs` with `run_request`, or with `run_request_limit` if `limit` is set or 
+    `run_request_sample` if `sample_size` is set. Returns `(results, screen_info)` where 
+    `screen_info` holds `n_unique` and `n_screened` or `n_sampled` and `pass_rate`
+    '''
+    if (limit is not None) and (sample_size is not None):
+        raise ValueError('`limit` and `sample_size` can not be used together')
+
+    if limit is not None:
+        results, n_unique, n_screened = run_request_limit(inputs, template_config, limit, return_data=return_data, 
+                                                          n_workers=n_workers, chunksize=chunksize)
+        screen_info = {'n_unique' : n_unique, 'n_screened' : n_screened}
+
+    elif sample_size is not None:
+        results, n_unique, pass_rate = run_request_sample(inputs, template_config, sample_size, seed=seed, 
+                                                          return_data=return_data, n_workers=n_workers, 
+                                                          chunksize=chunksize)
+        screen_info = {'n_unique' : n_unique, 'n_sampled' : len(results), 'pass_rate' : pass_rate}
+
+    else:
+        results, n_unique = run_request(inputs, template_config, return_data=return_data, n_workers=n_workers, 
+                                        chunksize=chunksize, result_format=result_format)
+        return results, {'n_unique' : n_unique}
+
+    if result_format != 'rows':
+        results = format_results(results, template_config, result_format, return_data=return_data, subset=True)
+
+    return results, screen_info
+
+def eval_query_multi(query, index, compiled_templates, template_names, return_data=False):
+    # the molecule is parsed once and its `MolContext` is shared by every template, 
+    # so properties, catalogs and SMARTS used by several templates are computed once
+    molecule = parse_molecules([query])[0]
+
+    results = []
+    for compiled, template_name in zip(compiled_templates, template_names):
+        result, template_data = eval_molecule(molecule, compiled.filters, template_name, 
+                                              return_data=return_data, ordering=compiled.ordering)
+        results.append({'template_name' : template_name, 'result' : result, 'template_data' : template_data})
+
+    # the context is only dropped after every template has used it
+    clear_mol_context(molecule)
+
+    output = {
+        'input' : query,
+        'index' : index,
+        'valid_input' : molecule.valid,
+        'results' : results
+    }
+
+    return output 
+
+def eval_multi_chunk(start_index, inputs, template_configs, return_data=False):
+    metrics_before = REGISTRY.snapshot()
+    compiled_templates = [compile_template(i) for i in template_configs]
+    template_names = [i['template_name'] for i in template_configs]
+    before = [i.ordering.snapshot() for i in compiled_templates]
+
+    results = []
+    for index, input in enumerate(inputs, start_index):
+        result = eval_query_multi(input, index, compiled_templates, template_names, return_data=return_data)
+        results.append(result)
+
+    deltas = [stats_delta(before[i], compiled_templates[i].ordering.snapshot()) 
+              for i in range(len(compiled_templates))]
+
+    return results, deltas, REGISTRY.delta(metrics_before)
+
+def run_multi_request(inputs, template_configs, return_data=False, n_workers=1, chunksize=1000):
+    start = time.time()
+    print(f'starting eval of {len(inputs)} inputs against {len(template_configs)} templates')
+
+    compiled_templates = [compile_template(i) for i in template_configs]
+    outputs, pooled = map_chunks(eval_multi_chunk, inputs, (template_configs, return_data), n_workers, chunksize)
+
+    results = []
+    for chunk_results, chunk_stats, metrics_delta in outputs:
+        results += chunk_results
+        if pooled:
+            for compiled, stats in zip(compiled_templates, chunk_stats):
+                compiled.ordering.merge(stats)
+            REGISTRY.merge(metrics_delta)
+
+    elapsed = time.time() - start 
+    print(f'finished eval of {len(inputs)} inputs against {len(template_configs)} templates in {elapsed} seconds')
     return results 
 
@@ -6,4 +6,42 @@ class Config(BaseSettings):
     MONGO_URI: Optional[str] = os.environ.get('MONGO_URI', None)
     MONGO_DB_NAME: Optional[str] = os.environ.get('MONGO_DB_NAME', None)
 
-CONFIG = Config()
\ No newline at end of file
+    EVAL_WORKERS: int = int(os.environ.get('EVAL_WORKERS', 1))
+    EVAL_CHUNKSIZE: int = int(os.environ.get('EVAL_CHUNKSIZE', 1000))
+
+    TEMPLATE_CACHE_SIZE: int = int(os.environ.get('TEMPLATE_CACHE_SIZE', 256))
+    FILTER_REORDER_INTERVAL: int = int(os.environ.get('FILTER_REORDER_INTERVAL', 1000))
+
+    RESULT_CACHE_PATH: Optional[str] = os.environ.get('RESULT_CACHE_PATH', None)
+    RESULT_CACHE_MAX_ROWS: int = int(os.environ.get('RESULT_CACHE_MAX_ROWS', 10_000_000))
+
+    EXECUTOR_WORKERS: int = int(os.environ.get('EXECUTOR_WORKERS', 4))
+    EXECUTOR_MAX_QUEUE: int = int(os.environ.get('EXECUTOR_MAX_QUEUE', 64))
+    ASSEMBLY_EXECUTOR_TYPE: str = os.environ.get('ASSEMBLY_EXECUTOR_TYPE', 'thread')
+
+    WARMUP_COMPONENTS: str = os.environ.get('WARMUP_COMPONENTS', '')
+
+    PROFILING_ENABLED: bool = os.environ.get('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILE_STORE_SIZE: int = int(os.environ.get('PROFILE_STORE_SIZE', 32))
+    PROFILE_DIR: Optional[str] = os.environ.get('PROFILE_DIR', None)
+
+    SYNTHON_CACHE_SIZE: int = int(os.environ.get('SYNTHON_CACHE_SIZE', 100_000))
+    SYNTHON_CACHE_PATH: Optional[str] = os.environ.get('SYNTHON_CACHE_PATH', None)
+    SYNTHON_CHUNKSIZE: int = int(os.environ.get('SYNTHON_CHUNKSIZE', 200))
+
+    ASSEMBLY_SCHEMA_CACHE_SIZE: int = int(os.environ.get('ASSEMBLY_SCHEMA_CACHE_SIZE', 128))
+    ASSEMBLY_BATCH_SIZE: int = int(os.environ.get('ASSEMBLY_BATCH_SIZE', 1000))
+    ASSEMBLY_MAX_PRODUCTS: int = int(os.environ.get('ASSEMBLY_MAX_PRODUCTS', 1_000_000))
+    ASSEMBLY_MIN_SHARD_SIZE: int = int(os.environ.get('ASSEMBLY_MIN_SHARD_SIZE', 10))
+    ASSEMBLY_STREAM_DEDUPE_SIZE: int = int(os.environ.get('ASSEMBLY_STREAM_DEDUPE_SIZE', 1_000_000))
+
+    LIBRARY_STORE_PATH: str = os.environ.get('LIBRARY_STORE_PATH', 'libraries.db')
+    LIBRARY_CACHE_SIZE: int = int(os.environ.get('LIBRARY_CACHE_SIZE', 8))
+    LIBRARY_DIR: Optional[str] = os.environ.get('LIBRARY_DIR', None)
+
+    JOB_STORE_PATH: str = os.environ.get('JOB_STORE_PATH', 'jobs.db')
+    JOB_WORKERS: int = int(os.environ.get('JOB_WORKERS', 1))
+    JOB_CHUNKSIZE: int = int(os.environ.get('JOB_CHUNKSIZE', 10000))
+    JOB_POLL_INTERVAL: float = float(os.environ.get('JOB_POLL_INTERVAL', 5))
+
+CONFIG = Config()
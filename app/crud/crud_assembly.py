@@ -1,21 +1,197 @@
-import asyncio
+import os
+import base64
+import orjson
+import logging
 from fastapi import HTTPException
+from typing import Optional
+logger = logging.getLogger(__name__)
 
 from ..schemas import schemas_assembly as schemas
-from ..chem import chem_assembly, chem_templates
+from ..chem import chem_assembly, chem_templates, chem_library
+from ..chem.chem_cache import canonical_hash, BoundedHashSet
+from ..config import CONFIG
+from ..executor import ASSEMBLY_EXECUTOR
+from .crud_functional import RequestStreamingResponse
+
+def synthon_workers():
+    # calls on a process executor already run outside the server process, so only 
+    # thread executors fan synthon computation out to the evaluation worker pool
+    return CONFIG.EVAL_WORKERS if ASSEMBLY_EXECUTOR.executor_type == 'thread' else 1
+
+ASSEMBLY_HEADERS = {
+    'n_combinations' : 'X-Combinations-Attempted',
+    'n_products' : 'X-Products-Found',
+    'n_space' : 'X-Combination-Space',
+    'yield' : 'X-Product-Yield',
+    'cursor' : 'X-Assembly-Cursor'
+}
+
+def encode_cursor(request_hash, position):
+    cursor = orjson.dumps({'request' : request_hash, 'position' : position})
+    return base64.urlsafe_b64encode(cursor).decode()
+
+def decode_cursor(cursor, request_hash):
+    'the enumeration position of `cursor`. Cursors only resume the request they were returned for'
+    try:
+        cursor = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        position = int(cursor['position'])
+        cursor_hash = cursor['request']
+    except Exception:
+        raise HTTPException(status_code=422, detail='invalid assembly cursor')
+
+    if cursor_hash != request_hash:
+        raise HTTPException(status_code=422, detail='assembly cursor was returned for a different request')
+    return position
+
+def assembly_headers(summary, request_hash):
+    info = {'n_combinations' : summary['n_combinations'], 'n_products' : summary['n_products']}
+    if summary['n_space'] is not None:
+        # sampled runs report the space they were drawn from and the fraction of draws that passed the node templates
+        info['n_space'] = summary['n_space']
+        info['yield'] = round(summary['n_products'] / summary['n_combinations'], 6) if summary['n_combinations'] else 0.0
+    if summary['next_position'] is not None:
+        info['cursor'] = encode_cursor(request_hash, summary['next_position'])
+    return {ASSEMBLY_HEADERS[k] : str(v) for k,v in info.items()}
+
+async def run_assembly(route, assemble_func, assembly_inputs, *args, batch_size: Optional[int]=None, 
+                       max_combinations: Optional[int]=None, max_products: Optional[int]=None, 
+                       cursor: Optional[str]=None, sort: bool=True, sample: Optional[int]=None, seed: int=0):
+    '''
+    runs `assemble_func(assembly_inputs, *args)` within the given enumeration budget, starting 
+    from `cursor`. With `sample`, combinations are drawn in a random order set by `seed` until 
+    `sample` products are found. Returns `(results, headers)`, with a cursor header if 
+    enumeration stopped early
+    '''
+    # the request is hashed before `assemble_func` runs, as some assembly functions modify their inputs. 
+    # Sampled runs draw combinations in a different order, so their cursors are only valid for the same sample
+    sampling = [sample, seed] if sample else []
+    request_hash = canonical_hash([assemble_func.__name__, assembly_inputs, *args, *sampling])
+    start = decode_cursor(cursor, request_hash) if cursor else 0
+
+    results, summary = await ASSEMBLY_EXECUTOR.run(route, chem_assembly.assemble_page, assemble_func, 
+                                                   assembly_inputs, *args, n_workers=synthon_workers(),
+                                                   batch_size=batch_size, max_combinations=max_combinations,
+                                                   max_products=max_products, start=start, sort=sort,
+                                                   sample_size=sample, seed=seed)
+    return results, assembly_headers(summary, request_hash)
+
+def stream_assembly(route, assemble_func, assembly_inputs, *args, batch_size: Optional[int]=None):
+    '''
+    streams the products of `assemble_func(assembly_inputs, *args)` as NDJSON while the final 
+    node is enumerated. Products are deduplicated by their SMILES hash, up to 
+    `ASSEMBLY_STREAM_DEDUPE_SIZE` products, and are not sorted
+    '''
+    # capacity is checked once, before the response starts. The stream holds its 
+    # executor slot until the response ends
+    ASSEMBLY_EXECUTOR.reserve(route)
+    seen = BoundedHashSet(CONFIG.ASSEMBLY_STREAM_DEDUPE_SIZE)
+
+    def encode_new_products(results):
+        output = b''
+        for result in results:
+            if seen.add(result['result']):
+                output += orjson.dumps(result) + b'\n'
+        return output
+
+    async def thread_batches():
+        # the enumeration generator lives in the server process and is advanced one batch per call
+        batches = assemble_func(assembly_inputs, *args, n_workers=synthon_workers(), stream=True,
+                                budget=chem_assembly.assembly_budget(batch_size))
+        while True:
+            results = await ASSEMBLY_EXECUTOR.run_reserved(route, next, batches, None)
+            if results is None:
+                return
+            yield results
+
+    async def process_batches():
+        # generators can not be returned from executor processes, so each batch is assembled as 
+        # a page from the previous enumeration position. Input pools are rebuilt for every page
+        position = 0
+        while position is not None:
+            results, summary = await ASSEMBLY_EXECUTOR.run_reserved(route, chem_assembly.assemble_page, assemble_func, 
+                                                                    assembly_inputs, *args, n_workers=synthon_workers(),
+                                                                    sort=False, batch_size=batch_size, 
+                                                                    max_combinations=batch_size or CONFIG.ASSEMBLY_BATCH_SIZE,
+                                                                    start=position)
+            position = summary['next_position']
+            yield results
+
+    async def stream_products():
+        batches = thread_batches() if ASSEMBLY_EXECUTOR.executor_type == 'thread' else process_batches()
+        try:
+            async for results in batches:
+                output = encode_new_products(results)
+                if output:
+                    yield output
+        except Exception as e:
+            # the response has already started, so a failed assembly is reported in the stream
+            logger.exception(f'{route} stream failed')
+            yield orjson.dumps({'error' : f'assembly failed: {type(e).__name__}'}) + b'\n'
+
+    return RequestStreamingResponse(stream_products(), on_close=ASSEMBLY_EXECUTOR.release, 
+                                    media_type='application/x-ndjson')
+
+def library_references(assembly_inputs):
+    'library ids referenced by leaf node `library` fields or a custom assembly `libraries` dict'
+    references = list((assembly_inputs.get('libraries') or {}).values())
+    references += [v['library'] for v in assembly_inputs.values() if isinstance(v, dict) and v.get('library')]
+    return [i['library_id'] for i in references]
+
+def check_libraries(assembly_inputs, assembly_type='synthon'):
+    library_ids = library_references(assembly_inputs)
+    if library_ids and (assembly_type != 'synthon'):
+        raise HTTPException(status_code=422, detail='building block libraries can only be used for synthon assembly')
+    for library_id in library_ids:
+        get_library(library_id)
+
+async def register_library(library_request: schemas.CreateLibraryRequest):
+    inputs = library_request.model_dump()['inputs']
+    return await ASSEMBLY_EXECUTOR.run('register_library', chem_assembly.register_library, 
+                                       library_request.name, inputs, n_workers=synthon_workers())
+
+def register_library_file(name, path):
+    return chem_assembly.register_library(name, chem_library.read_library_file(path), n_workers=synthon_workers())
+
+async def load_library(load_request: schemas.LoadLibraryRequest):
+    # only files inside `LIBRARY_DIR` can be loaded
+    if not CONFIG.LIBRARY_DIR:
+        raise HTTPException(status_code=403, detail='loading library files is disabled, set LIBRARY_DIR')
+
+    library_dir = os.path.realpath(CONFIG.LIBRARY_DIR)
+    path = os.path.realpath(os.path.join(library_dir, load_request.path))
+    if os.path.commonpath([library_dir, path]) != library_dir:
+        raise HTTPException(status_code=403, detail=f'{load_request.path} is outside LIBRARY_DIR')
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f'{load_request.path} not found')
+
+    return await ASSEMBLY_EXECUTOR.run('load_library', register_library_file, load_request.name, path)
+
+def scroll_libraries(skip: int, limit: int):
+    return chem_assembly.LIBRARIES.list(skip, limit)
+
+def get_library(library_id: str):
+    info = chem_assembly.LIBRARIES.info(library_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f'library {library_id} not found')
+    return info 
+
+def delete_library(library_id: str):
+    get_library(library_id)
+    chem_assembly.LIBRARIES.delete(library_id)
+    return {'success' : True}
 
 async def has_synthon(eval_request):
     inputs = eval_request.inputs 
-    results = chem_assembly.has_synthon(inputs)
-    await asyncio.sleep(0)
-    return results 
+    results, n_unique = await ASSEMBLY_EXECUTOR.run('has_synthon', chem_assembly.has_synthon, inputs,
+                                                     n_workers=synthon_workers())
+    return results, n_unique
 
 async def compute_synthons(eval_request):
 
     inputs = eval_request.inputs
-    results = chem_assembly.compute_synthons(inputs)
-    await asyncio.sleep(0)
-    return results 
+    results, n_unique = await ASSEMBLY_EXECUTOR.run('compute_synthons', chem_assembly.compute_synthons, inputs,
+                                                     n_workers=synthon_workers())
+    return results, n_unique
 
 def bb_description():
     return chem_assembly.BUILDING_BLOCK_ASSEMBLY_DESCRIPTION
@@ -23,20 +199,37 @@ def bb_description():
 def get_rxn_mechanisms():
     return chem_assembly.REACTION_MECHANISM_DICT
 
-async def assemble_2bbs(assembly_inputs: schemas.TwoBBAseemblyRequest):
-    results = chem_assembly.assemble_2bbs(assembly_inputs.model_dump())
-    await asyncio.sleep(0)
-    return results 
+async def assemble_2bbs(assembly_inputs: schemas.TwoBBAseemblyRequest, **options):
+    assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs)
+    return await run_assembly('2bb_assembly', chem_assembly.assemble_2bbs, assembly_inputs, **options)
+
+async def assemble_3bbs(assembly_inputs: schemas.ThreeBBAseemblyRequest, **options):
+    assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs)
+    return await run_assembly('3bb_assembly', chem_assembly.assemble_3bbs, assembly_inputs, **options)
+
+async def assemble_custom(assembly_inputs: schemas.CustomAssemblySchema, assembly_type, **options):
+    assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs, assembly_type)
+    return await run_assembly(f'{assembly_type}_custom_assembly', chem_assembly.assemble_inputs, 
+                              assembly_inputs, assembly_type, **options)
+
+def assemble_2bbs_stream(assembly_inputs: schemas.TwoBBAseemblyRequest, batch_size: Optional[int]=None):
+    assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs)
+    return stream_assembly('2bb_assembly_stream', chem_assembly.assemble_2bbs, assembly_inputs, batch_size=batch_size)
 
-async def assemble_3bbs(assembly_inputs: schemas.ThreeBBAseemblyRequest):
-    results = chem_assembly.assemble_3bbs(assembly_inputs.model_dump())
-    await asyncio.sleep(0)
-    return results 
+def assemble_3bbs_stream(assembly_inputs: schemas.ThreeBBAseemblyRequest, batch_size: Optional[int]=None):
+    assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs)
+    return stream_assembly('3bb_assembly_stream', chem_assembly.assemble_3bbs, assembly_inputs, batch_size=batch_size)
 
-async def assemble_custom(assembly_inputs: schemas.CustomAssemblySchema, assembly_type):
-    results = chem_assembly.assemble_inputs(assembly_inputs.model_dump(), assembly_type)
-    await asyncio.sleep(0)
-    return results 
+def assemble_custom_stream(assembly_inputs: schemas.CustomAssemblySchema, assembly_type, batch_size: Optional[int]=None):
+    assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs, assembly_type)
+    return stream_assembly(f'{assembly_type}_custom_assembly_stream', chem_assembly.assemble_inputs, 
+                           assembly_inputs, assembly_type, batch_size=batch_size)
 
 def frag_description():
     return chem_assembly.FRAGMENT_ASSEMBLY_DESCRIPTION
@@ -0,0 +1,50 @@
+from fastapi import HTTPException
+
+from ..chem import chem_templates, chem_imports, chem_assembly
+from ..executor import EVAL_EXECUTOR, ASSEMBLY_EXECUTOR
+from ..metrics import REGISTRY
+from ..profiling import PROFILE_STORE
+
+def get_template_cache_stats():
+    return chem_templates.TEMPLATE_CACHE.stats()
+
+def get_filter_stats():
+    return [i.dump_stats() for i in chem_templates.TEMPLATE_CACHE.values()]
+
+def get_result_cache_stats():
+    if chem_templates.RESULT_STORE is None:
+        return {'enabled' : False}
+    return {'enabled' : True, **chem_templates.RESULT_STORE.stats()}
+
+def get_synthon_cache_stats():
+    return chem_assembly.SYNTHON_CACHE.stats()
+
+def get_assembly_cache_stats():
+    return {
+        'assembly_schemas' : chem_assembly.ASSEMBLY_SCHEMA_CACHE.stats(),
+        'rxn_universes' : chem_assembly.RXN_UNIVERSE_CACHE.stats()
+    }
+
+def get_startup_stats():
+    return {
+        'load_times' : chem_imports.LOAD_TIMES,
+        'catalogs_loaded' : [i for i in chem_imports.FILTER_CATALOGUES.keys() 
+                             if chem_imports.FILTER_CATALOGUES.is_loaded(i)],
+        'modules_loaded' : [i for i in chem_imports.DESCRIPTOR_MODULES.keys() 
+                            if chem_imports.DESCRIPTOR_MODULES.is_loaded(i)]
+    }
+
+def get_executor_stats():
+    return {'eval' : EVAL_EXECUTOR.dump(), 'assembly' : ASSEMBLY_EXECUTOR.dump()}
+
+def get_metrics():
+    return REGISTRY.render()
+
+def get_profiles():
+    return [i.summary() for i in PROFILE_STORE.values()]
+
+def get_profile(profile_id, limit):
+    session = PROFILE_STORE.get(profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f'profile {profile_id} not found')
+    return session.dump(limit)
@@ -1,7 +1,16 @@
-import asyncio
+import logging
+import orjson
+from typing import Optional
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from pydantic import ValidationError
+logger = logging.getLogger(__name__)
 
 from ..chem import chem_templates 
 from ..schemas import schemas_functional as schemas 
+from ..config import CONFIG
+from ..executor import EVAL_EXECUTOR
 
 def get_filter_descriptions():
     return chem_templates.FILTER_DESCRIPTIONS
@@ -12,13 +21,149 @@ def get_base_template():
 def strip_template_crud(template_config: schemas.TemplateConfig):
     return chem_templates.strip_template(template_config.model_dump()) 
 
-async def eval_template_functional(eval_request: schemas.TemplateEvalRequestFunctional, return_data: bool):
+SCREEN_HEADERS = {
+    'n_unique' : 'X-Unique-Inputs',
+    'n_screened' : 'X-Inputs-Screened',
+    'n_sampled' : 'X-Sampled-Inputs',
+    'pass_rate' : 'X-Pass-Rate'
+}
+
+def check_screen_mode(limit, sample_size):
+    if (limit is not None) and (sample_size is not None):
+        raise HTTPException(status_code=422, detail='`limit` and `sample_size` can not be used together')
+
+def screen_headers(screen_info):
+    return {SCREEN_HEADERS[k] : str(v) for k,v in screen_info.items()}
+
+async def eval_template_functional(eval_request: schemas.TemplateEvalRequestFunctional, return_data: bool,
+                                   result_format: schemas.ResultFormat=schemas.ResultFormat.rows,
+                                   limit: Optional[int]=None, sample_size: Optional[int]=None, seed: int=0):
+    '''
+    returns `(results, headers)`. `limit` returns the first `limit` passing inputs and 
+    `sample_size` evaluates a seeded random sample of the inputs
+    '''
+    check_screen_mode(limit, sample_size)
 
     inputs = eval_request.inputs
     template_config = eval_request.template_config.model_dump()
 
-    results = chem_templates.run_request(inputs, template_config, return_data=return_data)
-    
-    await asyncio.sleep(0)
+    results, screen_info = await EVAL_EXECUTOR.run('eval_template_functional', chem_templates.run_screen, 
+                                                   inputs, template_config, return_data=return_data,
+                                                   n_workers=CONFIG.EVAL_WORKERS, chunksize=CONFIG.EVAL_CHUNKSIZE,
+                                                   result_format=result_format.value, limit=limit, 
+                                                   sample_size=sample_size, seed=seed)
+
+    return results, screen_headers(screen_info)
+
+async def eval_templates_functional(eval_request: schemas.MultiTemplateEvalRequestFunctional, return_data: bool):
+
+    inputs = eval_request.inputs
+    template_configs = [i.model_dump() for i in eval_request.template_configs]
+
+    results = await EVAL_EXECUTOR.run('eval_templates_functional', chem_templates.run_multi_request, 
+                                 inputs, template_configs, return_data=return_data,
+                                 n_workers=CONFIG.EVAL_WORKERS, chunksize=CONFIG.EVAL_CHUNKSIZE)
 
     return results
+
+async def read_ndjson_lines(stream):
+    buffer = b''
+    async for chunk in stream:
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line
+
+    if buffer.strip():
+        yield buffer.strip()
+
+def parse_input_line(line):
+    # input lines are raw SMILES or JSON encoded strings. Lines that cannot be decoded 
+    # are passed through as text and evaluate as invalid inputs
+    if line.startswith(b'"'):
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+    return line.decode(errors='replace')
+
+async def read_stream_header(lines):
+    try:
+        header = orjson.loads(await lines.__anext__())
+        template_config = schemas.TemplateConfig(**header['template_config']).model_dump()
+    except (StopAsyncIteration, orjson.JSONDecodeError, KeyError, TypeError, ValidationError):
+        raise HTTPException(status_code=422, 
+                            detail='first line of the request body must be a JSON object with a `template_config`')
+    return template_config 
+
+async def eval_stream_chunk(inputs, offset, template_config, return_data):
+    try:
+        results, _ = await EVAL_EXECUTOR.run_reserved('eval_template_functional_stream', chem_templates.run_request, 
+                                                      inputs, template_config, return_data=return_data, 
+                                                      n_workers=CONFIG.EVAL_WORKERS, chunksize=CONFIG.EVAL_CHUNKSIZE)
+    except Exception as e:
+        # the response has already started, so a failed chunk is reported in the stream
+        logger.exception(f'stream chunk at index {offset} failed')
+        error = {'error' : f'evaluation failed: {type(e).__name__}', 
+                 'start_index' : offset, 'n_inputs' : len(inputs)}
+        return orjson.dumps(error) + b'\n'
+
+    output = b''
+    for result in results:
+        result['index'] += offset
+        output += orjson.dumps(result) + b'\n'
+    return output 
+
+class RequestStreamingResponse(StreamingResponse):
+    '''
+    streams a response while the body iterator is still reading the request body. 
+    Under ASGI spec < 2.4 `StreamingResponse` listens for disconnects on `receive`, which 
+    takes request body messages away from the body iterator. Here the body iterator owns 
+    `receive`, and disconnects surface from `request.stream()` or as failed sends. 
+    `on_close` is called when the response ends, whether or not it completed
+    '''
+    def __init__(self, content, on_close=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+        if self.background is not None:
+            await self.background()
+
+async def eval_template_functional_stream(request: Request, return_data: bool):
+    lines = read_ndjson_lines(request.stream())
+    template_config = await read_stream_header(lines)
+
+    # one stream chunk fills every evaluation worker
+    stream_chunksize = CONFIG.EVAL_CHUNKSIZE * max(CONFIG.EVAL_WORKERS, 1)
+
+    # capacity is checked once, before the response starts. The stream holds its 
+    # executor slot until the response ends
+    EVAL_EXECUTOR.reserve('eval_template_functional_stream')
+
+    async def stream_results():
+        offset = 0
+        inputs = []
+        async for line in lines:
+            inputs.append(parse_input_line(line))
+            if len(inputs) >= stream_chunksize:
+                yield await eval_stream_chunk(inputs, offset, template_config, return_data)
+                offset += len(inputs)
+                inputs = []
+
+        if inputs:
+            yield await eval_stream_chunk(inputs, offset, template_config, return_data)
+
+    return RequestStreamingResponse(stream_results(), on_close=EVAL_EXECUTOR.release, 
+                                    media_type='application/x-ndjson')
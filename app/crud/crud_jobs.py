@@ -0,0 +1,48 @@
+from fastapi import HTTPException
+
+from ..schemas import schemas_jobs as schemas
+from ..jobs import get_job_runner, count_assembly_inputs
+from .crud_assembly import check_libraries
+
+def submit_eval_job(eval_request: schemas.EvalJobRequest):
+    payload = eval_request.model_dump()
+    runner = get_job_runner()
+    job_id = runner.submit('eval_template', payload, len(payload['inputs']))
+    return runner.store.get(job_id)
+
+def submit_assembly_job(assembly_inputs, kind):
+    payload = assembly_inputs.model_dump()
+    check_libraries(payload, 'fragment' if kind.startswith('fragment') else 'synthon')
+    runner = get_job_runner()
+    job_id = runner.submit(kind, payload, count_assembly_inputs(payload))
+    return runner.store.get(job_id)
+
+def get_job(job_id: str):
+    job = get_job_runner().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f'job {job_id} not found')
+    return job 
+
+def scroll_jobs(skip: int, limit: int):
+    return get_job_runner().store.list(skip, limit)
+
+def get_job_results(job_id: str, skip: int, limit: int):
+    'returns a page of results as a JSON encoded object, built from the stored JSON rows'
+    job = get_job(job_id)
+    if job['status'] != 'done':
+        raise HTTPException(status_code=409, detail=f"job {job_id} is {job['status']}")
+
+    results = get_job_runner().store.get_results(job_id, skip, limit)
+    header = f'{{"job_id":"{job_id}","n_results":{job["n_results"]},"skip":{skip},"limit":{limit},"results":['
+    return header.encode() + b','.join(results) + b']}'
+
+def cancel_job(job_id: str):
+    get_job(job_id)
+    store = get_job_runner().store
+    store.cancel(job_id)
+    return store.get(job_id)
+
+def delete_job(job_id: str):
+    get_job(job_id)
+    get_job_runner().store.delete(job_id)
+    return {'success' : True}
@@ -1,11 +1,14 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from fastapi import HTTPException
-import asyncio
+from typing import Optional
 
 from ..chem import chem_templates, chem_assembly
 from ..schemas import schemas_stateful as schemas 
 from ..config import CONFIG
+from ..executor import EVAL_EXECUTOR
+from .crud_functional import check_screen_mode, screen_headers
+from .crud_assembly import check_libraries, run_assembly
 
 if CONFIG.MONGO_URI:
     client = AsyncIOMotorClient(CONFIG.MONGO_URI)
@@ -45,13 +48,37 @@ async def delete_template(template_id: str):
     item = await item.delete()
     return {'success' : item.acknowledged}
 
-async def eval_template_stateful(template_id: str, eval_request: schemas.EvalRequestStateful, return_data: bool=True):
+async def eval_template_stateful(template_id: str, eval_request: schemas.EvalRequestStateful, return_data: bool=True,
+                                 result_format: schemas.ResultFormat=schemas.ResultFormat.rows,
+                                 limit: Optional[int]=None, sample_size: Optional[int]=None, seed: int=0):
+    check_screen_mode(limit, sample_size)
     item = await get_template(template_id)
 
     inputs = eval_request.inputs
     template_config = item.template_config.model_dump()
 
-    results = chem_templates.run_request(inputs, template_config, return_data=return_data)
+    results, screen_info = await EVAL_EXECUTOR.run('eval_template_stateful', chem_templates.run_screen, 
+                                                   inputs, template_config, return_data=return_data,
+                                                   n_workers=CONFIG.EVAL_WORKERS, chunksize=CONFIG.EVAL_CHUNKSIZE,
+                                                   result_format=result_format.value, limit=limit, 
+                                                   sample_size=sample_size, seed=seed)
+
+    return results, screen_headers(screen_info)
+
+async def eval_templates_stateful(eval_request: schemas.MultiTemplateEvalRequestStateful, return_data: bool=True):
+    template_configs = []
+    for template_id in eval_request.template_ids:
+        item = await get_template(template_id)
+        template_configs.append(item.template_config.model_dump())
+
+    if eval_request.template_configs:
+        template_configs += [i.model_dump() for i in eval_request.template_configs]
+
+    inputs = eval_request.inputs
+
+    results = await EVAL_EXECUTOR.run('eval_templates_stateful', chem_templates.run_multi_request, 
+                                 inputs, template_configs, return_data=return_data,
+                                 n_workers=CONFIG.EVAL_WORKERS, chunksize=CONFIG.EVAL_CHUNKSIZE)
 
     return results 
 
@@ -98,29 +125,30 @@ async def swap_template(input_dict):
             await swap_template(v)
 
 
-async def assemble_2bbs_stateful(assembly_inputs: schemas.TwoBBAseemblyRequestStateful):
+async def assemble_2bbs_stateful(assembly_inputs: schemas.TwoBBAseemblyRequestStateful, **options):
 
     assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs)
     await swap_template(assembly_inputs)
-    results = chem_assembly.assemble_2bbs(assembly_inputs)
-    return results 
+    return await run_assembly('2bb_assembly_stateful', chem_assembly.assemble_2bbs, assembly_inputs, **options)
 
-async def assemble_3bbs_stateful(assembly_inputs: schemas.ThreeBBAseemblyRequestStateful):
+async def assemble_3bbs_stateful(assembly_inputs: schemas.ThreeBBAseemblyRequestStateful, **options):
 
     assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs)
     await swap_template(assembly_inputs)
-    results = chem_assembly.assemble_3bbs(assembly_inputs)
-    return results 
+    return await run_assembly('3bb_assembly_stateful', chem_assembly.assemble_3bbs, assembly_inputs, **options)
 
-async def assemble_custom_stateful(assembly_inputs: schemas.CustomAssemblySchemaStateful, assembly_type):
+async def assemble_custom_stateful(assembly_inputs: schemas.CustomAssemblySchemaStateful, assembly_type, **options):
 
     assembly_inputs = assembly_inputs.model_dump()
+    check_libraries(assembly_inputs, assembly_type)
 
     if assembly_inputs['assembly_schema_id']:
         schema = await get_assembly_schema(assembly_inputs['assembly_schema_id'])
         assembly_inputs['assembly_schema'] = schema.model_dump()['assembly_schema']
 
     await swap_template(assembly_inputs)
-    results = chem_assembly.assemble_inputs(assembly_inputs, assembly_type)
-    return results 
+    return await run_assembly(f'{assembly_type}_custom_assembly_stateful', chem_assembly.assemble_inputs, 
+                              assembly_inputs, assembly_type, **options)
 
@@ -0,0 +1,151 @@
+import time
+import asyncio
+import multiprocessing
+from functools import partial
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import HTTPException
+
+from .config import CONFIG
+from .metrics import REGISTRY, QUEUE_SECONDS, RUN_SECONDS
+from .profiling import PROFILE_SESSION, profiled_call
+
+class RouteStats():
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_queue_time = 0.0
+        self.total_run_time = 0.0
+        self.max_run_time = 0.0
+
+    def record(self, queue_time, run_time, error=False):
+        self.calls += 1
+        self.errors += int(error)
+        self.total_queue_time += queue_time
+        self.total_run_time += run_time
+        self.max_run_time = max(self.max_run_time, run_time)
+
+    def dump(self):
+        return {
+            'calls' : self.calls,
+            'errors' : self.errors,
+            'rejected' : self.rejected,
+            'mean_queue_ms' : (self.total_queue_time * 1000 / self.calls) if self.calls else None,
+            'mean_run_ms' : (self.total_run_time * 1000 / self.calls) if self.calls else None,
+            'max_run_ms' : self.max_run_time * 1000
+        }
+
+def timed_call(func, collect_metrics=False):
+    '''
+    runs `func`, returns `(started, result, metrics_delta)`. With `collect_metrics`, 
+    metrics recorded during the call are returned to be merged into the server process
+    '''
+    # wall clock time is used so queue wait can be measured across processes
+    started = time.time()
+    if not collect_metrics:
+        return started, func(), None
+
+    before = REGISTRY.snapshot()
+    result = func()
+    return started, result, REGISTRY.delta(before)
+
+class ChemExecutor():
+    '''
+    runs CPU-bound chemistry off the event loop. At most `max_workers` calls run at once,
+    with up to `max_queue` more waiting. Calls beyond that are rejected with a 429. Queue 
+    wait and run time are recorded for each route.
+
+    `executor_type='thread'` runs calls in the server process. `executor_type='process'` 
+    runs each call in a separate process, so `func` and its arguments must be picklable and 
+    any state `func` updates (caches, filter stats) stays in the executor process. Metrics 
+    recorded by `func` are returned with its result and merged into the server's metrics
+    '''
+    def __init__(self, executor_type, max_workers, max_queue, name='chem'):
+        if executor_type not in ('thread', 'process'):
+            raise ValueError(f'executor type {executor_type} not supported')
+
+        self.name = name
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = None
+        self.n_pending = 0
+        self.route_stats = defaultdict(RouteStats)
+
+    def get_executor(self):
+        if self.executor is None:
+            if self.executor_type == 'thread':
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='chem')
+            else:
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                    mp_context=multiprocessing.get_context('spawn'))
+        return self.executor
+
+    def reserve(self, route):
+        'claims a slot for a caller that makes several calls, such as a stream. Raises a 429 at capacity'
+        if self.n_pending >= self.max_workers + self.max_queue:
+            self.route_stats[route].rejected += 1
+            raise HTTPException(status_code=429, detail='server is at capacity, retry later')
+        self.n_pending += 1
+
+    def release(self):
+        self.n_pending -= 1
+
+    async def run(self, route, func, *args, **kwargs):
+        self.reserve(route)
+        try:
+            return await self.run_reserved(route, func, *args, **kwargs)
+        finally:
+            self.release()
+
+    async def run_reserved(self, route, func, *args, **kwargs):
+        'runs `func` on a slot already claimed with `reserve`'
+        # the executor runs at most `max_workers` calls at once, the rest wait in its queue
+        queued = time.time()
+
+        call = partial(func, *args, **kwargs)
+        profile_session = PROFILE_SESSION.get()
+        if profile_session is not None:
+            call = partial(profiled_call, call)
+
+        try:
+            loop = asyncio.get_running_loop()
+            started, result, metrics_delta = await loop.run_in_executor(
+                self.get_executor(), partial(timed_call, call, self.executor_type == 'process'))
+        except Exception:
+            self.route_stats[route].record(0.0, time.time() - queued, error=True)
+            raise
+
+        queue_time = started - queued
+        run_time = time.time() - started
+        self.route_stats[route].record(queue_time, run_time)
+        QUEUE_SECONDS.observe(queue_time, self.name, route)
+        RUN_SECONDS.observe(run_time, self.name, route)
+        if metrics_delta:
+            REGISTRY.merge(metrics_delta)
+        if profile_session is not None:
+            result, profile = result
+            profile_session.add(route, profile)
+        return result 
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+
+    def dump(self):
+        return {
+            'executor_type' : self.executor_type,
+            'max_workers' : self.max_workers,
+            'max_queue' : self.max_queue,
+            'pending' : self.n_pending,
+            'routes' : {k : v.dump() for k,v in self.route_stats.items()}
+        }
+
+# template evaluation updates the template cache and filter stats held in the server process 
+# and fans out to the evaluation worker pool itself, so it always runs on threads. Assembly and 
+# synthon calls are stateless and can run on either
+EVAL_EXECUTOR = ChemExecutor('thread', CONFIG.EXECUTOR_WORKERS, CONFIG.EXECUTOR_MAX_QUEUE, name='eval')
+ASSEMBLY_EXECUTOR = ChemExecutor(CONFIG.ASSEMBLY_EXECUTOR_TYPE, CONFIG.EXECUTOR_WORKERS, 
+                                 CONFIG.EXECUTOR_MAX_QUEUE, name='assembly')
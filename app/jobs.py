@@ -0,0 +1,289 @@
+import os
+import copy
+import time
+import uuid
+import orjson
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+logger = logging.getLogger(__name__)
+
+from .config import CONFIG
+from .chem import chem_templates, chem_assembly
+
+class JobStore():
+    '''
+    SQLite store of jobs and their results, shared by every server process that opens the
+    same `path`. Results are stored as JSON rows keyed by `(job_id, idx)` as they are
+    produced, together with the job's progress, so a job interrupted by a restart resumes
+    from its last stored chunk
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        # sqlite connections can not be shared between threads, so each thread opens its own
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                                job_id TEXT PRIMARY KEY,
+                                kind TEXT NOT NULL,
+                                status TEXT NOT NULL,
+                                payload BLOB NOT NULL,
+                                created REAL NOT NULL,
+                                started REAL,
+                                finished REAL,
+                                heartbeat REAL,
+                                n_total INTEGER NOT NULL,
+                                n_processed INTEGER NOT NULL DEFAULT 0,
+                                n_found INTEGER NOT NULL DEFAULT 0,
+                                n_results INTEGER NOT NULL DEFAULT 0,
+                                error TEXT)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS job_results (
+                                job_id TEXT NOT NULL,
+                                idx INTEGER NOT NULL,
+                                result BLOB NOT NULL,
+                                PRIMARY KEY (job_id, idx)) WITHOUT ROWID''')
+            conn.commit()
+            self.local.conn = conn
+        return conn
+
+    def create(self, kind, payload, n_total):
+        job_id = uuid.uuid4().hex
+        conn = self.connect()
+        with conn:
+            conn.execute('INSERT INTO jobs (job_id, kind, status, payload, created, n_total) VALUES (?, ?, ?, ?, ?, ?)',
+                         (job_id, kind, 'queued', orjson.dumps(payload), time.time(), n_total))
+        return job_id
+
+    def get(self, job_id, payload=False):
+        columns = ['job_id', 'kind', 'status', 'created', 'started', 'finished', 'n_total',
+                   'n_processed', 'n_found', 'n_results', 'error']
+        if payload:
+            columns.append('payload')
+        row = self.connect().execute(f'SELECT {",".join(columns)} FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(zip(columns, row))
+        if payload:
+            job['payload'] = orjson.loads(job['payload'])
+        return job
+
+    def list(self, skip=0, limit=100):
+        rows = self.connect().execute('SELECT job_id FROM jobs ORDER BY created DESC LIMIT ? OFFSET ?',
+                                      (limit, skip)).fetchall()
+        return [self.get(job_id) for job_id, in rows]
+
+    def status(self, job_id):
+        row = self.connect().execute('SELECT status FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def queued(self, limit):
+        rows = self.connect().execute("SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT ?",
+                                      (limit,)).fetchall()
+        return [job_id for job_id, in rows]
+
+    def claim(self, job_id):
+        'marks a queued job as running. Returns False if another worker claimed it first'
+        now = time.time()
+        conn = self.connect()
+        with conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'running', started = COALESCE(started, ?), heartbeat = ? "
+                                  "WHERE job_id = ? AND status = 'queued'", (now, now, job_id))
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_ids):
+        now = time.time()
+        conn = self.connect()
+        with conn:
+            conn.executemany("UPDATE jobs SET heartbeat = ? WHERE job_id = ? AND status = 'running'",
+                             [(now, job_id) for job_id in job_ids])
+
+    def requeue_stale(self, cutoff):
+        'requeues running jobs whose worker has not sent a heartbeat since `cutoff`'
+        conn = self.connect()
+        with conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat < ?",
+                                  (cutoff,))
+        return cursor.rowcount
+
+    def add_results(self, job_id, start_index, results, n_processed, n_found):
+        'stores `results` from `start_index` and the job progress in one transaction'
+        conn = self.connect()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO job_results VALUES (?, ?, ?)',
+                             [(job_id, i, orjson.dumps(result)) for i, result in enumerate(results, start_index)])
+            conn.execute('UPDATE jobs SET n_processed = ?, n_found = n_found + ?, n_results = ?, heartbeat = ? '
+                         'WHERE job_id = ?', (n_processed, n_found, start_index + len(results), time.time(), job_id))
+
+    def finish(self, job_id, status, error=None):
+        conn = self.connect()
+        with conn:
+            conn.execute("UPDATE jobs SET status = ?, finished = ?, error = ? WHERE job_id = ? AND status = 'running'",
+                         (status, time.time(), error, job_id))
+
+    def cancel(self, job_id):
+        conn = self.connect()
+        with conn:
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE job_id = ? AND status IN ('queued', 'running')",
+                         (time.time(), job_id))
+
+    def delete(self, job_id):
+        conn = self.connect()
+        with conn:
+            conn.execute('DELETE FROM job_results WHERE job_id = ?', (job_id,))
+            conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+    def get_results(self, job_id, skip, limit):
+        'returns a page of results as JSON encoded rows'
+        rows = self.connect().execute('SELECT result FROM job_results WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?',
+                                      (job_id, skip, limit)).fetchall()
+        return [result for result, in rows]
+
+def count_assembly_inputs(payload):
+    n_inputs = 0
+    for key, value in payload.items():
+        if key == 'mapped_inputs':
+            n_inputs += sum(len(i) for i in (value or {}).values())
+        elif isinstance(value, dict):
+            n_inputs += len(value.get('inputs') or [])
+        elif isinstance(value, list):
+            n_inputs += len(value)
+    return n_inputs
+
+def run_eval_job(store, job_id, job):
+    '''
+    evaluates the job inputs in chunks of `JOB_CHUNKSIZE`, storing results after each
+    chunk. Starts after the last stored chunk and stops between chunks if the job is cancelled
+    '''
+    payload = job['payload']
+    inputs = payload['inputs']
+    for start in range(job['n_processed'], len(inputs), CONFIG.JOB_CHUNKSIZE):
+        if store.status(job_id) != 'running':
+            return
+
+        chunk = inputs[start:start+CONFIG.JOB_CHUNKSIZE]
+        results, _ = chem_templates.run_request(chunk, payload['template_config'],
+                                                return_data=payload['return_data'],
+                                                n_workers=CONFIG.EVAL_WORKERS, chunksize=CONFIG.EVAL_CHUNKSIZE)
+        for result in results:
+            result['index'] += start
+        store.add_results(job_id, start, results, start + len(chunk), sum(i['result'] for i in results))
+
+def assembly_job(assembly_func):
+    def run_assembly_job(store, job_id, job):
+        # assembly runs in one call, so progress is stored once the products are found. 
+        # Products stored before a restart are kept
+        if job['n_results'] > 0:
+            return
+        results = assembly_func(copy.deepcopy(job['payload']))
+        store.add_results(job_id, 0, results, job['n_total'], len(results))
+    return run_assembly_job
+
+JOB_KINDS = {
+    'eval_template' : run_eval_job,
+    '2bb_assembly' : assembly_job(lambda payload: chem_assembly.assemble_2bbs(payload, n_workers=CONFIG.EVAL_WORKERS)),
+    '3bb_assembly' : assembly_job(lambda payload: chem_assembly.assemble_3bbs(payload, n_workers=CONFIG.EVAL_WORKERS)),
+    'synthon_custom_assembly' : assembly_job(lambda payload: chem_assembly.assemble_inputs(payload, 'synthon', 
+                                                                                             n_workers=CONFIG.EVAL_WORKERS)),
+    'fragment_custom_assembly' : assembly_job(lambda payload: chem_assembly.assemble_inputs(payload, 'fragment', 
+                                                                                              n_workers=CONFIG.EVAL_WORKERS)),
+}
+
+class JobRunner():
+    '''
+    runs jobs from a `JobStore` on `n_workers` threads. A polling thread sends heartbeats
+    for running jobs, requeues jobs whose worker stopped sending heartbeats (ie after a
+    restart) and claims queued jobs while there are free workers. Several server processes
+    can share one store, each job is claimed by one of them
+    '''
+    def __init__(self, store, n_workers, poll_interval):
+        self.store = store
+        self.n_workers = n_workers
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='job')
+        self.running = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.poll, name='job-poll', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        self.thread.join()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, kind, payload, n_total):
+        job_id = self.store.create(kind, payload, n_total)
+        self.wake.set()
+        return job_id
+
+    def poll(self):
+        while not self.stopped.is_set():
+            try:
+                self.poll_once()
+            except Exception:
+                logger.exception('job polling failed')
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+
+    def poll_once(self):
+        with self.lock:
+            running = list(self.running)
+        self.store.heartbeat(running)
+        self.store.requeue_stale(time.time() - 10 * self.poll_interval)
+
+        n_free = self.n_workers - len(running)
+        if n_free > 0:
+            for job_id in self.store.queued(n_free):
+                if self.store.claim(job_id):
+                    with self.lock:
+                        self.running.add(job_id)
+                    self.executor.submit(self.run, job_id)
+
+    def run(self, job_id):
+        try:
+            job = self.store.get(job_id, payload=True)
+            JOB_KINDS[job['kind']](self.store, job_id, job)
+            self.store.finish(job_id, 'done')
+        except Exception as e:
+            logger.exception(f'job {job_id} failed')
+            self.store.finish(job_id, 'failed', error=f'{type(e).__name__}: {e}')
+        finally:
+            with self.lock:
+                self.running.discard(job_id)
+            self.wake.set()
+
+JOB_RUNNER = None
+_JOB_RUNNER_LOCK = threading.Lock()
+
+def get_job_runner():
+    global JOB_RUNNER
+    with _JOB_RUNNER_LOCK:
+        if JOB_RUNNER is None:
+            JOB_RUNNER = JobRunner(JobStore(CONFIG.JOB_STORE_PATH), CONFIG.JOB_WORKERS, CONFIG.JOB_POLL_INTERVAL)
+            JOB_RUNNER.start()
+        return JOB_RUNNER
+
+def shutdown_job_runner():
+    global JOB_RUNNER
+    with _JOB_RUNNER_LOCK:
+        if JOB_RUNNER is not None:
+            JOB_RUNNER.stop()
+        JOB_RUNNER = None
+
+def resume_jobs():
+    'starts the job runner if a job store exists, so unfinished jobs are picked up after a restart'
+    if os.path.exists(CONFIG.JOB_STORE_PATH):
+        get_job_runner()
@@ -1,18 +1,38 @@
 from fastapi import FastAPI, responses
 from .config import CONFIG
+from .chem.chem_imports import warm_up
+from .profiling import ProfileMiddleware
+from .jobs import resume_jobs
 
 from .api.api_functional import router as functional_router
 from .api.api_assembly import router as bb_router
+from .api.api_diagnostics import router as diagnostics_router
+from .api.api_jobs import router as jobs_router
 
 app = FastAPI(default_response_class=responses.ORJSONResponse)
 
 app.include_router(functional_router, tags=["functional"])
 app.include_router(bb_router, tags=["assembly"])
+app.include_router(diagnostics_router, tags=["diagnostics"])
+app.include_router(jobs_router, tags=["jobs"])
+
+if CONFIG.PROFILING_ENABLED:
+    app.add_middleware(ProfileMiddleware)
 
 if CONFIG.MONGO_URI:
     from .api.api_stateful import router as stateful_router
     app.include_router(stateful_router, tags=["stateful"])
 
+@app.on_event("startup")
+def warm_up_components():
+    components = [i.strip() for i in CONFIG.WARMUP_COMPONENTS.split(',') if i.strip()]
+    if components:
+        warm_up(components)
+
+@app.on_event("startup")
+def resume_unfinished_jobs():
+    resume_jobs()
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
\ No newline at end of file
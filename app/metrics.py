@@ -0,0 +1,153 @@
+import bisect
+import threading
+
+def exponential_buckets(start, factor, count):
+    return [start * factor**i for i in range(count)]
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{escape_label(v)}"' for k,v in pairs) + '}'
+
+class Histogram():
+    '''
+    thread safe Prometheus histogram. Observations are grouped by a tuple of label values
+    in `label_names` order. Bucket counts are stored per bucket and made cumulative when
+    rendered
+    '''
+    def __init__(self, name, description, label_names=(), buckets=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = sorted(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def _observe(self, value, labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def observe(self, value, *labels):
+        with self.lock:
+            self._observe(value, labels)
+
+    def observe_many(self, observations):
+        'records `(value, labels)` pairs under one lock acquisition'
+        with self.lock:
+            for value, labels in observations:
+                self._observe(value, labels)
+
+    def snapshot(self):
+        with self.lock:
+            return {labels : (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+
+    def merge(self, delta):
+        with self.lock:
+            for labels, (counts, total, count) in delta.items():
+                series = self.series.get(labels)
+                if series is None:
+                    series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                series[0] = [a+b for a,b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+
+    def clear(self):
+        with self.lock:
+            self.series = {}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f'{self.name}_bucket{format_labels(self.label_names, labels, ("le", le))} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, labels)} {count}')
+        return '\n'.join(lines)
+
+def series_delta(before, after):
+    delta = {}
+    for labels, (counts, total, count) in after.items():
+        prev_counts, prev_total, prev_count = before.get(labels, ([0] * len(counts), 0.0, 0))
+        if count != prev_count:
+            delta[labels] = ([a-b for a,b in zip(counts, prev_counts)], total - prev_total, count - prev_count)
+    return delta
+
+class MetricsRegistry():
+    '''
+    holds the server's histograms. Work done in other processes (evaluation workers,
+    process executors) is measured there and merged back with `snapshot`, `delta` and `merge`
+    '''
+    def __init__(self):
+        self.metrics = {}
+
+    def histogram(self, name, description, label_names=(), buckets=()):
+        histogram = Histogram(name, description, label_names, buckets)
+        self.metrics[name] = histogram
+        return histogram
+
+    def snapshot(self):
+        return {name : metric.snapshot() for name, metric in self.metrics.items()}
+
+    def delta(self, before):
+        'observations made since `before` (a `snapshot`)'
+        after = self.snapshot()
+        delta = {name : series_delta(before.get(name, {}), series) for name, series in after.items()}
+        return {k:v for k,v in delta.items() if v}
+
+    def merge(self, delta):
+        for name, series in delta.items():
+            self.metrics[name].merge(series)
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self.metrics.values()) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+FAST_BUCKETS = exponential_buckets(1e-5, 4, 10) # 10us to ~2.6s
+SLOW_BUCKETS = exponential_buckets(1e-3, 4, 10) # 1ms to ~4.4min
+SIZE_BUCKETS = exponential_buckets(1, 10, 8)    # 1 to 1e7
+
+PARSE_SECONDS = REGISTRY.histogram('chem_parse_seconds',
+                                   'time to parse and canonicalize one input molecule',
+                                   buckets=FAST_BUCKETS)
+
+FILTER_SECONDS = REGISTRY.histogram('chem_filter_seconds',
+                                    'time to evaluate one filter on one molecule',
+                                    ('filter_type', 'name'), FAST_BUCKETS)
+
+SYNTHON_SECONDS = REGISTRY.histogram('chem_synthon_seconds',
+                                     'time to classify or compute synthons for one building block',
+                                     ('operation',), FAST_BUCKETS)
+
+ASSEMBLY_POOL_SIZE = REGISTRY.histogram('chem_assembly_pool_size',
+                                        'number of items in each assembly input pool',
+                                        ('assembly_type',), SIZE_BUCKETS)
+
+ASSEMBLY_SECONDS = REGISTRY.histogram('chem_assembly_seconds',
+                                      'time spent in each assembly stage',
+                                      ('assembly_type', 'stage'), SLOW_BUCKETS)
+
+QUEUE_SECONDS = REGISTRY.histogram('request_queue_seconds',
+                                   'time a request waits for an executor slot',
+                                   ('executor', 'route'), SLOW_BUCKETS)
+
+RUN_SECONDS = REGISTRY.histogram('request_run_seconds',
+                                 'time a request runs on its executor',
+                                 ('executor', 'route'), SLOW_BUCKETS)
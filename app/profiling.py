@@ -0,0 +1,111 @@
+import os
+import time
+import uuid
+import pstats
+import marshal
+import cProfile
+import contextvars
+
+from .config import CONFIG
+from .chem.chem_cache import LRUCache
+
+# set for the duration of a request that asked to be profiled. Executor calls made
+# while it is set run under cProfile and add their stats to the session
+PROFILE_SESSION = contextvars.ContextVar('profile_session', default=None)
+
+PROFILE_STORE = LRUCache(CONFIG.PROFILE_STORE_SIZE)
+
+PROFILE_HEADER = b'x-profile'
+
+def profiled_call(func):
+    '''
+    runs `func` under cProfile, returns `(result, (elapsed, raw_stats))`. `raw_stats`
+    is the `pstats` stats dict, so it can be returned from a process executor
+    '''
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    result = profiler.runcall(func)
+    elapsed = time.perf_counter() - start
+    return result, (elapsed, pstats.Stats(profiler).stats)
+
+def top_functions(raw_stats, limit):
+    'the `limit` functions with the highest cumulative time'
+    functions = []
+    for (filename, line, name), (_, ncalls, tottime, cumtime, _) in raw_stats.items():
+        location = f'{os.path.basename(filename)}:{line}' if line else filename
+        functions.append({
+            'function' : f'{name} ({location})',
+            'ncalls' : ncalls,
+            'tottime' : tottime,
+            'cumtime' : cumtime
+        })
+    functions = sorted(functions, key=lambda x: x['cumtime'], reverse=True)
+    return functions[:limit]
+
+class ProfileSession():
+    'profiles of every executor call made by one request'
+    def __init__(self, path):
+        self.profile_id = uuid.uuid4().hex
+        self.path = path
+        self.created = time.time()
+        self.calls = []
+
+    def add(self, route, profile):
+        elapsed, raw_stats = profile
+        self.calls.append((route, elapsed, raw_stats))
+
+        if CONFIG.PROFILE_DIR:
+            # `.prof` files can be opened with `pstats` or snakeviz
+            filename = os.path.join(CONFIG.PROFILE_DIR, f'{self.profile_id}_{len(self.calls)-1}.prof')
+            with open(filename, 'wb') as f:
+                marshal.dump(raw_stats, f)
+
+    def summary(self):
+        return {
+            'profile_id' : self.profile_id,
+            'path' : self.path,
+            'created' : self.created,
+            'n_calls' : len(self.calls)
+        }
+
+    def dump(self, limit=30):
+        output = self.summary()
+        output['calls'] = [{'route' : route, 'elapsed' : elapsed, 'top_functions' : top_functions(raw_stats, limit)}
+                           for route, elapsed, raw_stats in self.calls]
+        return output
+
+def profile_requested(headers):
+    for key, value in headers:
+        if key == PROFILE_HEADER:
+            return value.lower() in (b'1', b'true', b'yes')
+    return False
+
+class ProfileMiddleware():
+    '''
+    ASGI middleware that profiles requests sent with an `X-Profile: true` header. The
+    profile id is returned in the `X-Profile-Id` response header and the profile is
+    stored in `PROFILE_STORE`. Requests without the header are passed straight through
+    '''
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope['type'] != 'http') or (not profile_requested(scope['headers'])):
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(scope['path'])
+        PROFILE_STORE.put(session.profile_id, session)
+
+        async def send_with_profile_id(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'x-profile-id', session.profile_id.encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        token = PROFILE_SESSION.set(session)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            PROFILE_SESSION.reset(token)
@@ -30,9 +30,16 @@ class AssemblyInputItem(BaseModel):
     input: str 
     data: dict 
 
+class LibraryReference(BaseModel):
+    library_id: str 
+    reaction_tags: Optional[list[str]] = None 
+    n_func: Optional[list[int]] = None 
+    data: Optional[dict] = None 
+
 class AssemblyLeafNodeInputs(BaseModel):
-    inputs: list[AssemblyInputItem]
+    inputs: list[AssemblyInputItem] = []
     template_config: Optional[TemplateConfig]
+    library: Optional[LibraryReference] = None 
 
 class ReactionNodeInputs(BaseModel):
     reaction_mechanisms: dict[str, bool]
@@ -56,4 +63,21 @@ class CustomAssemblySchema(BaseModel):
     assembly_schema: dict
     mapped_inputs: Optional[dict[str, list[AssemblyInputItem]]]
     unmapped_inputs: Optional[list[AssemblyInputItem]]
+    libraries: Optional[dict[str, LibraryReference]] = None 
+
+class CreateLibraryRequest(BaseModel):
+    name: str 
+    inputs: list[AssemblyInputItem]
+
+class LoadLibraryRequest(BaseModel):
+    name: str 
+    path: str 
+
+class LibraryInfo(BaseModel):
+    library_id: str 
+    name: str 
+    created: float 
+    n_inputs: int 
+    n_molecules: int 
+    n_synthons: int 
     
@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import Union, Optional
 from pydantic import BaseModel
 
@@ -47,5 +48,20 @@ class TemplateEvalResponse(BaseModel):
     index: int
     result: bool
     template_data: Optional[TemplateResponseData]
-    
 
+class TemplateResult(BaseModel):
+    template_name: Optional[str]
+    result: bool
+    template_data: Optional[TemplateResponseData]
+
+class MultiTemplateEvalResponse(BaseModel):
+    input: str 
+    index: int
+    valid_input: bool
+    results: list[TemplateResult]
+
+class ResultFormat(str, Enum):
+    rows = 'rows'
+    indices = 'indices'
+    bitset = 'bitset'
+    columnar = 'columnar'
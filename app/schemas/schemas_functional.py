@@ -5,9 +5,15 @@ from .schemas_common import (
                             IncludeCatalog, 
                             SmartsFilters, 
                             TemplateConfig,
-                            TemplateEvalResponse
+                            TemplateEvalResponse,
+                            MultiTemplateEvalResponse,
+                            ResultFormat
                             )
 
 class TemplateEvalRequestFunctional(BaseModel):
     inputs: list[str]
     template_config: TemplateConfig
+
+class MultiTemplateEvalRequestFunctional(BaseModel):
+    inputs: list[str]
+    template_configs: list[TemplateConfig]
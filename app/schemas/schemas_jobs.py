@@ -0,0 +1,23 @@
+from typing import Optional
+from pydantic import BaseModel
+
+from .schemas_common import TemplateConfig
+from .schemas_assembly import TwoBBAseemblyRequest, ThreeBBAseemblyRequest, CustomAssemblySchema
+
+class EvalJobRequest(BaseModel):
+    inputs: list[str]
+    template_config: TemplateConfig
+    return_data: bool = True
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    created: float
+    started: Optional[float]
+    finished: Optional[float]
+    n_total: int
+    n_processed: int
+    n_found: int
+    n_results: int
+    error: Optional[str]
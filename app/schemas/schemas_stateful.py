@@ -2,8 +2,8 @@ from typing import Union, Optional
 from pydantic import BaseModel
 from beanie import Document
 
-from .schemas_common import TemplateConfig, TemplateEvalResponse
-from .schemas_assembly import AssemblyInputItem, TwoBBAseemblyRequest, ThreeBBAseemblyRequest, CustomAssemblySchema
+from .schemas_common import TemplateConfig, TemplateEvalResponse, MultiTemplateEvalResponse, ResultFormat
+from .schemas_assembly import AssemblyInputItem, LibraryReference, TwoBBAseemblyRequest, ThreeBBAseemblyRequest, CustomAssemblySchema
 
 class TemplateDocument(Document):
     template_config: TemplateConfig
@@ -11,10 +11,16 @@ class TemplateDocument(Document):
 class EvalRequestStateful(BaseModel):
     inputs: list[str]
 
+class MultiTemplateEvalRequestStateful(BaseModel):
+    inputs: list[str]
+    template_ids: list[str]
+    template_configs: Optional[list[TemplateConfig]] = None
+
 class AssemblyLeafNodeInputsStateful(BaseModel):
-    inputs: list[AssemblyInputItem]
+    inputs: list[AssemblyInputItem] = []
     template_config: Optional[TemplateConfig]
     template_id: Optional[str]
+    library: Optional[LibraryReference] = None 
 
 class ReactionNodeInputsStateful(BaseModel):
     reaction_mechanisms: dict[str, bool]
@@ -46,5 +52,6 @@ class CustomAssemblySchemaStateful(BaseModel):
     assembly_schema_id: Optional[str]
     mapped_inputs: Optional[dict[str, list[AssemblyInputItem]]]
     unmapped_inputs: Optional[list[AssemblyInputItem]]
+    libraries: Optional[dict[str, LibraryReference]] = None 
     
 
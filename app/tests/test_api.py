@@ -1,9 +1,11 @@
 from fastapi.testclient import TestClient
 import os 
+import json
 import pytest
 import copy
 
 from app.tests.utils import *
+from app.config import CONFIG
 from app.chem.chem_imports import BASE_TEMPLATE
 from app.chem.chem_assembly import (BUILDING_BLOCK_ASSEMBLY_DESCRIPTION, 
                                     REACTION_MECHANISM_DICT,
@@ -39,6 +41,677 @@ def test_eval_template_functional_data(client: TestClient):
     assert response.status_code == 200
     assert response.json() == test_eval_template_results_data
 
+def test_eval_template_functional_formats(client: TestClient):
+    import base64
+    expected_results = [i['result'] for i in test_eval_template_results_data]
+
+    def post(result_format, return_data):
+        response = client.post('eval_template_functional', 
+                                json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                                params={'return_data' : return_data, 'format' : result_format})
+        assert response.status_code == 200
+        assert 'X-Unique-Inputs' in response.headers
+        return response.json()
+
+    output = post('indices', False)
+    assert output == {'format' : 'indices', 'n_inputs' : len(test_smiles), 
+                      'indices' : [i for i, result in enumerate(expected_results) if result]}
+
+    output = post('bitset', False)
+    bits = base64.b64decode(output['bitset'])
+    assert [bool(bits[i // 8] & (1 << (i % 8))) for i in range(output['n_inputs'])] == expected_results
+
+    output = post('columnar', False)
+    assert output == {'format' : 'columnar', 'n_inputs' : len(test_smiles), 'result' : expected_results}
+
+    output = post('columnar', True)
+    assert output['result'] == expected_results
+    assert output['valid_input'] == [i['template_data']['valid_input'] for i in test_eval_template_results_data]
+    assert output['filters']['property_filters']['Molecular Weight'] == {
+        'min_val' : None, 
+        'max_val' : 100.0,
+        'value' : [i['template_data']['property_filters'].get('Molecular Weight', {}).get('value') 
+                   for i in test_eval_template_results_data],
+        'result' : [i['template_data']['property_filters'].get('Molecular Weight', {}).get('result') 
+                    for i in test_eval_template_results_data]
+    }
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                            params={'format' : 'csv'})
+    assert response.status_code == 422
+
+@pytest.mark.parametrize('n_workers', [1, 2])
+def test_eval_template_functional_limit(client: TestClient, monkeypatch, n_workers):
+    monkeypatch.setattr(CONFIG, 'EVAL_WORKERS', n_workers)
+    monkeypatch.setattr(CONFIG, 'EVAL_CHUNKSIZE', 2)
+    inputs = test_smiles * 20
+    expected = [dict(i, input=inputs[j], index=j) for j in range(len(inputs)) 
+                for i in test_eval_template_results_no_data if i['input'] == inputs[j] and i['result']][:3]
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : inputs, 'template_config' : test_eval_template},
+                            params={'return_data' : False, 'limit' : 3})
+    assert response.status_code == 200
+    assert response.json() == expected
+    # evaluation stops after the chunk holding the third pass
+    assert response.headers['X-Inputs-Screened'] == str(expected[-1]['index'] + 1)
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : inputs, 'template_config' : test_eval_template},
+                            params={'return_data' : False, 'limit' : 3, 'format' : 'indices'})
+    assert response.json()['indices'] == [i['index'] for i in expected]
+
+def test_eval_template_functional_sample(client: TestClient):
+    from app.chem.chem_templates import sample_indices
+    inputs = test_smiles * 20
+    indices = sample_indices(len(inputs), 10, 7)
+    expected_results = {i['input'] : i['result'] for i in test_eval_template_results_no_data}
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : inputs, 'template_config' : test_eval_template},
+                            params={'return_data' : False, 'sample_size' : 10, 'seed' : 7})
+    assert response.status_code == 200
+    results = response.json()
+    assert [i['index'] for i in results] == indices
+    assert all(i['input'] == inputs[i['index']] for i in results)
+    assert response.headers['X-Sampled-Inputs'] == '10'
+    pass_rate = sum(expected_results[inputs[i]] for i in indices) / 10
+    assert float(response.headers['X-Pass-Rate']) == pass_rate
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : inputs, 'template_config' : test_eval_template},
+                            params={'sample_size' : 10, 'seed' : 7, 'format' : 'bitset'})
+    assert response.json()['index'] == indices
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : inputs, 'template_config' : test_eval_template},
+                            params={'sample_size' : 10, 'limit' : 3})
+    assert response.status_code == 422
+
+def test_eval_template_functional_worker_pool(client: TestClient, monkeypatch):
+    monkeypatch.setattr(CONFIG, 'EVAL_WORKERS', 2)
+    monkeypatch.setattr(CONFIG, 'EVAL_CHUNKSIZE', 1)
+
+    for return_data, expected in [(False, test_eval_template_results_no_data), 
+                                  (True, test_eval_template_results_data)]:
+        response = client.post('eval_template_functional', 
+                                json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                                params={'return_data':return_data})
+        assert response.status_code == 200
+        assert response.json() == expected
+
+def _exit_chunk(start_index, chunk):
+    os._exit(1)
+
+def _index_chunk(start_index, chunk):
+    return [start_index + i for i in range(len(chunk))]
+
+def test_worker_pool_recovery():
+    from concurrent.futures.process import BrokenProcessPool
+    from app.chem.chem_pool import map_chunks, get_worker_pool
+
+    pool = get_worker_pool(2)
+    with pytest.raises(BrokenProcessPool):
+        map_chunks(_exit_chunk, list(range(4)), (), 2, 1)
+
+    outputs, pooled = map_chunks(_index_chunk, list(range(4)), (), 2, 1)
+    assert pooled
+    assert outputs == [[0], [1], [2], [3]]
+    assert get_worker_pool(2) is not pool
+
+def test_eval_template_functional_duplicates(client: TestClient):
+    # 'CCC' and 'C(C)C' are the same structure
+    inputs = ['CCC', 'C(C)C', 'c', test_smiles[0], 'CCC', 'c']
+    expected = {i['input'] : i for i in test_eval_template_results_data}
+    expected['C(C)C'] = expected['CCC']
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : inputs, 'template_config' : test_eval_template},
+                            params={'return_data':True})
+    assert response.status_code == 200
+    assert response.headers['X-Unique-Inputs'] == '2'
+    results = response.json()
+    assert [i['input'] for i in results] == inputs
+    assert [i['index'] for i in results] == list(range(len(inputs)))
+    assert [i['result'] for i in results] == [expected[i]['result'] for i in inputs]
+    assert [i['template_data'] for i in results] == [expected[i]['template_data'] for i in inputs]
+
+def test_template_cache(client: TestClient):
+    from app.chem import chem_templates
+    chem_templates.TEMPLATE_CACHE.clear()
+
+    renamed_template = copy.deepcopy(test_eval_template)
+    renamed_template['template_name'] = 'renamed'
+
+    # reading the cache stats does not touch the cache
+    stats = []
+    for template_config in [test_eval_template, renamed_template]:
+        response = client.post('eval_template_functional', 
+                                json={'inputs' : test_smiles, 'template_config' : template_config},
+                                params={'return_data':False})
+        assert response.status_code == 200
+        stats.append(client.get('/diagnostics/template_cache').json())
+
+    # the first template is compiled once, the renamed template reuses it
+    assert stats[0]['misses'] == 1
+    assert stats[1]['misses'] == 1
+    assert stats[1]['hits'] > stats[0]['hits']
+    assert stats[1]['size'] == 1
+
+def test_result_cache(client: TestClient, monkeypatch, tmp_path):
+    from app.chem import chem_templates
+    from app.chem.chem_cache import ResultStore
+    store = ResultStore(str(tmp_path/'results.db'), 100)
+    monkeypatch.setattr(chem_templates, 'RESULT_STORE', store)
+    n_valid = len([i for i in test_smiles if i != 'c'])
+
+    for return_data, expected in [(False, test_eval_template_results_no_data), 
+                                  (False, test_eval_template_results_no_data), 
+                                  (True, test_eval_template_results_data), 
+                                  (True, test_eval_template_results_data)]:
+        response = client.post('eval_template_functional', 
+                                json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                                params={'return_data':return_data})
+        assert response.status_code == 200
+        assert response.json() == expected
+
+    # pass/fail rows are hit once, rows without template data miss for `return_data=True`
+    stats = client.get('/diagnostics/result_cache').json()
+    assert stats['enabled']
+    assert stats['size'] == n_valid
+    assert stats['hits'] == 2 * n_valid
+    assert stats['misses'] == 2 * n_valid
+
+    renamed_template = copy.deepcopy(test_eval_template)
+    renamed_template['template_name'] = 'renamed'
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : test_smiles, 'template_config' : renamed_template},
+                            params={'return_data':True})
+    assert all(i['template_data']['template_name'] == 'renamed' for i in response.json())
+
+def test_result_store_eviction(tmp_path):
+    from app.chem.chem_cache import ResultStore
+    store = ResultStore(str(tmp_path/'results.db'), 10)
+
+    store.put_many('a', [(f'C{i}', True, None) for i in range(8)])
+    store.get_many('a', ['C0'])
+    store.put_many('a', [(f'N{i}', False, {'value' : i}) for i in range(4)], ['C0'])
+
+    assert store.size() == 9
+    assert 'C0' in store.get_many('a', ['C0'])
+    assert store.get_many('a', ['N1'], return_data=True)['N1'] == (False, '{"value": 1}')
+
+def test_filter_ordering(client: TestClient, monkeypatch):
+    from app.chem import chem_templates
+    monkeypatch.setattr(chem_templates.CONFIG, 'FILTER_REORDER_INTERVAL', 1)
+    chem_templates.TEMPLATE_CACHE.clear()
+
+    inputs = test_smiles * 4
+    request = {'inputs' : inputs, 'template_config' : test_ordering_template}
+    data_response = client.post('eval_template_functional', json=request, params={'return_data':True})
+    expected = [i['result'] for i in data_response.json()]
+
+    for _ in range(2):
+        response = client.post('eval_template_functional', json=request, params={'return_data':False})
+        assert response.status_code == 200
+        assert [i['result'] for i in response.json()] == expected
+
+    response = client.get('/diagnostics/filter_stats')
+    assert response.status_code == 200
+    stats = response.json()
+    assert len(stats) == 1
+    assert stats[0]['n_evals'] > 0
+    assert sorted(i['name'] for i in stats[0]['filters']) == ['BRENK', 'Heavy Atom Count', 'QED', 'SA Score']
+    assert stats[0]['filters'][0]['name'] == 'Heavy Atom Count'
+
+def test_filter_ordering_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    from app.chem import chem_templates
+
+    chem_templates.TEMPLATE_CACHE.clear()
+    compiled = chem_templates.compile_template(test_ordering_template)
+    inputs = [i for i in test_smiles if i != 'c']
+    n_calls = 8
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: chem_templates.eval_chunk(0, inputs, test_ordering_template), 
+                          range(n_calls)))
+
+    stats = compiled.dump_stats()
+    assert stats['n_evals'] == n_calls * len(inputs)
+    assert sum(i['rejections'] for i in stats['filters']) <= stats['n_evals']
+
+def test_merged_catalog():
+    from app.chem import chem_templates
+    from app.chem.chem_imports import Molecule, FILTER_CATALOGUES, get_mol_context
+
+    smiles = ['S=C1SC(=Cc2ccccc2)C(=O)N1', 'Nc1ccc(N)cc1', 'CCCCCCCCCCCCCCCC(=O)Cl', 'CCC']
+    catalog_names = list(FILTER_CATALOGUES.keys())
+    merged = chem_templates.get_merged_catalog(catalog_names)
+
+    # `PAINS` already holds the `PAINS_A/B/C` entries, so they are not added twice
+    n_entries = sum(FILTER_CATALOGUES[i].GetNumEntries() for i in ['PAINS', 'BRENK', 'NIH', 'ZINC'])
+    assert merged.filter_catalog.GetNumEntries() == n_entries
+    assert chem_templates.get_merged_catalog(catalog_names[::-1]) is merged
+
+    for smile in smiles:
+        molecule = Molecule(smile)
+        hits = merged.match(get_mol_context(molecule))
+        assert hits == {k : v.HasMatch(molecule.mol) for k,v in FILTER_CATALOGUES.items()}
+
+def test_lazy_startup(client: TestClient):
+    import sys
+    import subprocess
+    code = ('from app.chem import chem_imports as c; '
+            'print(any(c.FILTER_CATALOGUES.is_loaded(i) for i in c.FILTER_CATALOGUES), '
+            'c.DESCRIPTOR_MODULES.is_loaded(\'sascorer\'))')
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert output.stdout.split() == ['False', 'False']
+
+    from app.chem.chem_imports import warm_up
+    warm_up(['ZINC', 'sascorer'])
+    response = client.get('/diagnostics/startup')
+    assert response.status_code == 200
+    stats = response.json()
+    assert 'ZINC' in stats['catalogs_loaded']
+    assert 'sascorer' in stats['modules_loaded']
+    assert stats['load_times']['import:chem_imports'] > 0
+
+def test_mol_context_cleared():
+    from app.chem import chem_templates
+    from app.chem.chem_imports import Molecule
+
+    template = chem_templates.compile_template(test_ordering_template).to_template()
+    for early_exit in [True, False]:
+        molecule = Molecule(test_smiles[0])
+        template(molecule, early_exit=early_exit)
+        assert molecule.mol_context is None
+
+def test_property_values_match_prop_funcs(client: TestClient):
+    from app.chem.chem_imports import PROP_FUNCS, to_mol
+
+    template_config = copy.deepcopy(BASE_TEMPLATE)
+    template_config['template_name'] = 'all_properties'
+    template_config['smarts_filters'] = {}
+    for filter_range in template_config['property_filters'].values():
+        filter_range['max_val'] = 1e6
+
+    inputs = ['COC(=O)CCCNC(=O)Nc1cccc(Oc2ccccc2)c1', 'CC(=O)c1ccc(NC(=O)C[*])cc1.CCO']
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : inputs, 'template_config' : template_config},
+                            params={'return_data':True})
+    assert response.status_code == 200
+
+    for item in response.json():
+        mol = to_mol(item['input'])
+        property_data = item['template_data']['property_filters']
+        assert set(property_data.keys()) == set(PROP_FUNCS.keys())
+        for prop_name, prop_func in PROP_FUNCS.items():
+            assert property_data[prop_name]['value'] == pytest.approx(prop_func(mol))
+
+def _single_template_results(template_config, client, return_data):
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : test_smiles, 'template_config' : template_config},
+                            params={'return_data':return_data})
+    return response.json()
+
+def test_eval_templates_functional(client: TestClient):
+    template_configs = [test_eval_template, test_eval_template_update, test_ordering_template]
+
+    for return_data in [False, True]:
+        response = client.post('eval_templates_functional', 
+                                json={'inputs' : test_smiles, 'template_configs' : template_configs},
+                                params={'return_data':return_data})
+        assert response.status_code == 200
+        results = response.json()
+        assert [i['index'] for i in results] == list(range(len(test_smiles)))
+        assert [i['valid_input'] for i in results] == [True, True, False]
+
+        for i, template_config in enumerate(template_configs):
+            expected = _single_template_results(template_config, client, return_data)
+            for result, expected_result in zip(results, expected):
+                assert result['results'][i]['template_name'] == template_config['template_name']
+                assert result['results'][i]['result'] == expected_result['result']
+                assert result['results'][i]['template_data'] == expected_result['template_data']
+
+def _ndjson_request(template_config, inputs):
+    lines = [json.dumps({'template_config' : template_config})] + inputs
+    return ('\n'.join(lines) + '\n').encode()
+
+def test_eval_template_functional_stream(client: TestClient, monkeypatch):
+    monkeypatch.setattr(CONFIG, 'EVAL_CHUNKSIZE', 2)
+
+    for return_data, expected in [(False, test_eval_template_results_no_data), 
+                                  (True, test_eval_template_results_data)]:
+        response = client.post('eval_template_functional_stream', 
+                                content=_ndjson_request(test_eval_template, test_smiles),
+                                params={'return_data':return_data})
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        results = [json.loads(i) for i in response.text.splitlines()]
+        assert results == expected
+
+    response = client.post('eval_template_functional_stream', content=b'CCC\n')
+    assert response.status_code == 422
+
+def test_eval_template_functional_stream_errors(client: TestClient, monkeypatch):
+    from app.chem import chem_templates
+    from app.executor import EVAL_EXECUTOR
+    monkeypatch.setattr(CONFIG, 'EVAL_CHUNKSIZE', 2)
+
+    # lines that are not valid JSON strings or UTF-8 evaluate as invalid inputs
+    content = _ndjson_request(test_eval_template, ['"CCC', 'CCC']) + b'\xff\xfe\n'
+    response = client.post('eval_template_functional_stream', content=content, params={'return_data':False})
+    assert response.status_code == 200
+    results = [json.loads(i) for i in response.text.splitlines()]
+    assert [i['result'] for i in results] == [False, True, False]
+    assert [i['index'] for i in results] == [0, 1, 2]
+
+    # a chunk that fails after the response starts is reported in the stream
+    run_request = chem_templates.run_request
+    def fail_second_chunk(inputs, *args, **kwargs):
+        if 'c' in inputs:
+            raise ValueError('chunk failed')
+        return run_request(inputs, *args, **kwargs)
+
+    monkeypatch.setattr(chem_templates, 'run_request', fail_second_chunk)
+    response = client.post('eval_template_functional_stream', 
+                            content=_ndjson_request(test_eval_template, test_smiles),
+                            params={'return_data':False})
+    assert response.status_code == 200
+    results = [json.loads(i) for i in response.text.splitlines()]
+    assert [i['index'] for i in results[:2]] == [0, 1]
+    assert results[2] == {'error' : 'evaluation failed: ValueError', 'start_index' : 2, 'n_inputs' : 1}
+
+    # capacity is checked before the response starts
+    monkeypatch.setattr(EVAL_EXECUTOR, 'n_pending', EVAL_EXECUTOR.max_workers + EVAL_EXECUTOR.max_queue)
+    response = client.post('eval_template_functional_stream', 
+                            content=_ndjson_request(test_eval_template, test_smiles))
+    assert response.status_code == 429
+
+async def _asgi_post(app, path, body_chunks, spec_version):
+    # drives the app directly so the request body arrives as several messages, 
+    # the way uvicorn (ASGI spec 2.3) delivers large uploads
+    import asyncio
+    messages = [{'type' : 'http.request', 'body' : i, 'more_body' : True} for i in body_chunks]
+    messages.append({'type' : 'http.request', 'body' : b'', 'more_body' : False})
+    response_complete = asyncio.Event()
+    sent = []
+
+    async def receive():
+        if messages:
+            await asyncio.sleep(0)
+            return messages.pop(0)
+        await response_complete.wait()
+        return {'type' : 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        if (message['type'] == 'http.response.body') and (not message.get('more_body', False)):
+            response_complete.set()
+
+    scope = {'type' : 'http', 'asgi' : {'version' : '3.0', 'spec_version' : spec_version}, 
+             'http_version' : '1.1', 'method' : 'POST', 'scheme' : 'http', 'path' : path, 
+             'raw_path' : path.encode(), 'query_string' : b'return_data=false', 'root_path' : '', 
+             'headers' : [(b'content-type', b'application/x-ndjson')], 
+             'client' : ('testclient', 50000), 'server' : ('testserver', 80)}
+
+    await app(scope, receive, send)
+    status = [i for i in sent if i['type'] == 'http.response.start'][0]['status']
+    body = b''.join(i.get('body', b'') for i in sent if i['type'] == 'http.response.body')
+    return status, body
+
+def test_eval_template_functional_stream_chunked_body(monkeypatch):
+    import asyncio
+    from app.main import app
+    monkeypatch.setattr(CONFIG, 'EVAL_CHUNKSIZE', 3)
+
+    inputs = test_smiles * 20
+    body = _ndjson_request(test_eval_template, inputs)
+    body_chunks = [body[i:i+16] for i in range(0, len(body), 16)]
+    expected = [i['result'] for i in test_eval_template_results_no_data] * 20
+
+    for spec_version in ['2.3', '2.4']:
+        status, response_body = asyncio.run(_asgi_post(app, '/eval_template_functional_stream', 
+                                                       body_chunks, spec_version))
+        assert status == 200
+        results = [json.loads(i) for i in response_body.splitlines()]
+        assert [i['index'] for i in results] == list(range(len(inputs)))
+        assert [i['result'] for i in results] == expected
+
+    from app.executor import EVAL_EXECUTOR
+    assert EVAL_EXECUTOR.n_pending == 0
+
+def test_executor_stats(client: TestClient):
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                            params={'return_data':False})
+    assert response.status_code == 200
+
+    response = client.get('/diagnostics/executor')
+    assert response.status_code == 200
+    route_stats = response.json()['eval']['routes']['eval_template_functional']
+    assert route_stats['calls'] >= 1
+    assert route_stats['mean_run_ms'] >= 0
+
+def test_executor_queue_limit():
+    import time
+    import asyncio
+    from fastapi import HTTPException
+    from app.executor import ChemExecutor
+
+    executor = ChemExecutor('thread', 1, 1)
+
+    async def run_calls():
+        calls = [executor.run('sleep', time.sleep, 0.2) for _ in range(3)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(run_calls())
+    executor.shutdown()
+
+    rejected = [i for i in results if isinstance(i, HTTPException)]
+    assert len(rejected) == 1
+    assert rejected[0].status_code == 429
+    assert executor.route_stats['sleep'].calls == 2
+    assert executor.route_stats['sleep'].rejected == 1
+
+def test_executor_process_assembly():
+    import asyncio
+    from app.executor import ChemExecutor
+    from app.chem import chem_assembly
+
+    executor = ChemExecutor('process', 1, 1)
+    results = asyncio.run(executor.run('has_synthon', chem_assembly.has_synthon, test_smiles))
+    executor.shutdown()
+
+    assert results == chem_assembly.has_synthon(test_smiles)
+
+def test_metrics(client: TestClient):
+    from app.metrics import REGISTRY
+    from app.chem import chem_assembly
+    REGISTRY.clear()
+    chem_assembly.SYNTHON_CACHE.clear()
+
+    response = client.post('eval_template_functional', 
+                            json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                            params={'return_data':False})
+    assert response.status_code == 200
+    response = client.post('/building_block/compute_synthons', json={'inputs' : test_smiles})
+    assert response.status_code == 200
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    metrics = response.text
+    assert '# TYPE chem_filter_seconds histogram' in metrics
+    assert 'chem_filter_seconds_count{filter_type="property_filters",name="Molecular Weight"}' in metrics
+    assert f'chem_parse_seconds_count {len(set(test_smiles))}' in metrics
+    assert 'chem_synthon_seconds_count{operation="compute_synthons"}' in metrics
+    assert 'request_queue_seconds_count{executor="eval",route="eval_template_functional"} 1' in metrics
+    assert 'le="+Inf"' in metrics
+
+def test_metrics_worker_merge():
+    from app.chem import chem_templates
+    from app.metrics import REGISTRY, PARSE_SECONDS
+    REGISTRY.clear()
+
+    inputs = [i for i in test_smiles if i != 'c']
+    chem_templates.run_request(inputs, test_eval_template, n_workers=2, chunksize=2)
+    (_, _, count), = PARSE_SECONDS.snapshot().values()
+    assert count == len(set(inputs))
+
+def test_executor_process_metrics():
+    import asyncio
+    from app.executor import ChemExecutor
+    from app.metrics import REGISTRY, SYNTHON_SECONDS
+    from app.chem import chem_assembly
+    REGISTRY.clear()
+
+    chem_assembly.SYNTHON_CACHE.clear()
+
+    executor = ChemExecutor('process', 1, 1)
+    asyncio.run(executor.run('has_synthon', chem_assembly.has_synthon, test_smiles))
+    executor.shutdown()
+
+    _, n_unique = chem_assembly.has_synthon(test_smiles)
+    # the process executor call is merged in, then the local call is added
+    assert SYNTHON_SECONDS.snapshot()[('has_synthon',)][2] == 2 * n_unique
+
+def test_profiling(client: TestClient, monkeypatch, tmp_path):
+    from app.main import app
+    from app.config import CONFIG
+    from app.profiling import ProfileMiddleware
+    monkeypatch.setattr(CONFIG, 'PROFILE_DIR', str(tmp_path))
+    profiled_client = TestClient(ProfileMiddleware(app))
+
+    # requests without the header are not profiled
+    response = profiled_client.post('eval_template_functional', 
+                                    json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                                    params={'return_data':False})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+
+    response = profiled_client.post('eval_template_functional', 
+                                    json={'inputs' : test_smiles, 'template_config' : test_eval_template},
+                                    params={'return_data':False}, headers={'X-Profile' : 'true'})
+    assert response.status_code == 200
+    assert response.json() == test_eval_template_results_no_data
+    profile_id = response.headers['X-Profile-Id']
+
+    response = client.get(f'/diagnostics/profiles/{profile_id}', params={'limit' : 5})
+    assert response.status_code == 200
+    profile = response.json()
+    assert profile['n_calls'] == 1
+    assert profile['calls'][0]['route'] == 'eval_template_functional'
+    top_functions = profile['calls'][0]['top_functions']
+    assert len(top_functions) == 5
+    assert any('run_request' in i['function'] for i in top_functions)
+    assert (tmp_path/f'{profile_id}_0.prof').exists()
+
+    assert profile_id in [i['profile_id'] for i in client.get('/diagnostics/profiles').json()]
+    assert client.get('/diagnostics/profiles/missing').status_code == 404
+
+def test_benchmarks_smoke(tmp_path, monkeypatch):
+    from app.benchmarks import run_benchmarks
+    from app.chem import chem_templates, chem_assembly
+
+    # benchmarks replace the result store and synthon cache, restore them for later tests
+    monkeypatch.setattr(chem_templates, 'RESULT_STORE', chem_templates.RESULT_STORE)
+    monkeypatch.setattr(chem_assembly, 'SYNTHON_CACHE', chem_assembly.SYNTHON_CACHE)
+
+    output = tmp_path/'bench.json'
+    report = run_benchmarks.main(['--size', '20', '--synthon-size', '10', '--bb-size', '4', 
+                                  '--repeats', '1', '--batch-size', '10', '--output', str(output)])
+    assert set(report['results'].keys()) == set(run_benchmarks.BENCHMARKS.keys())
+    assert all(r['n_calls'] >= 1 for r in report['results'].values())
+
+    report = run_benchmarks.main(['--size', '20', '--batch-size', '10', '--only', 'eval_template', 
+                                  '--compare', str(output)])
+    assert set(report['comparison'].keys()) == {'eval_template'}
+
+@pytest.fixture
+def job_runner(monkeypatch, tmp_path):
+    from app import jobs
+    monkeypatch.setattr(CONFIG, 'JOB_STORE_PATH', str(tmp_path/'jobs.db'))
+    monkeypatch.setattr(CONFIG, 'JOB_POLL_INTERVAL', 0.05)
+    monkeypatch.setattr(CONFIG, 'JOB_CHUNKSIZE', 2)
+    jobs.shutdown_job_runner()
+    yield jobs
+    jobs.shutdown_job_runner()
+
+def _wait_for_job(client, job_id, timeout=60):
+    import time
+    start = time.time()
+    while time.time() - start < timeout:
+        job = client.get(f'/jobs/{job_id}').json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(job_id)
+
+def _get_job_results(client, job_id, page_size):
+    results = []
+    while True:
+        response = client.get(f'/jobs/{job_id}/results', params={'skip' : len(results), 'limit' : page_size})
+        assert response.status_code == 200
+        page = response.json()['results']
+        results += page
+        if len(page) < page_size:
+            return results
+
+def test_eval_job(client: TestClient, job_runner):
+    inputs = test_smiles * 3
+    response = client.post('/jobs/eval_template', 
+                           json={'inputs' : inputs, 'template_config' : test_eval_template, 'return_data' : False})
+    assert response.status_code == 200
+    job_id = response.json()['job_id']
+    assert response.json()['n_total'] == len(inputs)
+
+    job = _wait_for_job(client, job_id)
+    assert job['status'] == 'done'
+    assert job['n_processed'] == job['n_results'] == len(inputs)
+    assert job['n_found'] == 3 * sum(i['result'] for i in test_eval_template_results_no_data)
+
+    expected = [dict(test_eval_template_results_no_data[i % len(test_smiles)], index=i) for i in range(len(inputs))]
+    assert _get_job_results(client, job_id, 4) == expected
+    assert job_id in [i['job_id'] for i in client.get('/jobs').json()]
+
+    assert client.delete(f'/jobs/{job_id}').status_code == 200
+    assert client.get(f'/jobs/{job_id}').status_code == 404
+    assert client.get(f'/jobs/{job_id}/results').status_code == 404
+
+def test_assembly_job(client: TestClient, job_runner):
+    response = client.post('/jobs/building_block/2bb_assembly', json=test_2bb_inputs)
+    assert response.status_code == 200
+    job_id = response.json()['job_id']
+
+    job = _wait_for_job(client, job_id)
+    assert job['status'] == 'done'
+    assert job['n_found'] == len(test_2bb_outputs)
+    assert _get_job_results(client, job_id, 1000) == test_2bb_outputs
+
+def test_eval_job_resume(client: TestClient, job_runner):
+    # a job interrupted after its first chunk resumes from the second chunk
+    store = job_runner.JobStore(CONFIG.JOB_STORE_PATH)
+    payload = {'inputs' : test_smiles * 2, 'template_config' : test_eval_template, 'return_data' : False}
+    job_id = store.create('eval_template', payload, len(payload['inputs']))
+    assert store.claim(job_id)
+    stored = [{'stored' : True, 'index' : i} for i in range(2)]
+    store.add_results(job_id, 0, stored, 2, 1)
+    conn = store.connect()
+    with conn:
+        conn.execute('UPDATE jobs SET heartbeat = 0')
+
+    job_runner.get_job_runner()
+    job = _wait_for_job(client, job_id)
+    assert job['status'] == 'done'
+    assert job['n_processed'] == len(payload['inputs'])
+
+    results = _get_job_results(client, job_id, 100)
+    expected = [dict(test_eval_template_results_no_data[i % len(test_smiles)], index=i) 
+                for i in range(len(payload['inputs']))]
+    assert results == stored + expected[2:]
 
 ##### stateful template tests
 
@@ -113,6 +786,22 @@ def test_eval_template_stateful_data(client: TestClient):
 
     _delete_template_helper(template_id, client)
 
+@pytest.mark.skipif(_skip_mongo(), reason="mongodb connection not detected")
+def test_eval_templates_stateful(client: TestClient):
+    template_id = _create_template_helper(test_eval_template, client)
+
+    response = client.post("/eval_templates_stateful",
+                            json={'inputs':test_smiles, 'template_ids':[template_id], 
+                                  'template_configs':[test_eval_template_update]}, 
+                            params={'return_data':True})
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [i['results'][0]['template_data'] for i in results] == [i['template_data'] for i in test_eval_template_results_data]
+    assert [len(i['results']) for i in results] == [2, 2, 2]
+
+    _delete_template_helper(template_id, client)
+
 
 ##### assembly tests
 
@@ -121,6 +810,263 @@ def test_compute_synthon(client: TestClient):
     assert response.status_code == 200
     assert response.json() == test_synthon_output
 
+def test_compute_synthon_duplicates(client: TestClient):
+    smile = test_synthon_input['inputs'][0]
+    inputs = [smile, 'c', smile]
+    response = client.post('/building_block/compute_synthons', json={'inputs' : inputs})
+    assert response.status_code == 200
+    assert response.headers['X-Unique-Inputs'] == '1'
+    results = response.json()
+    assert [i['index'] for i in results] == [0, 1, 2]
+    assert results[0]['synthons'] == results[2]['synthons'] == test_synthon_output[0]['synthons']
+    assert not results[1]['valid_input']
+
+    response = client.post('/building_block/has_synthon', json={'inputs' : inputs})
+    assert response.status_code == 200
+    assert response.headers['X-Unique-Inputs'] == '1'
+    assert [(i['input'], i['index'], i['result']) for i in response.json()] == [(smile, 0, True), ('c', 1, False), 
+                                                                                   (smile, 2, True)]
+
+def test_synthon_cache(client: TestClient, monkeypatch, tmp_path):
+    from app.chem import chem_assembly
+    from app.chem.chem_cache import SynthonCache
+    cache = SynthonCache(100, str(tmp_path/'synthons.db'))
+    monkeypatch.setattr(chem_assembly, 'SYNTHON_CACHE', cache)
+
+    smile = test_synthon_input['inputs'][0]
+    response = client.post('/building_block/compute_synthons', json={'inputs' : [smile, 'c', smile]})
+    assert response.status_code == 200
+    assert response.json()[0]['synthons'] == test_synthon_output[0]['synthons']
+    assert cache.stats()['misses'] == 1
+
+    response = client.post('/building_block/compute_synthons', json={'inputs' : [smile]})
+    assert response.json() == test_synthon_output
+
+    response = client.get('/diagnostics/synthon_cache')
+    assert response.status_code == 200
+    stats = response.json()
+    assert (stats['memory_hits'], stats['store_hits'], stats['misses'], stats['stored']) == (1, 0, 1, 1)
+
+    # a new cache on the same file reads stored synthons instead of recomputing them
+    cache = SynthonCache(100, str(tmp_path/'synthons.db'))
+    monkeypatch.setattr(chem_assembly, 'SYNTHON_CACHE', cache)
+    response = client.post('/building_block/compute_synthons', json={'inputs' : [smile]})
+    assert response.json() == test_synthon_output
+    assert (cache.stats()['store_hits'], cache.stats()['misses']) == (1, 0)
+
+def test_synthon_worker_pool(client: TestClient, monkeypatch):
+    from app.chem import chem_assembly
+    from app.chem.chem_cache import SynthonCache
+    monkeypatch.setattr(chem_assembly, 'SYNTHON_CACHE', SynthonCache(0))
+    monkeypatch.setattr(CONFIG, 'EVAL_WORKERS', 2)
+    monkeypatch.setattr(CONFIG, 'SYNTHON_CHUNKSIZE', 1)
+
+    inputs = test_smiles + test_synthon_input['inputs']
+    for route, func in [('compute_synthons', chem_assembly.compute_synthons), 
+                        ('has_synthon', chem_assembly.has_synthon)]:
+        response = client.post(f'/building_block/{route}', json={'inputs' : inputs})
+        assert response.status_code == 200
+        results, n_unique = func(inputs)
+        assert response.json() == results
+        assert response.headers['X-Unique-Inputs'] == str(n_unique)
+
+def test_reaction_index():
+    from chem_templates.assembly import make_assemblies
+    from app.chem import chem_assembly, chem_index
+    from app.benchmarks import corpus
+
+    pool1 = chem_assembly.process_inputs(corpus.to_inputs(corpus.building_blocks(30, seed=0), 'bb1'), 'synthon')
+    pool2 = chem_assembly.process_inputs(corpus.to_inputs(corpus.building_blocks(30, seed=1), 'bb2'), 'synthon')
+    pair_key = lambda x: (id(x[0]), id(x[1]), tuple(sorted(id(i) for i in x[2])))
+    for mechanisms in [REACTION_MECHANISM_DICT, {'N-acylation' : True}]:
+        rxn_universe = chem_assembly.config_to_rxn_universe(mechanisms)
+        expected = list(make_assemblies(pool1, pool2, rxn_universe, 50))
+        chunks = list(chem_index.indexed_assemblies(pool1, pool2, rxn_universe, 50))
+        # the index visits compatible marks in sorted order, so only the order of pairs can differ
+        assert [len(i) for i in chunks] == [len(i) for i in expected]
+        assert sorted(map(pair_key, sum(chunks, []))) == sorted(map(pair_key, sum(expected, [])))
+        assert sum(len(i) for i in expected) > 50
+
+        pairs = list(chem_index.indexed_pairs(pool1, pool2, rxn_universe))
+        for start in [0, 7, len(pairs) // 2, len(pairs)]:
+            assert list(chem_index.indexed_pairs(pool1, pool2, rxn_universe, start=start)) == pairs[start:]
+
+def page_assembly(client, route, inputs, params):
+    'follows assembly cursors until enumeration is complete, returns the results of every page'
+    pages = []
+    cursor = None
+    while True:
+        url = f'{route}?{params}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.post(url, json=inputs)
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get('X-Assembly-Cursor')
+        if cursor is None:
+            return pages
+
+def test_assembly_budget(client: TestClient):
+    from app.benchmarks import corpus
+
+    inputs = copy.deepcopy(test_2bb_inputs)
+    inputs['building_block_1']['inputs'] = corpus.to_inputs(corpus.building_blocks(20, seed=0), 'bb1')
+    inputs['building_block_2']['inputs'] = corpus.to_inputs(corpus.building_blocks(20, seed=1), 'bb2')
+
+    response = client.post('/building_block/2bb_assembly', json=inputs)
+    full = response.json()
+    n_combinations = int(response.headers['X-Combinations-Attempted'])
+    assert 'X-Assembly-Cursor' not in response.headers
+    assert n_combinations > 20
+
+    response = client.post('/building_block/2bb_assembly?max_combinations=7&batch_size=3', json=inputs)
+    assert response.headers['X-Combinations-Attempted'] == '7'
+    assert int(response.headers['X-Products-Found']) >= len(response.json())
+
+    # pages cover every combination once, products can repeat between pages
+    pages = page_assembly(client, '/building_block/2bb_assembly', inputs, 'max_combinations=7&batch_size=3')
+    assert len(pages) == -(-n_combinations // 7)
+    assert {i['result'] for page in pages for i in page} == {i['result'] for i in full}
+
+    response = client.post('/building_block/2bb_assembly?max_products=1&batch_size=5', json=inputs)
+    assert response.headers['X-Combinations-Attempted'] == '5'
+    cursor = response.headers['X-Assembly-Cursor']
+
+    other_inputs = copy.deepcopy(inputs)
+    other_inputs['building_block_2']['inputs'] = other_inputs['building_block_2']['inputs'][1:]
+    response = client.post(f'/building_block/2bb_assembly?cursor={cursor}', json=other_inputs)
+    assert response.status_code == 422
+    response = client.post('/building_block/2bb_assembly?cursor=not-a-cursor', json=inputs)
+    assert response.status_code == 422
+
+    frag_full = client.post('/fragment/custom_assembly', json=test_custom_frag_inputs).json()
+    pages = page_assembly(client, '/fragment/custom_assembly', test_custom_frag_inputs, 'max_combinations=1')
+    assert {i['result'] for page in pages for i in page} == {i['result'] for i in frag_full}
+
+def test_assembly_sample(client: TestClient, monkeypatch):
+    from app.benchmarks import corpus
+    from app.chem import chem_index
+
+    inputs = copy.deepcopy(test_2bb_inputs)
+    inputs['building_block_1']['inputs'] = corpus.to_inputs(corpus.building_blocks(20, seed=0), 'bb1')
+    inputs['building_block_2']['inputs'] = corpus.to_inputs(corpus.building_blocks(20, seed=1), 'bb2')
+
+    response = client.post('/building_block/2bb_assembly', json=inputs)
+    full = {i['result'] for i in response.json()}
+    n_combinations = int(response.headers['X-Combinations-Attempted'])
+    assert 'X-Combination-Space' not in response.headers
+
+    response = client.post('/building_block/2bb_assembly?sample=5&seed=3&batch_size=4&sort=false', json=inputs)
+    sample = response.json()
+    assert len(sample) == 5
+    assert {i['result'] for i in sample} <= full
+    assert int(response.headers['X-Combination-Space']) == n_combinations
+    assert int(response.headers['X-Combinations-Attempted']) < n_combinations
+    assert float(response.headers['X-Product-Yield']) == pytest.approx(int(response.headers['X-Products-Found']) 
+                                                                      / int(response.headers['X-Combinations-Attempted']), abs=1e-6)
+    response = client.post('/building_block/2bb_assembly?sample=5&seed=3&batch_size=4&sort=false', json=inputs)
+    assert response.json() == sample
+
+    # cursors continue the same sample, pages together draw every combination once
+    pages = page_assembly(client, '/building_block/2bb_assembly', inputs, 'sample=1000000&seed=3&max_combinations=50')
+    assert {i['result'] for page in pages for i in page} == full
+    response = client.post('/building_block/2bb_assembly?sample=1000000&seed=3&max_combinations=50', json=inputs)
+    cursor = response.headers['X-Assembly-Cursor']
+    response = client.post(f'/building_block/2bb_assembly?sample=1000000&seed=4&cursor={cursor}', json=inputs)
+    assert response.status_code == 422
+
+    response = client.post('/fragment/custom_assembly?sample=1000000&seed=1', json=test_custom_frag_inputs)
+    frag_full = client.post('/fragment/custom_assembly', json=test_custom_frag_inputs).json()
+    assert [i['result'] for i in response.json()] == [i['result'] for i in frag_full]
+    assert response.headers['X-Combination-Space'] == response.headers['X-Combinations-Attempted']
+
+    # large spaces are drawn without storing every position
+    monkeypatch.setattr(chem_index, 'SHUFFLE_LIMIT', 10)
+    assert sorted(chem_index.random_positions(50, 1)) == list(range(50))
+    assert list(chem_index.random_positions(50, 1)) != list(range(50))
+
+def test_assembly_stream(client: TestClient, monkeypatch):
+    from app.benchmarks import corpus
+    from app.executor import ChemExecutor
+    from app.crud import crud_assembly
+    from app.chem.chem_cache import BoundedHashSet
+
+    hashes = BoundedHashSet(2)
+    assert [hashes.add(i) for i in ['a', 'b', 'a', 'c', 'a']] == [True, True, False, True, True]
+    assert len(hashes) == 2
+
+    inputs = copy.deepcopy(test_2bb_inputs)
+    inputs['building_block_1']['inputs'] = corpus.to_inputs(corpus.building_blocks(20, seed=0), 'bb1')
+    inputs['building_block_2']['inputs'] = corpus.to_inputs(corpus.building_blocks(20, seed=1), 'bb2')
+    full = client.post('/building_block/2bb_assembly', json=inputs).json()
+
+    unsorted = client.post('/building_block/2bb_assembly?sort=false', json=inputs).json()
+    assert sorted(unsorted, key=lambda x: x['result']) == full
+
+    response = client.post('/building_block/2bb_assembly_stream?batch_size=10', json=inputs)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    results = [json.loads(i) for i in response.text.splitlines()]
+    assert sorted(results, key=lambda x: x['result']) == full
+
+    # process executors stream each batch as a separate page
+    executor = ChemExecutor('process', 1, 1)
+    monkeypatch.setattr(crud_assembly, 'ASSEMBLY_EXECUTOR', executor)
+    try:
+        response = client.post('/building_block/2bb_assembly_stream?batch_size=100', json=inputs)
+    finally:
+        executor.shutdown()
+    results = [json.loads(i) for i in response.text.splitlines()]
+    assert sorted(results, key=lambda x: x['result']) == full
+
+    response = client.post('/fragment/custom_assembly_stream', json=test_custom_frag_inputs)
+    assert [json.loads(i) for i in response.text.splitlines()] == test_custom_frag_outputs
+
+def test_sharded_assembly(monkeypatch):
+    import argparse
+    from app.chem import chem_assembly
+    from app.benchmarks import run_benchmarks
+
+    monkeypatch.setattr(CONFIG, 'ASSEMBLY_MIN_SHARD_SIZE', 2)
+    map_chunks = chem_assembly.map_chunks
+    chunk_funcs = []
+    monkeypatch.setattr(chem_assembly, 'map_chunks', lambda func, *args: chunk_funcs.append(func) or map_chunks(func, *args))
+
+    args = argparse.Namespace(bb_size=12, seed=0)
+    for assemble_func, make_inputs in [(chem_assembly.assemble_2bbs, run_benchmarks.assembly_inputs_2bb),
+                                       (chem_assembly.assemble_3bbs, run_benchmarks.assembly_inputs_3bb),
+                                       (lambda *a, **kw: chem_assembly.assemble_inputs(*a, 'fragment', **kw), 
+                                        run_benchmarks.assembly_inputs_fragment)]:
+        expected = assemble_func(make_inputs(args))
+        budget = chem_assembly.assembly_budget()
+        assert assemble_func(make_inputs(args), n_workers=2, budget=budget) == expected
+        assert expected and (budget.n_products >= len(expected))
+    assert chunk_funcs.count(chem_assembly.assembly_shard_chunk) == 3
+
+    # runs with a combination limit are enumerated in one process so they can be resumed
+    budget = chem_assembly.assembly_budget(max_combinations=5)
+    chem_assembly.assemble_2bbs(run_benchmarks.assembly_inputs_2bb(args), n_workers=2, budget=budget)
+    assert (budget.n_combinations, budget.next_position) == (5, 5)
+
+def test_assembly_schema_cache(client: TestClient, monkeypatch):
+    from app.chem import chem_assembly
+    from app.chem.chem_cache import LRUCache
+    monkeypatch.setattr(chem_assembly, 'ASSEMBLY_SCHEMA_CACHE', LRUCache(10))
+    monkeypatch.setattr(chem_assembly, 'RXN_UNIVERSE_CACHE', LRUCache(10))
+
+    expected = client.post('/building_block/custom_assembly', json=test_custom_bb_inputs).json()
+    assert client.post('/building_block/custom_assembly', json=test_custom_bb_inputs).json() == expected
+
+    response = client.get('/diagnostics/assembly_cache')
+    assert response.status_code == 200
+    stats = response.json()
+    assert (stats['assembly_schemas']['hits'], stats['assembly_schemas']['misses']) == (1, 1)
+    assert stats['rxn_universes']['misses'] >= 1
+
+    # universes are shared by every mechanism dict with the same enabled mechanisms
+    mechanisms = {k : True for k in list(chem_assembly.REACTION_GROUP_DICT.keys())[:3]}
+    rxn_universe = chem_assembly.config_to_rxn_universe(mechanisms)
+    reordered = dict(reversed(list(mechanisms.items())), unused=False)
+    assert chem_assembly.config_to_rxn_universe(reordered) is rxn_universe
+
 def test_bb_description(client: TestClient):
     response = client.get('/building_block/description')
     assert response.status_code == 200
@@ -164,6 +1110,77 @@ def test_bb_custom_assembly(client: TestClient):
     assert response.status_code == 200
     assert response.json() == test_custom_bb_outputs_unmapped
 
+@pytest.fixture
+def library_registry(monkeypatch, tmp_path):
+    from app.chem import chem_assembly
+    from app.chem.chem_library import LibraryRegistry
+    registry = LibraryRegistry(str(tmp_path/'libraries.db'), 4)
+    monkeypatch.setattr(chem_assembly, 'LIBRARIES', registry)
+    return registry
+
+def test_bb_library_assembly(client: TestClient, library_registry, monkeypatch, tmp_path):
+    from app.chem import chem_assembly
+    from app.chem.chem_library import LibraryRegistry
+
+    bb2_inputs = test_2bb_inputs['building_block_2']['inputs']
+    response = client.post('/building_block/libraries', json={'name' : 'bb2', 'inputs' : bb2_inputs + bb2_inputs[:1]})
+    assert response.status_code == 200
+    info = response.json()
+    assert (info['name'], info['n_inputs'], info['n_molecules']) == ('bb2', 3, 2)
+    library_id = info['library_id']
+
+    assert client.get(f'/building_block/libraries/{library_id}').json() == info
+    assert client.get('/building_block/libraries').json() == [info]
+
+    inputs = copy.deepcopy(test_2bb_inputs)
+    inputs['building_block_2']['inputs'] = []
+    inputs['building_block_2']['library'] = {'library_id' : library_id}
+    response = client.post('/building_block/2bb_assembly', json=inputs)
+    assert response.status_code == 200
+    assert response.json() == test_2bb_outputs
+
+    # libraries are loaded from the store by other processes or after a restart
+    monkeypatch.setattr(chem_assembly, 'LIBRARIES', LibraryRegistry(library_registry.path, 4))
+    response = client.post('/building_block/2bb_assembly', json=inputs)
+    assert response.json() == test_2bb_outputs
+
+    inputs['building_block_2']['library']['data'] = {'ID' : 'EN300-110252'}
+    response = client.post('/building_block/2bb_assembly', json=inputs)
+    assert response.json() == []
+
+    custom_inputs = copy.deepcopy(test_custom_frag_inputs)
+    custom_inputs['libraries'] = {'R1' : {'library_id' : library_id}}
+    response = client.post('/fragment/custom_assembly', json=custom_inputs)
+    assert response.status_code == 422
+
+    assert client.delete(f'/building_block/libraries/{library_id}').status_code == 200
+    response = client.post('/building_block/2bb_assembly', json=inputs)
+    assert response.status_code == 404
+
+def test_bb_library_load(client: TestClient, library_registry, monkeypatch, tmp_path):
+    bb2_inputs = test_2bb_inputs['building_block_2']['inputs']
+    (tmp_path/'bb2.smi').write_text('\n'.join(f"{i['input']} {i['data']['ID']}" for i in bb2_inputs))
+
+    response = client.post('/building_block/libraries/load', json={'name' : 'bb2', 'path' : 'bb2.smi'})
+    assert response.status_code == 403
+
+    monkeypatch.setattr(CONFIG, 'LIBRARY_DIR', str(tmp_path))
+    response = client.post('/building_block/libraries/load', json={'name' : 'bb2', 'path' : '../bb2.smi'})
+    assert response.status_code == 403
+    response = client.post('/building_block/libraries/load', json={'name' : 'bb2', 'path' : 'missing.smi'})
+    assert response.status_code == 404
+
+    response = client.post('/building_block/libraries/load', json={'name' : 'bb2', 'path' : 'bb2.smi'})
+    assert response.status_code == 200
+    library_id = response.json()['library_id']
+
+    inputs = copy.deepcopy(test_2bb_inputs)
+    inputs['building_block_2'] = {'template_config' : bb2_template, 'library' : {'library_id' : library_id}}
+    response = client.post('/building_block/2bb_assembly', json=inputs)
+    outputs = copy.deepcopy(test_2bb_outputs)
+    outputs[0]['assembly_data']['parents'][1]['data'] = {'id' : 'EN300-25308976'}
+    assert response.json() == outputs
+
 def test_fragment_description(client: TestClient):
     response = client.get('/fragment/description')
     assert response.status_code == 200
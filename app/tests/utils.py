@@ -47,6 +47,15 @@ test_eval_template_update = {
                     'smarts_filters': {}
                     }
 
+test_ordering_template = {
+                    'template_name': 'ordering',
+                    'property_filters': {'SA Score': {'min_val': None, 'max_val': 10},
+                                         'QED': {'min_val': 0.0, 'max_val': None},
+                                         'Heavy Atom Count': {'min_val': None, 'max_val': 3}},
+                    'catalog_filters': {'BRENK': {'include': True}},
+                    'smarts_filters': {}
+                    }
+
 test_smiles = test_smiles = ['COC(=O)CCCNC(=O)Nc1cccc(Oc2ccccc2)c1', 'CCC', 'c']
 
 test_eval_template_results_no_data = [{'input': 'COC(=O)CCCNC(=O)Nc1cccc(Oc2ccccc2)c1',